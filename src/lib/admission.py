@@ -0,0 +1,118 @@
+import heapq
+import itertools
+import threading
+
+# Control de admisión del servidor: a lo sumo max_active transferencias a la
+# vez. Los saludos que llegan con el servidor lleno esperan en una cola
+# acotada y, si también está llena, se contestan con BUSY:<segundos> (ver
+# lib/handshake.py) para que el cliente vuelva cuando probablemente haya lugar.
+'''LIMITES'''
+DEFAULT_MAX_TRANSFERS = 32
+DEFAULT_QUEUE_SIZE = 64
+'''POLITICAS'''
+FIFO = "fifo"
+SJF = "sjf"  # el archivo más chico primero, por el tamaño del saludo
+POLICIES = (FIFO, SJF)
+'''DECISIONES'''
+START = "start"
+QUEUED = "queued"
+BUSY = "busy"
+'''ESPERA SUGERIDA'''
+# Duración supuesta de una transferencia hasta medir alguna
+INITIAL_DURATION = 1.0
+# Peso de cada transferencia en el promedio móvil de la duración
+DURATION_GAIN = 1 / 8
+MIN_RETRY_AFTER = 0.5
+MAX_RETRY_AFTER = 30.0
+
+
+def from_args(args):
+    """Control de admisión según --max-transfers, --queue-size y --schedule. None si se desactivó con 0"""
+    max_active = getattr(args, "max_transfers", None)
+    if max_active is None:
+        max_active = DEFAULT_MAX_TRANSFERS
+    if max_active <= 0:
+        return None
+    queue_size = getattr(args, "queue_size", None)
+    if queue_size is None:
+        queue_size = DEFAULT_QUEUE_SIZE
+    return Admission(max_active, max(queue_size, 0), getattr(args, "schedule", None) or FIFO)
+
+
+class Admission:
+    """Lugares para transferencias y cola de saludos en espera, compartidos por los hilos.
+
+    Un trabajo es lo que el servidor necesita para atender un saludo; la cola
+    lo devuelve en finish(), cuando se libera el lugar de otra transferencia.
+    Con SJF una transferencia grande puede esperar mientras sigan llegando
+    chicas: la cola es acotada y el cliente deja de reintentar su saludo.
+    """
+
+    def __init__(self, max_active, queue_size, policy=FIFO):
+        self.max_active = max_active
+        self.queue_size = queue_size
+        self.policy = policy
+        self.lock = threading.Lock()
+        self.active = 0
+        self.pending = []  # heap de (prioridad, orden de llegada, dirección, trabajo)
+        self.queued = set()  # direcciones con un saludo en la cola
+        self.order = itertools.count()
+        # Promedio móvil de la duración de las transferencias, para el BUSY
+        self.duration = INITIAL_DURATION
+        self.busy = 0
+
+    @property
+    def sized(self):
+        """La política ordena por tamaño: el servidor tiene que averiguarlo al encolar"""
+        return self.policy == SJF
+
+    def submit(self, addr, size, job):
+        """Admite el saludo de addr: START si job ocupa un lugar ya, QUEUED si
+        quedó (o ya estaba) en la cola, BUSY si no entra ni en la cola"""
+        with self.lock:
+            if addr in self.queued:
+                # Retransmisión de un saludo que ya espera
+                return QUEUED
+            if self.active < self.max_active:
+                self.active += 1
+                return START
+            if len(self.pending) >= self.queue_size:
+                self.busy += 1
+                return BUSY
+            priority = size if self.policy == SJF else 0
+            heapq.heappush(self.pending, (priority, next(self.order), addr, job))
+            self.queued.add(addr)
+            return QUEUED
+
+    def finish(self, duration=None):
+        """Libera el lugar de una transferencia que tardó duration segundos (None:
+        no llegó a transferir). Devuelve el próximo trabajo de la cola, que se
+        queda con el lugar, o None"""
+        with self.lock:
+            if duration is not None:
+                self.duration += DURATION_GAIN * (duration - self.duration)
+            if not self.pending:
+                self.active -= 1
+                return None
+            _, _, addr, job = heapq.heappop(self.pending)
+            self.queued.discard(addr)
+            return job
+
+    def close(self):
+        """Descarta la cola (el servidor se cierra): los lugares ya no pasan a otro saludo.
+        Devuelve cuántos saludos se descartaron"""
+        with self.lock:
+            dropped = len(self.pending)
+            self.pending.clear()
+            self.queued.clear()
+        return dropped
+
+    def retry_after(self):
+        """Segundos que se sugieren en un BUSY: lo que tarda en vaciarse la cola"""
+        with self.lock:
+            wait = self.duration * (1 + len(self.pending) / self.max_active)
+        return min(max(wait, MIN_RETRY_AFTER), MAX_RETRY_AFTER)
+
+    def stats(self):
+        with self.lock:
+            return {"active": self.active, "queued": len(self.pending), "busy": self.busy}
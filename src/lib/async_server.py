@@ -0,0 +1,478 @@
+import asyncio
+import logging
+import random
+import socket
+import time
+
+from lib import admission, batch, file_cache, handshake, metrics, packet, path_mtu, storage, trace
+from lib.base_protocol import FinReceiver, FinSender
+from lib.batch_io import SENDMSG
+from lib.protocols import PROTOCOLS
+from lib.srv_protocol import ClientMessages, Messages, ServerStorage
+from lib.selective_repeat_protocol import RECEIVER_IDLE_TIMEOUT
+from lib.stop_and_wait_protocol import SERVER_TIMEOUT, StopAndWaitProtocol
+
+'''TIEMPOS'''
+QUIT_POLL = 1.0
+'''IDS DE CONEXION'''
+MAX_CONN_ID = 0xFFFFFFFF
+
+class Session:
+    """Una transferencia servida desde el socket principal"""
+
+    def __init__(self, conn_id, addr, handler, response):
+        self.conn_id = conn_id
+        # Se actualiza con cada paquete: el cliente puede cambiar de puerto (NAT)
+        self.addr = addr
+        self.handler = handler
+        self.response = response
+        self.queue = asyncio.Queue()
+        self.task = None
+        # FIN que cerró la recepción, para contestarlo con el FIN-ACK
+        self.fin = None
+
+    async def receive(self, timeout):
+        """Próximo paquete de la sesión o None si vence el timeout"""
+        # Con métricas, la espera cuenta como tiempo de red hasta el cierre (ver lib/metrics.py)
+        stats = self.handler.stats
+        start = stats.clock() if stats is not None and stats.stopped is None else None
+        try:
+            return await asyncio.wait_for(self.queue.get(), max(timeout, 0))
+        except asyncio.TimeoutError:
+            return None
+        finally:
+            if start is not None:
+                stats.network_time += stats.clock() - start
+
+    async def receive_all(self, timeout):
+        """Paquetes encolados de la sesión, esperando el primero hasta timeout ([] si vence)"""
+        pkt = await self.receive(timeout)
+        if pkt is None:
+            return []
+        pkts = [pkt]
+        while not self.queue.empty():
+            pkts.append(self.queue.get_nowait())
+        return pkts
+
+
+class AsyncServer(asyncio.DatagramProtocol):
+    """Servidor de un solo socket: demultiplexa las sesiones por id de conexión.
+
+    Los saludos de texto abren sesiones y cada paquete binario se entrega a la
+    cola de la sesión cuyo id lleva en el header. Stop-and-Wait y Selective
+    Repeat corren como corrutinas sobre esas colas, sin hilos ni sockets
+    temporales.
+    """
+
+    def __init__(self, args, sock, recorder=None):
+        self.args = args
+        # Storage de los archivos, compartido con lib/srv_protocol.py
+        self.store = ServerStorage(args)
+        # Socket del transporte, para enviar datos con sendmsg sin copiarlos
+        self.socket = sock
+        self.transport = None
+        # Mapeos de los archivos más descargados, compartidos por las sesiones
+        self.file_cache = file_cache.from_args(args)
+        # Tope de sesiones a la vez y cola de saludos (None: sin tope)
+        self.admission = admission.from_args(args)
+        # Agregados para /metrics (None si no se pidió --metrics-port)
+        self.metrics = metrics.from_args(args, self.file_cache, self.admission)
+        self.port = None
+        # Registro de paquetes (ver lib/trace.py); None si no se pidió --trace
+        self.recorder = recorder
+        self.local = None
+        self.sessions = {}  # {conn_id: Session}
+        self.handshakes = {}  # {addr: Session} para reenviar la respuesta
+        # Saludos cuya sesión se está abriendo (buscando o hasheando el archivo en un hilo)
+        self.opening = set()
+
+    def connection_made(self, transport):
+        self.transport = transport
+        self.port = transport.get_extra_info("sockname")[1]
+        if self.recorder is not None:
+            self.local = (self.recorder.address(self.args.host), self.port)
+
+    def datagram_received(self, data, addr):
+        if self.recorder is not None:
+            self.recorder.record(time.monotonic(), trace.IN, self.local, addr, data, len(data))
+        if data[:1].isalpha():
+            self._handle_handshake(data, addr)
+            return
+        try:
+            pkt = packet.unpack(data)
+        except ValueError:
+            return
+        if pkt.type == packet.PROBE:
+            path_mtu.answer_probe(self.transport, data, addr)
+            return
+        session = self.sessions.get(pkt.conn_id)
+        if session is None:
+            logging.debug(f"SERVIDOR: Paquete de {addr} para conexión desconocida {pkt.conn_id}")
+            return
+        session.addr = addr
+        session.queue.put_nowait(pkt)
+
+    def error_received(self, exc):
+        logging.debug(f"SERVIDOR: Error de socket: {exc}")
+
+    def _handle_handshake(self, data, addr):
+        """Abre una sesión para un saludo UPLOAD_CLIENT o DOWNLOAD_CLIENT"""
+        session = self.handshakes.get(addr)
+        if session is not None:
+            logging.debug(f"Saludo duplicado de {addr}, reenviando {session.response}")
+            self.transport.sendto(session.response, addr)
+            return
+        if addr in self.opening:
+            logging.debug(f"Saludo duplicado de {addr}, la sesión se está abriendo")
+            return
+        try:
+            message = data.decode()
+            if message.startswith(ClientMessages.UPLOAD_CLIENT + handshake.SEPARATOR):
+                # Formato: "UPLOAD_CLIENT:protocol:filename:filesize[:opciones]"
+                fields, options = handshake.parse_message(message, 4)
+                logging.info(f"SERVIDOR-MAIN: Saludo de UPLOAD recibido de {addr}")
+                filesize = int(fields[3])
+                self._admit(addr, filesize, self._open_upload, addr, fields[1], fields[2], filesize, options)
+            elif message.startswith(ClientMessages.DOWNLOAD_CLIENT + handshake.SEPARATOR):
+                # Formato: "DOWNLOAD_CLIENT:protocol:filename[:opciones]"
+                fields, options = handshake.parse_message(message, 3)
+                logging.info(f"SERVIDOR-MAIN: Saludo de DOWNLOAD recibido de {addr}")
+                size = self.store.queued_size(self.admission, fields[2], options)
+                self._admit(addr, size, self._open_download, addr, fields[1], fields[2], options)
+            else:
+                logging.warning(f"SERVIDOR-MAIN: Paquete de saludo inválido de {addr}. Ignorando.")
+        except (UnicodeDecodeError, ValueError) as e:
+            logging.error(f"SERVIDOR-MAIN: Paquete corrupto de {addr}:{e}. Ignorando.")
+
+    def _admit(self, addr, size, opener, *args):
+        """Abre la sesión del saludo, lo encola si el servidor está lleno o contesta BUSY"""
+        if self.admission is None:
+            self._start((opener, args))
+            return
+        decision = self.admission.submit(addr, size, (opener, args))
+        if decision == admission.START:
+            self._start((opener, args))
+        elif decision == admission.BUSY:
+            retry_after = self.admission.retry_after()
+            logging.warning(f"SERVIDOR-MAIN: Servidor lleno, {addr} tiene que volver en {retry_after:.2f}s")
+            self.transport.sendto(handshake.busy_message(retry_after).encode(), addr)
+        else:
+            logging.info(f"SERVIDOR-MAIN: Servidor lleno, saludo de {addr} en cola")
+
+    def _start(self, job):
+        """Abre en una tarea la sesión de un saludo con lugar"""
+        if job is not None:
+            asyncio.ensure_future(self._open(job))
+
+    async def _open(self, job):
+        """Corre el opener de un saludo. Si no abrió la sesión (error, contenido
+        deduplicado), el lugar pasa al siguiente de la cola"""
+        while job is not None:
+            opener, args = job
+            addr = args[0]
+            self.opening.add(addr)
+            try:
+                if await opener(*args) is not None:
+                    return
+            except Exception as e:
+                logging.critical(f"Error fatal al abrir la sesión de {addr}: {e}")
+            finally:
+                self.opening.discard(addr)
+            if self.admission is None:
+                return
+            job = self.admission.finish()
+
+    def _negotiate(self, addr, protocol, options):
+        """Opciones de la sesión con un id de conexión libre, o None si se rechaza"""
+        if protocol not in PROTOCOLS:
+            logging.warning(f"SERVIDOR: Protocolo no soportado de {addr}: {protocol}")
+            self.transport.sendto(Messages.ERROR_INVALID_FORMAT, addr)
+            return None
+        accepted = handshake.negotiate_options(options, self.args)
+        if accepted is None:
+            logging.warning(f"SERVIDOR: {addr} no ofrece una versión de formato soportada. Rechazando.")
+            self.transport.sendto(Messages.ERROR_UNSUPPORTED_VERSION, addr)
+            return None
+        # Ids aleatorios: un paquete atrasado de una sesión vieja no cae en una nueva
+        conn_id = random.randint(1, MAX_CONN_ID)
+        while conn_id in self.sessions:
+            conn_id = random.randint(1, MAX_CONN_ID)
+        accepted[handshake.OPT_CONN_ID] = conn_id
+        return accepted
+
+    async def _deduplicate(self, addr, filename, accepted):
+        """Si el storage ya tiene el contenido, publica filename y responde sin recibir datos"""
+        digest = accepted.get(handshake.OPT_DIGEST)
+        if digest is None:
+            return False
+        link = self.store.digest_index().link
+        if not await asyncio.get_running_loop().run_in_executor(None, link, digest, filename):
+            return False
+        self._invalidate(filename)
+        accepted[handshake.OPT_DEDUP] = 1
+        response = handshake.format_message("UPLOAD_OK", self.port, options=accepted)
+        self.transport.sendto(response.encode(), addr)
+        logging.info(f"SERVIDOR: '{filename}' ya estaba en el storage (sha256 {digest[:12]}...), subida de {addr} completada sin datos")
+        return True
+
+    def _invalidate(self, filename):
+        """Una subida reemplazó filename: su mapeo en caché ya no sirve"""
+        if self.file_cache is not None:
+            self.file_cache.invalidate(self.store.file_path(filename))
+
+    def _open_session(self, addr, handler, response, transfer):
+        session = Session(handler.conn_id, addr, handler, response.encode())
+        self.sessions[session.conn_id] = session
+        self.handshakes[addr] = session
+        self.transport.sendto(session.response, addr)
+        logging.info(f"SERVIDOR: Sesión {session.conn_id} para {addr}: {response}")
+        session.task = asyncio.ensure_future(self._run(session, addr, transfer))
+        return session
+
+    async def _open_upload(self, addr, protocol, filename, filesize, options):
+        accepted = self._negotiate(addr, protocol, options)
+        if accepted is None or await self._deduplicate(addr, filename, accepted):
+            return
+        if not self.store.negotiate_part(self.transport.sendto, addr, options, accepted, filename, filesize, True):
+            return
+        handler = PROTOCOLS[protocol](self.args, None, accepted)
+        # Un lote invalida en la caché cada archivo que publica
+        handler.file_cache = self.file_cache
+        handler.stats = metrics.for_transfer(self.args, "upload", protocol, filename, addr, self.metrics, "server")
+        response = handshake.format_message("UPLOAD_OK", self.port, options=accepted)
+        return self._open_session(addr, handler, response,
+                           lambda session: self._receive_upload(session, filename, filesize))
+
+    def _locate(self, filename, batched):
+        """(entradas del lote, tamaño, digest) de una descarga. Puede hashear
+        archivos enteros: corre en un hilo, fuera del event loop"""
+        if batched:
+            # Lote: filename es una lista de nombres o patrones
+            entries = batch.match(self.store.path, filename)
+            return entries, batch.stream_length(entries) if entries else None, None
+        filesize = storage.file_size(self.store.file_path(filename))
+        if filesize is None:
+            return None, None, None
+        return None, filesize, self.store.digest_index().digest_of(filename)
+
+    async def _open_download(self, addr, protocol, filename, options):
+        accepted = self._negotiate(addr, protocol, options)
+        if accepted is None:
+            return
+        entries, filesize, digest = await asyncio.get_running_loop().run_in_executor(
+            None, self._locate, filename, handshake.OPT_BATCH in accepted)
+        if filesize is None:
+            self.transport.sendto(Messages.ERROR_FILE_NOT_FOUND, addr)
+            logging.warning(f"SERVIDOR: El archivo '{filename}' no existe. Enviando ERROR a {addr}.")
+            return
+        if not self.store.negotiate_part(self.transport.sendto, addr, options, accepted, filename, filesize, False):
+            return
+        if entries is not None:
+            accepted[handshake.OPT_BATCH] = len(entries)
+        else:
+            accepted[handshake.OPT_DIGEST] = digest
+        handler = PROTOCOLS[protocol](self.args, None, accepted)
+        handler.file_cache = self.file_cache
+        handler.batch = entries
+        handler.stats = metrics.for_transfer(self.args, "download", protocol, filename, addr, self.metrics, "server")
+        response = handshake.format_message("DOWNLOAD_OK", self.port, filesize, options=accepted)
+        return self._open_session(addr, handler, response,
+                           lambda session: self._send_download(session, filename, filesize))
+
+    async def _run(self, session, addr, transfer):
+        """Corre la transferencia (con su cierre FIN/FIN-ACK) y cierra la sesión"""
+        success = False
+        start = time.monotonic()
+        try:
+            success = await transfer(session)
+            if success:
+                logging.info(f"SERVIDOR: Sesión {session.conn_id} de {addr} completada")
+            else:
+                logging.error(f"SERVIDOR: Sesión {session.conn_id} de {addr} fallida")
+        except Exception as e:
+            logging.critical(f"Error fatal en la sesión {session.conn_id} de {addr}: {e}")
+        finally:
+            metrics.finish(session.handler.stats, success)
+            self.sessions.pop(session.conn_id, None)
+            if self.handshakes.get(addr) is session:
+                del self.handshakes[addr]
+            if self.admission is not None:
+                self._start(self.admission.finish(time.monotonic() - start))
+
+    async def _close_sender(self, session):
+        """Emisor: FIN hasta que llega el FIN-ACK (ver base_protocol.FinSender)"""
+        closing = FinSender(session.handler)
+        while (fin := closing.datagram()) is not None:
+            self._send(session, fin)
+            while (pkt := await session.receive(closing.next_timeout())) is not None:
+                if (result := closing.on_packet(pkt)) is not None:
+                    return result
+        return False
+
+    async def _close_receiver(self, session, accepted):
+        """Receptor: FIN-ACK y espera corta que sólo contesta FINs retransmitidos
+        (ver base_protocol.FinReceiver)"""
+        handler = session.handler
+        if handler.stats is not None:
+            handler.stats.stop()
+        if session.fin is None:
+            return
+        closing = FinReceiver(handler, session.fin, accepted)
+        self._send(session, closing.response)
+        while (pkt := await session.receive(closing.next_timeout())) is not None:
+            if (response := closing.on_packet(pkt)) is not None:
+                self._send(session, response)
+
+    def _send(self, session, datagram):
+        self.transport.sendto(datagram, session.addr)
+        if self.recorder is not None:
+            self.recorder.record(time.monotonic(), trace.OUT, self.local, session.addr, datagram, len(datagram))
+
+    def _send_parts(self, session, parts):
+        """Envía header y payload con sendmsg si el transporte no tiene nada encolado"""
+        if self.recorder is not None:
+            self.recorder.record(time.monotonic(), trace.OUT, self.local, session.addr, parts[0], sum(map(len, parts)))
+        if SENDMSG and not self.transport.get_write_buffer_size():
+            try:
+                self.socket.sendmsg(parts, (), 0, session.addr)
+                return
+            except OSError:
+                # Buffer lleno u otro error: el transporte encola o lo reporta
+                pass
+        self.transport.sendto(b"".join(parts), session.addr)
+
+    async def _receive_upload(self, session, filename, filesize):
+        handler = session.handler
+        length = handler.transfer_length(filesize)
+        loop = asyncio.get_running_loop()
+        # Abrir el destino lo prealoca: en un hilo, como las escrituras
+        upload = await loop.run_in_executor(None, handler.open_upload, handler.get_file_path(filename), filesize)
+        with upload:
+            _, file = handler.track(length, None, upload.file)
+            window = handler.counters = handler.receive_window(file)
+            if isinstance(handler, StopAndWaitProtocol):
+                success = await self._sw_receive(session, window, length)
+            else:
+                success = await self._sr_receive(session, window, length)
+            if success:
+                # El commit de un rango o de un lote hashea lo recibido
+                success = await loop.run_in_executor(None, upload.commit)
+        if success:
+            self._invalidate(filename)
+        await self._close_receiver(session, success)
+        return success
+
+    async def _send_download(self, session, filename, filesize):
+        handler = session.handler
+        length = handler.transfer_length(filesize)
+        with handler.open_source(handler.get_file_path(filename)) as source:
+            _, source = handler.track(length, None, source)
+            window = handler.counters = handler.send_window(source, length)
+            if isinstance(handler, StopAndWaitProtocol):
+                success = await self._sw_send(session, window)
+            else:
+                success = await self._sr_send(session, window)
+        return success and await self._close_sender(session)
+
+    async def _sw_receive(self, session, receiver, filesize):
+        """Stop-and-Wait: receptor (ver StopAndWaitReceiver). Cada ráfaga se
+        escribe en un hilo: el disco no frena a las demás sesiones"""
+        loop = asyncio.get_running_loop()
+        # Se escucha hasta el FIN: el ACK del último paquete pudo perderse
+        while True:
+            pkts = await session.receive_all(SERVER_TIMEOUT)
+            if not pkts:
+                if receiver.bytes_received >= filesize:
+                    logging.warning(f"Sesión {session.conn_id}: No llegó el FIN, pero el archivo está completo")
+                    return True
+                logging.warning(f"Sesión {session.conn_id}: Timeout - conexión perdida")
+                return False
+            acks, fin = await loop.run_in_executor(None, receiver.receive, pkts)
+            for ack in acks:
+                self._send(session, ack)
+            if fin is not None:
+                session.fin = fin
+                return session.handler.accept_fin(fin, receiver.bytes_received, filesize)
+
+    async def _sw_send(self, session, sender):
+        """Stop-and-Wait: emisor (ver StopAndWaitSender)"""
+        while not sender.done:
+            self._send_parts(session, sender.datagram())
+            acked = False
+            # Los ACKs viejos no reinician la espera
+            while not acked and (pkt := await session.receive(sender.next_timeout())) is not None:
+                acked = sender.on_ack(pkt)
+            if not acked and not sender.expired():
+                return False
+        return True
+
+    async def _sr_receive(self, session, window, filesize):
+        """Selective Repeat: receptor con SACKs agrupados (ver ReceiveWindow).
+        Cada ráfaga se escribe en un hilo: el disco no frena a las demás sesiones"""
+        loop = asyncio.get_running_loop()
+        while True:
+            if window.ack_due():
+                self._send(session, window.sack())
+            pkts = await session.receive_all(window.next_timeout(RECEIVER_IDLE_TIMEOUT))
+            if not pkts:
+                if window.ack_deadline is not None:
+                    continue
+                logging.warning(f"Sesión {session.conn_id}: Timeout - conexión perdida")
+                return False
+            ack_now, fin = await loop.run_in_executor(None, window.receive, pkts)
+            if ack_now:
+                self._send(session, window.sack())
+            if fin is not None:
+                session.fin = fin
+                return session.handler.accept_fin(fin, window.bytes_received, filesize)
+
+    async def _sr_send(self, session, window):
+        """Selective Repeat: emisor guiado por SACKs y timers (ver SendWindow)"""
+        while True:
+            for parts in window.new_datagrams():
+                self._send_parts(session, parts)
+            if window.done:
+                break
+
+            # Procesar también los SACKs que ya estaban encolados
+            for pkt in await session.receive_all(window.next_timeout()):
+                window.on_ack(pkt)
+
+            retransmissions = window.expired()
+            if retransmissions is None:
+                return False
+            for seq_num in retransmissions:
+                self._send_parts(session, window.datagram(seq_num))
+        return True
+
+
+async def serve(args, should_quit, reuse_port=False, recorder=None):
+    """Atiende en args.host:args.port hasta que should_quit() devuelva True.
+    Con recorder registra los paquetes (ver lib/trace.py)"""
+    loop = asyncio.get_running_loop()
+    # El socket se crea acá para conservar acceso a sendmsg (el transporte no lo expone)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((args.host, args.port))
+    transport, server = await loop.create_datagram_endpoint(lambda: AsyncServer(args, sock, recorder), sock=sock)
+    logging.info(f"SERVIDOR-MAIN Escuchando (asyncio): {args.host}:{args.port}")
+    http = metrics.serve_http(server.metrics, args.metrics_port) if server.metrics is not None else None
+    try:
+        while not should_quit():
+            await asyncio.sleep(QUIT_POLL)
+    finally:
+        logging.info("Cerrando conexiones...")
+        if server.admission is not None:
+            dropped = server.admission.close()
+            if dropped:
+                logging.info(f"Se descartan {dropped} saludos en cola")
+        tasks = [session.task for session in server.sessions.values() if session.task]
+        if tasks:
+            logging.info(f"Esperando {len(tasks)} transferencias activas...")
+            await asyncio.wait(tasks, timeout=3.0)
+        transport.close()
+        if http is not None:
+            http.shutdown()
+        if server.file_cache is not None:
+            logging.info(server.file_cache.summary())
@@ -1,22 +1,133 @@
-import socket
 import os
 import time
 import logging
 
-BUFFER = 1024
-RECV_BUFFER = 2048
-TIMEOUT = 0.5
+from . import batch, compression, handshake, packet, storage, transport
+
+'''CIERRE'''
+# El emisor reintenta el FIN hasta recibir el FIN-ACK, duplicando el RTO en
+# cada intento; el receptor sigue contestando retransmisiones mientras
+# puedan perderse LINGER_FINS FIN seguidos
+FIN_RETRIES = 10
+LINGER_FINS = 3
+MIN_LINGER = 0.05
+MAX_LINGER = 4.0
+# En la espera final sólo interesan los FIN (header + digest)
+FIN_BUFFER = packet.HEADER_SIZE + 64
+
+
+class FinSender:
+    """Cierre del emisor, independiente de cómo se hace la E/S: el FIN se
+    reintenta con backoff hasta que llega el FIN-ACK.
+
+    Lo usan BaseProtocol.close_sender y el servidor asíncrono: el llamador
+    envía cada datagram() y le pasa a on_packet() lo que llegue hasta
+    next_timeout().
+    """
+
+    def __init__(self, protocol):
+        self.protocol = protocol
+        self.attempts = 0
+
+    def datagram(self):
+        """FIN a enviar ahora, o None si se agotaron los FIN_RETRIES intentos"""
+        proto = self.protocol
+        if self.attempts >= FIN_RETRIES:
+            logging.error(f"El receptor no confirmó el FIN después de {FIN_RETRIES} intentos")
+            return None
+        if self.attempts:
+            proto.rtt.on_timeout()
+        self.attempts += 1
+        self.deadline = proto.now() + proto.rtt.timeout
+        return proto.fin_packet()
+
+    def next_timeout(self):
+        """Segundos hasta reintentar el FIN"""
+        return self.deadline - self.protocol.now()
+
+    def on_packet(self, pkt):
+        """True si pkt es el FIN-ACK, False si el receptor descartó el archivo, None si no es la respuesta"""
+        if pkt.type != packet.FIN_ACK:
+            return None
+        if pkt.flags & packet.FLAG_REJECTED:
+            logging.error("El receptor descartó el archivo")
+            return False
+        logging.debug("FIN-ACK recibido")
+        return True
+
+
+class FinReceiver:
+    """Cierre del receptor, independiente de cómo se hace la E/S: tras el
+    FIN-ACK contesta los FIN retransmitidos (se perdió el FIN-ACK) durante
+    linger_time del último"""
+
+    def __init__(self, protocol, fin, accepted):
+        self.protocol = protocol
+        self.response = protocol.fin_ack_packet(accepted)
+        self.deadline = protocol.now() + protocol.linger_time(fin)
+
+    def next_timeout(self):
+        """Segundos que quedan de espera (<= 0: terminó)"""
+        return self.deadline - self.protocol.now()
+
+    def on_packet(self, pkt):
+        """FIN-ACK a reenviar si pkt es un FIN retransmitido, o None"""
+        if pkt.type != packet.FIN:
+            return None
+        self.deadline = self.protocol.now() + self.protocol.linger_time(pkt)
+        return self.response
+
 
 class BaseProtocol:
     """Clase base con funcionalidad común para protocolos"""
-    
-    def __init__(self, args, client_socket: socket.socket):
+
+    # Bytes que el datagrama más grande lleva además del header y el mss
+    datagram_overhead = 0
+
+    def __init__(self, args, client_transport, options=None):
         self.args = args
-        self.socket = client_socket
+        # Socket UDP o transporte (ver lib/transport.py); None en el servidor asíncrono
+        self.transport = transport.wrap(client_transport)
+        # Reloj de los timers: el de la red del transporte (virtual en una simulación)
+        self.now = self.transport.now if self.transport is not None else time.monotonic
+        # Opciones de la sesión acordadas en el handshake
+        self.options = options or {}
+        self.mss, self.window, self.initial_rto = handshake.session_params(self.options)
+        # Id de conexión que asignó el servidor (0 si demultiplexa por puerto)
+        self.conn_id = handshake.session_conn_id(self.options)
+        # Porción del archivo que mueve la sesión (None: el archivo entero)
+        self.range = handshake.session_range(self.options)
+        # Header de los paquetes de datos, reescrito en cada envío
+        self.header_buffer = bytearray(packet.HEADER_SIZE)
+        # Caché de archivos del servidor para las descargas (ver lib/file_cache.py)
+        self.file_cache = None
+        # Archivos a enviar si la sesión mueve un lote (ver lib/batch.py)
+        self.batch = None
+        # (FIN, dirección) que cerró la recepción, para contestarlo en close_receiver
+        self.fin = None
+        # Estadísticas de la transferencia (ver lib/metrics.py); None: sin métricas
+        self.stats = None
+        # Objeto con los contadores de la transferencia: la ventana o el propio protocolo
+        self.counters = None
+        # Barra de progreso en la consola: el servidor la apaga (sesiones concurrentes)
+        self.progress = True
+
+    def _size_socket_buffers(self, packets):
+        """Agranda los buffers del socket para `packets` datagramas de tamaño mss"""
+        self.transport.set_buffers(packets * (self.mss + packet.HEADER_SIZE))
+
+    def track(self, length, io=None, data=None):
+        """Empieza la transferencia de length bytes. Con métricas, devuelve io y
+        data (archivo o fuente) medidos; si no, los mismos"""
+        if self.stats is None:
+            return io, data
+        return self.stats.track(self, length, io, data)
 
     def show_progress_bar(self, current, total, bar_length=50):
         """Muestra una barra de progreso ASCII"""
-        progress = min(current / total, 1.0)
+        if not self.progress:
+            return
+        progress = min(current / total, 1.0) if total else 1.0
         filled_length = int(bar_length * progress)
         bar = '█' * filled_length + '-' * (bar_length - filled_length)
         percent = progress * 100
@@ -24,86 +135,173 @@ class BaseProtocol:
         if progress >= 1.0:
             print()
 
-    def update_rtt(self, estimated_rtt, sample_rtt):
-        """Actualiza RTT estimado usando promedio exponencial"""
-        if estimated_rtt is None:
-            return sample_rtt
-        return (0.7 * estimated_rtt) + (0.3 * sample_rtt)
-
-    def calculate_timeout(self, estimated_rtt, min_timeout, max_timeout, multiplier=2.5):
-        """Calcula timeout basado en RTT"""
-        if estimated_rtt is None:
-            return min_timeout
-        timeout = max(estimated_rtt * multiplier, min_timeout)
-        return min(timeout, max_timeout)
-
     def handle_progress(self, packet_count, bytes_processed, total_bytes, interval=100):
         """Maneja mostrar progreso cada cierto intervalo"""
         if packet_count == 1 or packet_count % interval == 0:
             self.show_progress_bar(bytes_processed, total_bytes)
 
-    def parse_packet(self, packet):
-        """Parsea paquete en formato 'seq:data'"""
-        if b":" not in packet:
-            raise ValueError("Paquete sin formato ':'")
-        if b"FYN:0" in packet:
-            return int(-99), "fin"
-        seq_str, chunk = packet.split(b":", 1)
-        return int(seq_str), chunk
+    def parse_packet(self, datagram):
+        """Parsea un paquete binario (ver lib/packet.py)"""
+        return packet.unpack(datagram)
+
+    def data_parts(self, seq_num, chunk, flags=0):
+        """Header y payload de un paquete de datos, para send_parts.
 
-    def create_packet(self, seq_num, chunk):
-        """Crea paquete en formato 'seq:data'"""
-        return f"{seq_num}:".encode() + chunk
+        El header se arma en un buffer reutilizado: hay que enviarlo antes
+        de pedir el siguiente.
+        """
+        packet.pack_header_into(self.header_buffer, packet.DATA, seq_num, chunk, flags, self.conn_id)
+        return self.header_buffer, chunk
+
+    def send_parts(self, parts, addr):
+        """Envía un datagrama armado por partes sin copiarlas (scatter/gather)"""
+        self.transport.send_parts(parts, addr)
 
     def send_ack(self, seq_num, addr):
         """Envía ACK para número de secuencia"""
-        ack_msg = f"ACK:{seq_num}".encode()
-        self.socket.sendto(ack_msg, addr)
-        logging.debug(f"ACK enviado para seq={seq_num}")
+        self.transport.sendto(packet.pack(packet.ACK, seq_num, conn_id=self.conn_id), addr)
+        logging.debug("ACK enviado para seq=%d", seq_num)
+
+    def data_payload(self, pkt):
+        """Bytes del archivo que trae un paquete de datos (descomprimidos si hace falta).
+
+        ValueError si el bloque comprimido es inválido.
+        """
+        if pkt.flags & packet.FLAG_COMPRESSED:
+            return compression.decompress_block(pkt.payload, self.mss)
+        return pkt.payload
 
     def is_expected_ack(self, response, expected_seq):
         """Verifica si el ACK recibido es el esperado"""
-        return response.strip() == f"ACK:{expected_seq}"
+        try:
+            ack = packet.unpack(response)
+        except ValueError:
+            return False
+        return ack.type == packet.ACK and ack.seq == expected_seq
 
-    def get_file_path(self, filename, storage_dir="storage"):
-        """Obtiene ruta completa del archivo"""
+    def transfer_length(self, filesize):
+        """Bytes que mueve la sesión: el archivo entero o su porción"""
+        if self.range is None:
+            return filesize
+        start, end = self.range
+        return min(end, filesize) - start
+
+    def open_source(self, path):
+        """Mapea el archivo a enviar desde el inicio de la porción.
+
+        Si se acordó compresión, los bloques salen comprimidos por un hilo
+        (ver lib/compression.py).
+        """
+        open_file = self.file_cache.open if self.file_cache is not None else storage.Source
+        if self.batch is not None:
+            # Lote: path no se usa, el flujo sale de los archivos de self.batch
+            source = batch.BatchSource(self.batch, open_file)
+            length = source.length
+        else:
+            start = self.range[0] if self.range is not None else 0
+            source = open_file(path, start)
+            length = len(source.view)
+            if self.range is not None:
+                length = min(length, self.range[1] - start)
+        if handshake.OPT_COMPRESS not in self.options:
+            return source
+        return compression.CompressedSource(source, length, self.mss)
+
+    def open_upload(self, path, filesize):
+        """Servidor: destino de una subida (ver lib/storage.py)"""
+        if handshake.OPT_BATCH in self.options:
+            on_publish = self.file_cache.invalidate if self.file_cache is not None else None
+            return batch.BatchSpool(self.get_storage_path(), filesize, index=True, on_publish=on_publish)
+        digest = self.options.get(handshake.OPT_DIGEST)
+        if self.range is None:
+            return storage.Upload(path, filesize, digest)
+        transfer_id = self.options[handshake.OPT_TRANSFER]
+        return storage.RangeUpload(path, transfer_id, filesize, *self.range, digest)
+
+    def open_download(self, path, filesize):
+        """Cliente: destino de una descarga (ver lib/storage.py)"""
+        if handshake.OPT_BATCH in self.options:
+            return batch.BatchSpool(getattr(self.args, "dst", None) or ".", filesize)
+        # Siempre con journal: un corte se puede reanudar después con --resume
+        return storage.Download(path, filesize, self.range, journal=True)
+
+    def get_storage_path(self, storage_dir="storage"):
+        """Directorio del storage, creado si no existe"""
         storage_path = getattr(self.args, 'storage', None) or storage_dir
         os.makedirs(storage_path, exist_ok=True)
-        return os.path.join(storage_path, filename)
-
-    def cleanup_duplicates(self, timeout_duration=2):
-        """Limpia paquetes duplicados al final de transferencia"""
-        end_time = time.time() + timeout_duration
-        while time.time() < end_time:
-            try:
-                self.socket.settimeout(TIMEOUT)
-                self.socket.recvfrom(BUFFER)
-            except:
-                continue
+        return storage_path
+
+    def get_file_path(self, filename, storage_dir="storage"):
+        """Obtiene ruta completa del archivo"""
+        return os.path.join(self.get_storage_path(storage_dir), filename)
 
     def _get_download_path(self):
         """Obtiene ruta de descarga"""
-        if hasattr(self.args, 'dst') and os.path.isdir(self.args.dst):
-            return os.path.join(self.args.dst, self.args.name)
-        return getattr(self.args, 'dst', self.args.name)
-    
-    def cleanup_duplicates(self, timeout_duration=2):
-        """Limpia paquetes duplicados al final de transferencia"""
-        end_time = time.time() + timeout_duration
-        while time.time() < end_time:
-            try:
-                self.socket.settimeout(0.2)
-                self.socket.recvfrom(RECV_BUFFER)
-            except:
-                continue
-    def send_fyn(self,addr):
-        try:
-            logging.debug(f"Se envió FYN:0")
-            self.socket.sendto("FYN:0".encode(),addr)
-        except socket.timeout:
-            logging.debug(f"Se envió FYN")
+        return storage.download_path(self.args)
+
+    def fin_packet(self):
+        """FIN con el digest del archivo, si la sesión lo conoce, y el RTO del emisor en el seq"""
+        digest = self.options.get(handshake.OPT_DIGEST)
+        payload = bytes.fromhex(digest) if digest else b""
+        return packet.pack(packet.FIN, int(self.rtt.timeout * 1_000_000), payload, conn_id=self.conn_id)
+
+    def fin_ack_packet(self, accepted=True):
+        return packet.pack(packet.FIN_ACK, 0, flags=0 if accepted else packet.FLAG_REJECTED, conn_id=self.conn_id)
+
+    def fin_matches(self, fin):
+        """El digest que trae el FIN coincide con el acordado en el handshake"""
+        digest = self.options.get(handshake.OPT_DIGEST)
+        if not digest or not len(fin.payload):
+            return True
+        return fin.payload == bytes.fromhex(digest)
+
+    def linger_time(self, fin):
+        """Cuánto espera el receptor tras el FIN-ACK: los LINGER_FINS próximos
+        intentos del emisor, con el backoff del RTO que trae el FIN"""
+        return min(max((2 ** LINGER_FINS - 1) * fin.seq / 1_000_000, MIN_LINGER), MAX_LINGER)
+
+    def accept_fin(self, fin, bytes_received, length):
+        """El FIN cierra bien la recepción: trae el digest acordado y ya llegaron los length bytes"""
+        if not self.fin_matches(fin):
+            logging.error("El digest del FIN no coincide con el del handshake")
+            return False
+        if bytes_received < length:
+            logging.error(f"FIN con {bytes_received:,} de {length:,} bytes recibidos")
+            return False
+        return True
 
-        
+    def close_sender(self, io, addr):
+        """Emisor: envía el FIN hasta que llega el FIN-ACK (ver FinSender). False
+        si nunca llegó o si el receptor descartó el archivo"""
+        closing = FinSender(self)
+        while (fin := closing.datagram()) is not None:
+            self.transport.sendto(fin, addr)
+            while (remaining := closing.next_timeout()) > 0:
+                for data, _ in io.recv(remaining):
+                    try:
+                        result = closing.on_packet(packet.unpack(data))
+                    except ValueError:
+                        continue
+                    if result is not None:
+                        return result
+        return False
 
-    
-            
+    def close_receiver(self, accepted):
+        """Receptor: contesta el FIN con el FIN-ACK y, durante unos RTO del
+        emisor, sólo los FIN retransmitidos (se perdió el FIN-ACK)"""
+        if self.stats is not None:
+            self.stats.stop()
+        if self.fin is None:
+            return
+        fin, addr = self.fin
+        closing = FinReceiver(self, fin, accepted)
+        self.transport.sendto(closing.response, addr)
+        io = self.transport.io(FIN_BUFFER)
+        while (remaining := closing.next_timeout()) > 0:
+            for data, addr in io.recv(remaining):
+                try:
+                    response = closing.on_packet(packet.unpack(data))
+                except ValueError:
+                    continue
+                if response is not None:
+                    self.transport.sendto(response, addr)
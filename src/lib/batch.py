@@ -0,0 +1,289 @@
+import fnmatch
+import hashlib
+import logging
+import os
+import struct
+import tempfile
+import threading
+from bisect import bisect_right
+from collections import OrderedDict, namedtuple
+
+from . import storage
+
+# Lote de archivos en una sola sesión: viajan uno detrás de otro en un único
+# flujo de bytes, cada uno precedido por su header. El flujo se transfiere
+# como un archivo más (mismos protocolos, compresión y cierre) y el receptor,
+# al final, lo separa en los archivos y verifica cada uno con su digest.
+'''FORMATO'''
+# Header de cada archivo: largo del nombre, tamaño y SHA-256; sigue el nombre en UTF-8
+ENTRY_HEADER = struct.Struct("!HQ32s")
+MAX_NAME = 255
+'''LISTAS Y PATRONES'''
+# En descargas se pide una lista de nombres o patrones glob separados por comas
+LIST_SEPARATOR = ","
+GLOB_CHARS = "*?["
+# La lista viaja en el saludo: más larga no entra en un datagrama de texto
+MAX_LIST = 768
+'''EMISOR'''
+# Archivos del lote abiertos a la vez; los demás se reabren si hay que retransmitir
+OPEN_FILES = 64
+
+# Un archivo del lote: nombre en el destino, ruta local, tamaño y SHA-256 (hex)
+Entry = namedtuple("Entry", "name path size digest")
+
+
+def valid_name(name):
+    """Nombre plano dentro del directorio destino (sin rutas ni archivos ocultos)"""
+    return (bool(name) and len(name.encode()) <= MAX_NAME and not name.startswith(".")
+            and "/" not in name and "\0" not in name)
+
+
+def is_pattern(name):
+    """El nombre pedido es una lista o un glob, no un archivo"""
+    return any(c in name for c in GLOB_CHARS + LIST_SEPARATOR)
+
+
+def read_manifest(path):
+    """Líneas no vacías de un manifiesto (las que empiezan con # se ignoran)"""
+    with open(path) as manifest:
+        return [line.strip() for line in manifest if line.strip() and not line.lstrip().startswith("#")]
+
+
+def local_paths(src, manifest=None):
+    """Cliente: archivos a subir, del manifiesto o del directorio src. None si no es un lote"""
+    if manifest:
+        return read_manifest(manifest)
+    if src and os.path.isdir(src):
+        return sorted(os.path.join(src, name) for name in os.listdir(src)
+                      if not name.startswith(".") and os.path.isfile(os.path.join(src, name)))
+    return None
+
+
+def collect(paths):
+    """Entries de los archivos locales. ValueError si alguno no sirve o hay nombres repetidos"""
+    entries = []
+    names = set()
+    for path in paths:
+        name = os.path.basename(path)
+        if not os.path.isfile(path):
+            raise ValueError(f"{path} no es un archivo")
+        if not valid_name(name):
+            raise ValueError(f"Nombre inválido para el lote: {name!r}")
+        if name in names:
+            raise ValueError(f"Nombre repetido en el lote: {name}")
+        names.add(name)
+        entries.append(Entry(name, path, os.path.getsize(path), storage.file_digest(path)))
+    return entries
+
+
+def list_matches(directory, patterns):
+    """Servidor: entries sin digest (None) de los archivos que coinciden, sin leer su contenido"""
+    wanted = [pattern for pattern in patterns.split(LIST_SEPARATOR) if pattern]
+    try:
+        names = sorted(os.listdir(directory))
+    except FileNotFoundError:
+        return []
+    names = [name for name in names if valid_name(name)
+             and any(fnmatch.fnmatchcase(name, pattern) for pattern in wanted)]
+    sizes = {name: storage.file_size(os.path.join(directory, name)) for name in names}
+    return [Entry(name, os.path.join(directory, name), sizes[name], None) for name in names if sizes[name] is not None]
+
+
+def match(directory, patterns):
+    """Servidor: entries de los archivos del storage que coinciden con la lista de patrones"""
+    entries = list_matches(directory, patterns)
+    digests = storage.DigestIndex(directory).digests_of([entry.name for entry in entries])
+    return [entry._replace(digest=digests[entry.name]) for entry in entries]
+
+
+def entry_header(entry):
+    name = entry.name.encode()
+    return ENTRY_HEADER.pack(len(name), entry.size, bytes.fromhex(entry.digest)) + name
+
+
+def stream_length(entries):
+    """Bytes del flujo del lote: headers y contenidos"""
+    return sum(ENTRY_HEADER.size + len(entry.name.encode()) + entry.size for entry in entries)
+
+
+class BatchSource:
+    """Fuente (ver storage.Source) que concatena los archivos del lote con sus headers.
+
+    Cada archivo se abre con open_file al pedir su primer tramo y quedan a lo
+    sumo OPEN_FILES abiertos. Un tramo que cruza de un archivo al siguiente
+    se copia; los demás son vistas como en storage.Source. Con compresión lo
+    lee también el hilo de compression.CompressedSource.
+    """
+
+    def __init__(self, entries, open_file=storage.Source):
+        self.entries = entries
+        self.open_file = open_file
+        self.starts = []  # offset de cada segmento del flujo
+        self.segments = []  # header (bytes) o índice del archivo en entries
+        self.length = 0
+        for index, entry in enumerate(entries):
+            header = entry_header(entry)
+            self._add(memoryview(header), len(header))
+            if entry.size:
+                self._add(index, entry.size)
+        self.sources = OrderedDict()  # {índice: fuente abierta}
+        self.lock = threading.Lock()
+
+    def _add(self, segment, length):
+        self.starts.append(self.length)
+        self.segments.append(segment)
+        self.length += length
+
+    def _source(self, index):
+        source = self.sources.get(index)
+        if source is None:
+            source = self.sources[index] = self.open_file(self.entries[index].path)
+            if len(self.sources) > OPEN_FILES:
+                _, evicted = self.sources.popitem(last=False)
+                evicted.close()
+        self.sources.move_to_end(index)
+        return source
+
+    def chunk(self, offset, length):
+        end = min(offset + length, self.length)
+        parts = []
+        i = bisect_right(self.starts, offset) - 1
+        with self.lock:
+            while offset < end:
+                start, segment = self.starts[i], self.segments[i]
+                if isinstance(segment, memoryview):
+                    part = segment[offset - start:end - start]
+                else:
+                    wanted = min(end, start + self.entries[segment].size) - offset
+                    part = self._source(segment).chunk(offset - start, wanted)
+                    if len(part) < wanted:
+                        # El archivo se achicó desde que se armó el lote: el
+                        # digest no va a coincidir, pero el flujo no se corre
+                        part = bytes(part) + bytes(wanted - len(part))
+                parts.append(part)
+                offset += len(part)
+                i += 1
+        return parts[0] if len(parts) == 1 else b"".join(parts)
+
+    def block(self, offset, length):
+        """(flags, payload) del paquete que lleva ese tramo: sin comprimir"""
+        return 0, self.chunk(offset, length)
+
+    def release(self, offset):
+        """Los tramos no se guardan: no hay nada que liberar"""
+
+    def close(self):
+        with self.lock:
+            for source in self.sources.values():
+                source.close()
+            self.sources.clear()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class BatchSpool:
+    """Destino de un lote: el flujo se recibe en un temporal y commit() lo separa.
+
+    Cada archivo se verifica con su digest y se publica en directory con un
+    rename atómico, como una subida suelta. Con index (servidor) los digests
+    se anotan en el índice del storage; on_publish recibe la ruta de cada
+    archivo publicado.
+    """
+
+    def __init__(self, directory, size, index=False, on_publish=None):
+        os.makedirs(directory, exist_ok=True)
+        fd, self.spool_path = tempfile.mkstemp(prefix=".batch.", suffix=storage.PART_SUFFIX, dir=directory)
+        self.directory = directory
+        self.size = size
+        self.file = storage.OffsetFile(fd, 0, size)
+        self.index = storage.DigestIndex(directory) if index else None
+        self.on_publish = on_publish
+        self.published = {}  # {nombre: digest}
+        self.committed = False
+
+    def commit(self):
+        """Publica los archivos del lote. False si el flujo está mal formado o alguno no coincide con su digest"""
+        self.committed = True
+        try:
+            success = self._unpack()
+        finally:
+            self.discard()
+        if self.index is not None and self.published:
+            self.index.record_many(self.published)
+        logging.info(f"Lote: {len(self.published)} archivos guardados en {self.directory}")
+        return success
+
+    def _unpack(self):
+        offset = 0
+        success = True
+        while offset < self.size:
+            header = self.file.read_at(offset, ENTRY_HEADER.size)
+            if len(header) < ENTRY_HEADER.size:
+                logging.error("Lote truncado: falta el header de un archivo")
+                return False
+            name_length, size, digest = ENTRY_HEADER.unpack(header)
+            offset += ENTRY_HEADER.size
+            name = self.file.read_at(offset, name_length).decode(errors="replace")
+            offset += name_length
+            if offset + size > self.size:
+                logging.error(f"Lote truncado: faltan bytes de {name!r}")
+                return False
+            if not valid_name(name):
+                logging.error(f"Nombre inválido en el lote: {name!r}, se descarta")
+                success = False
+            elif not self._publish(name, offset, size, digest.hex()):
+                success = False
+            offset += size
+        return success
+
+    def _publish(self, name, offset, size, digest):
+        """Copia el archivo del temporal del lote a su destino si coincide con el digest"""
+        fd, part_path = tempfile.mkstemp(prefix=f".{name}.", suffix=storage.PART_SUFFIX, dir=self.directory)
+        received = hashlib.sha256()
+        try:
+            os.fchmod(fd, storage.FILE_MODE)
+            with os.fdopen(fd, "wb") as file:
+                end = offset + size
+                while offset < end:
+                    block = self.file.read_at(offset, min(storage.DIGEST_BLOCK, end - offset))
+                    received.update(block)
+                    file.write(block)
+                    offset += len(block)
+            if received.hexdigest() != digest:
+                logging.error(f"El contenido recibido para {name} no coincide con su digest, se descarta")
+                os.unlink(part_path)
+                return False
+            path = os.path.join(self.directory, name)
+            os.replace(part_path, path)
+        except OSError as e:
+            logging.error(f"No se pudo guardar {name}: {e}")
+            try:
+                os.unlink(part_path)
+            except FileNotFoundError:
+                pass
+            return False
+        self.published[name] = digest
+        if self.on_publish is not None:
+            self.on_publish(path)
+        logging.debug(f"Lote: {name} guardado ({size:,} bytes)")
+        return True
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.unlink(self.spool_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.committed:
+            logging.debug(f"Descartando lote incompleto {self.spool_path}")
+            self.discard()
+        return False
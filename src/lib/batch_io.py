@@ -0,0 +1,232 @@
+import ctypes
+import ctypes.util
+import errno
+import math
+import os
+import select
+import socket
+import struct
+import sys
+
+# E/S de datagramas en tandas: en Linux una ventana entera sale con un
+# sendmmsg y una ráfaga de paquetes entra con un recvmmsg. En el resto de las
+# plataformas se usa una llamada por paquete, con la misma interfaz.
+'''TANDAS'''
+BATCH = 64
+# Lugar reservado para el header de cada mensaje de una tanda
+HEADER_SLOT = 64
+'''DISPONIBILIDAD'''
+# Header y payload se envían sin juntarlos donde hay sendmsg (no en Windows)
+SENDMSG = hasattr(socket.socket, "sendmsg")
+MSG_DONTWAIT = getattr(socket, "MSG_DONTWAIT", 0x40)
+SOCKADDR_IN = 16
+SOCKADDR_FAMILY = struct.Struct("=H")
+SOCKADDR_PORT = struct.Struct("!H")
+
+
+class _Iovec(ctypes.Structure):
+    _fields_ = [("iov_base", ctypes.c_void_p), ("iov_len", ctypes.c_size_t)]
+
+
+class _Msghdr(ctypes.Structure):
+    _fields_ = [
+        ("msg_name", ctypes.c_void_p),
+        ("msg_namelen", ctypes.c_uint32),
+        ("msg_iov", ctypes.POINTER(_Iovec)),
+        ("msg_iovlen", ctypes.c_size_t),
+        ("msg_control", ctypes.c_void_p),
+        ("msg_controllen", ctypes.c_size_t),
+        ("msg_flags", ctypes.c_int),
+    ]
+
+
+class _Mmsghdr(ctypes.Structure):
+    _fields_ = [("msg_hdr", _Msghdr), ("msg_len", ctypes.c_uint)]
+
+
+def _load_libc():
+    """sendmmsg y recvmmsg de la libc, o None si no están"""
+    if not sys.platform.startswith("linux"):
+        return None
+    try:
+        libc = ctypes.CDLL(ctypes.util.find_library("c") or "libc.so.6", use_errno=True)
+        libc.sendmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int]
+        libc.recvmmsg.argtypes = [ctypes.c_int, ctypes.c_void_p, ctypes.c_uint, ctypes.c_int, ctypes.c_void_p]
+    except (OSError, AttributeError):
+        return None
+    return libc
+
+
+_libc = _load_libc()
+AVAILABLE = _libc is not None
+
+
+def for_socket(sock, bufsize):
+    """E/S en tandas para sock; bufsize es el datagrama más grande que se espera recibir"""
+    if AVAILABLE:
+        return MmsgIO(sock, bufsize)
+    return SocketIO(sock, bufsize)
+
+
+class SocketIO:
+    """Un sendmsg/sendto y un recvfrom por datagrama"""
+
+    def __init__(self, sock, bufsize):
+        self.socket = sock
+        self.bufsize = bufsize
+
+    def send(self, datagrams, addr):
+        """Envía cada datagrama (partes: header, payload) a addr"""
+        for parts in datagrams:
+            if SENDMSG:
+                self.socket.sendmsg(parts, (), 0, addr)
+            else:
+                self.socket.sendto(b"".join(parts), addr)
+
+    def recv(self, timeout):
+        """Espera hasta timeout (None: sin límite) y devuelve [(datagrama, addr)] o []"""
+        self.socket.settimeout(timeout)
+        try:
+            return [self.socket.recvfrom(self.bufsize)]
+        except (socket.timeout, BlockingIOError):
+            return []
+
+
+class MmsgIO:
+    """sendmmsg/recvmmsg vía ctypes, con las estructuras reservadas una sola vez.
+
+    recv() devuelve vistas sobre un buffer propio: valen hasta el próximo
+    recv(). Los payloads escribibles (p. ej. del archivo mapeado) se envían
+    sin copiarlos; sólo los headers se copian a un buffer de la tanda.
+    """
+
+    def __init__(self, sock, bufsize):
+        self.socket = sock
+        self.fd = sock.fileno()
+        self.bufsize = bufsize
+        self.poll = select.poll()
+        self.poll.register(self.fd, select.POLLIN)
+        # Envío: dos iovec por mensaje (header y payload)
+        self.send_msgs = (_Mmsghdr * BATCH)()
+        self.send_iov = (_Iovec * (2 * BATCH))()
+        self.headers = ctypes.create_string_buffer(HEADER_SLOT * BATCH)
+        self.headers_view = memoryview(self.headers).cast("B")
+        self.sockaddr = ctypes.create_string_buffer(SOCKADDR_IN)
+        self.addr = None
+        for i, msg in enumerate(self.send_msgs):
+            msg.msg_hdr.msg_name = ctypes.addressof(self.sockaddr)
+            msg.msg_hdr.msg_namelen = SOCKADDR_IN
+            msg.msg_hdr.msg_iov = ctypes.pointer(self.send_iov[2 * i])
+            msg.msg_hdr.msg_iovlen = 2
+            self.send_iov[2 * i].iov_base = ctypes.addressof(self.headers) + i * HEADER_SLOT
+        # Recepción: un buffer de bufsize y una dirección por mensaje
+        self.recv_msgs = (_Mmsghdr * BATCH)()
+        self.recv_iov = (_Iovec * BATCH)()
+        self.buffers = ctypes.create_string_buffer(bufsize * BATCH)
+        self.names = ctypes.create_string_buffer(SOCKADDR_IN * BATCH)
+        self.buffers_view = memoryview(self.buffers).cast("B")
+        self.names_view = memoryview(self.names).cast("B")
+        for i, msg in enumerate(self.recv_msgs):
+            self.recv_iov[i].iov_base = ctypes.addressof(self.buffers) + i * bufsize
+            self.recv_iov[i].iov_len = bufsize
+            msg.msg_hdr.msg_iov = ctypes.pointer(self.recv_iov[i])
+            msg.msg_hdr.msg_iovlen = 1
+            msg.msg_hdr.msg_name = ctypes.addressof(self.names) + i * SOCKADDR_IN
+            msg.msg_hdr.msg_namelen = SOCKADDR_IN
+        self.received = 0
+        self.last_name = None
+        self.last_addr = None
+
+    def send(self, datagrams, addr):
+        """Envía los datagramas (partes: header, payload) a addr, BATCH por syscall"""
+        self._set_addr(addr)
+        count = 0
+        keep = []  # objetos que apuntan a los payloads hasta que se envían
+        iov = self.send_iov
+        for header, payload in datagrams:
+            # El header puede ser un buffer que el llamador reutiliza: se copia
+            offset = count * HEADER_SLOT
+            self.headers_view[offset:offset + len(header)] = header
+            iov[2 * count].iov_len = len(header)
+            iov[2 * count + 1].iov_base, iov[2 * count + 1].iov_len = self._address(payload, keep)
+            count += 1
+            if count == BATCH:
+                self._sendmmsg(count)
+                count = 0
+                keep.clear()
+        if count:
+            self._sendmmsg(count)
+
+    def _address(self, payload, keep):
+        """Dirección y largo de payload, sin copiarlo si es escribible"""
+        size = len(payload)
+        if size == 0:
+            return None, 0
+        view = memoryview(payload)
+        if view.readonly:
+            buffer = ctypes.create_string_buffer(view.tobytes(), size)
+        else:
+            buffer = (ctypes.c_char * size).from_buffer(view)
+        keep.append(buffer)
+        return ctypes.addressof(buffer), size
+
+    def _set_addr(self, addr):
+        if addr == self.addr:
+            return
+        host, port = addr
+        ip = socket.getaddrinfo(host, port, socket.AF_INET, socket.SOCK_DGRAM)[0][4][0]
+        name = SOCKADDR_FAMILY.pack(socket.AF_INET) + SOCKADDR_PORT.pack(port) + socket.inet_aton(ip)
+        ctypes.memmove(self.sockaddr, name.ljust(SOCKADDR_IN, b"\0"), SOCKADDR_IN)
+        self.addr = addr
+
+    def _sendmmsg(self, count):
+        sent = 0
+        while sent < count:
+            result = _libc.sendmmsg(self.fd, ctypes.addressof(self.send_msgs) + sent * ctypes.sizeof(_Mmsghdr), count - sent, 0)
+            if result >= 0:
+                sent += result
+                continue
+            error = ctypes.get_errno()
+            if error == errno.EINTR:
+                continue
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK):
+                # Socket no bloqueante con el buffer lleno: esperar a que se libere
+                select.select([], [self.fd], [])
+                continue
+            raise OSError(error, os.strerror(error))
+
+    def recv(self, timeout):
+        """Espera hasta timeout (None: sin límite) y devuelve lo que haya llegado,
+        hasta BATCH datagramas, como [(vista, addr)]. [] si venció el timeout"""
+        wait = -1 if timeout is None else math.ceil(timeout * 1000)
+        if wait != 0 and not self.poll.poll(wait):
+            return []
+        # El kernel pisa msg_namelen: se restaura en los que se usaron
+        for i in range(self.received):
+            self.recv_msgs[i].msg_hdr.msg_namelen = SOCKADDR_IN
+        while True:
+            result = _libc.recvmmsg(self.fd, ctypes.addressof(self.recv_msgs), BATCH, MSG_DONTWAIT, None)
+            if result >= 0:
+                break
+            error = ctypes.get_errno()
+            if error == errno.EINTR:
+                continue
+            if error in (errno.EAGAIN, errno.EWOULDBLOCK):
+                self.received = 0
+                return []
+            raise OSError(error, os.strerror(error))
+        self.received = result
+        datagrams = []
+        for i in range(result):
+            start = i * self.bufsize
+            datagram = self.buffers_view[start:start + min(self.recv_msgs[i].msg_len, self.bufsize)]
+            datagrams.append((datagram, self._source(i)))
+        return datagrams
+
+    def _source(self, i):
+        """(ip, puerto) de quien envió el datagrama i"""
+        name = bytes(self.names_view[i * SOCKADDR_IN:i * SOCKADDR_IN + 8])
+        if name != self.last_name:
+            port = SOCKADDR_PORT.unpack_from(name, 2)[0]
+            self.last_name, self.last_addr = name, (socket.inet_ntoa(name[4:8]), port)
+        return self.last_addr
@@ -0,0 +1,325 @@
+import contextlib
+import io
+import itertools
+import json
+import logging
+import math
+import os
+import platform
+import random
+import resource
+import shlex
+import shutil
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+from . import handshake, simulation, storage
+from .relay import Impairments, LossyRelay
+
+# Benchmark reproducible en loopback: levanta start-server, pasa los clientes
+# por un relay con enlace degradado (ver lib/relay.py) y barre tamaño x
+# protocolo x pérdida x ventana x MSS. Cada caso se corre `repeat` veces y se
+# resume en goodput, retransmisiones, percentiles del tiempo y CPU por MB.
+# Con --simulated las transferencias corren en proceso sobre la red simulada
+# (ver lib/simulation.py): los tiempos son virtuales y el resultado, exacto.
+'''DEFAULTS DEL BARRIDO'''
+DEFAULT_SIZES = "100K,1M"
+DEFAULT_PROTOCOLS = "stop-and-wait,selective-repeat,fec"
+DEFAULT_LOSS = "0,0.02"
+DEFAULT_REPEAT = 3
+DEFAULT_TOLERANCE = 0.25
+RUN_TIMEOUT = 120
+'''PROCESOS'''
+SRC_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_STARTUP = 0.5
+SERVER_SHUTDOWN = 5.0
+SIZE_UNITS = {"K": 1024, "M": 1024 ** 2, "G": 1024 ** 3}
+# Diferencia mínima de la tasa de retransmisión que cuenta como regresión
+RETRANSMISSION_SLACK = 0.01
+
+
+def parse_size(text):
+    """"100K", "1M" o bytes"""
+    text = text.strip().upper()
+    if text and text[-1] in SIZE_UNITS:
+        return int(float(text[:-1]) * SIZE_UNITS[text[-1]])
+    return int(text)
+
+
+def parse_list(text, convert=str):
+    return [convert(value) for value in text.split(",") if value.strip()]
+
+
+def percentile(values, fraction):
+    """Percentil por rango más cercano: con pocas corridas el p99 es el máximo"""
+    ordered = sorted(values)
+    return ordered[max(math.ceil(fraction * len(ordered)) - 1, 0)]
+
+
+def free_port(host):
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((host, 0))
+        return sock.getsockname()[1]
+
+
+def process_cpu(pid):
+    """Segundos de CPU (usuario + sistema) de un proceso, o None fuera de Linux"""
+    try:
+        with open(f"/proc/{pid}/stat") as stat:
+            fields = stat.read().rsplit(")", 1)[1].split()
+    except OSError:
+        return None
+    # utime y stime son los campos 14 y 15; acá, tras el nombre, los 12 y 13
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+def children_cpu():
+    usage = resource.getrusage(resource.RUSAGE_CHILDREN)
+    return usage.ru_utime + usage.ru_stime
+
+
+class Server:
+    """start-server en un puerto libre, con un storage temporal"""
+
+    def __init__(self, host, storage_dir, extra_args=""):
+        self.port = free_port(host)
+        self.storage = storage_dir
+        command = [sys.executable, "start-server", "-H", host, "-p", str(self.port), "-s", storage_dir, "-q"]
+        self.process = subprocess.Popen(command + shlex.split(extra_args), cwd=SRC_DIR, stdin=subprocess.PIPE,
+                                        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        time.sleep(SERVER_STARTUP)
+        if self.process.poll() is not None:
+            raise RuntimeError(f"start-server terminó al iniciar (código {self.process.returncode})")
+
+    def cpu(self):
+        return process_cpu(self.process.pid)
+
+    def close(self):
+        try:
+            self.process.stdin.write(b"q\n")
+            self.process.stdin.flush()
+            self.process.wait(SERVER_SHUTDOWN)
+        except (OSError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+
+
+def case_key(case, impairments, simulated=False):
+    """Identifica un caso para compararlo con el baseline"""
+    return (f"{'sim ' if simulated else ''}{case['direction']} {case['protocol']} {case['size']}B loss={impairments.loss} "
+            f"delay={impairments.delay * 1000:g}ms jitter={impairments.jitter * 1000:g}ms "
+            f"reorder={impairments.reorder} dup={impairments.duplicate} win={case['window']} mss={case['mss']}")
+
+
+def run_client(host, port, case, local_path, name, timeout):
+    """Corre upload o download. Devuelve (código, segundos, CPU del cliente)"""
+    command = [sys.executable, case["direction"], "-H", host, "-p", str(port), "-n", name,
+               "-r", case["protocol"], "--mss", str(case["mss"]), "--window", str(case["window"]), "-q"]
+    command += ["-s" if case["direction"] == "upload" else "-d", local_path]
+    cpu_before = children_cpu()
+    start = time.monotonic()
+    try:
+        code = subprocess.run(command, cwd=SRC_DIR, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+                              timeout=timeout).returncode
+    except subprocess.TimeoutExpired:
+        code = None
+    return code, time.monotonic() - start, children_cpu() - cpu_before
+
+
+def run_case(server, relay, host, case, workdir, sources, repeat, timeout):
+    """Corre un caso `repeat` veces y resume las mediciones"""
+    size = case["size"]
+    source, digest = sources[size]
+    name = f"bench-{size}"
+    stored = os.path.join(server.storage, name)
+    times, ratios, cpus, failures = [], [], [], 0
+    for _ in range(repeat):
+        if case["direction"] == "upload":
+            local, result = source, stored
+        else:
+            if not os.path.exists(stored):
+                shutil.copyfile(source, stored)
+            local = result = os.path.join(workdir, name)
+        # Sin el resultado anterior: una subida no se deduplica y una descarga fallida no pasa por buena
+        if os.path.exists(result):
+            os.unlink(result)
+        relay.reset_stats()
+        server_cpu = server.cpu()
+        code, elapsed, client_cpu = run_client(host, relay.port, case, local, name, timeout)
+        if code != 0 or not os.path.exists(result) or storage.file_digest(result) != digest:
+            failures += 1
+            logging.warning(f"Corrida fallida ({'timeout' if code is None else f'código {code}'}): {case}")
+            continue
+        times.append(elapsed)
+        packets = max(math.ceil(size / case["mss"]), 1)
+        ratios.append(max(relay.stats["data"] / packets - 1, 0.0))
+        if server_cpu is not None:
+            client_cpu += server.cpu() - server_cpu
+        cpus.append(client_cpu / (size / 1e6))
+    return summarize(case, repeat, failures, times, ratios, cpus)
+
+
+def run_simulated_case(case, impairments, workdir, sources, repeat, seed, bandwidth=None):
+    """Como run_case, en la red simulada: cada corrida con su seed y tiempos virtuales"""
+    size = case["size"]
+    source, digest = sources[size]
+    name = f"bench-{size}"
+    times, ratios, cpus, failures = [], [], [], 0
+    client_options = {"mss": case["mss"], "window": case["window"]}
+    for run in range(repeat):
+        storage_dir = tempfile.mkdtemp(prefix="storage.", dir=workdir)
+        stored = os.path.join(storage_dir, name)
+        if case["direction"] == "upload":
+            local, result = source, stored
+        else:
+            shutil.copyfile(source, stored)
+            local = result = os.path.join(workdir, name)
+            if os.path.exists(result):
+                os.unlink(result)
+        network = simulation.SimulatedNetwork(impairments, seed + run, bandwidth)
+        cpu_before = time.process_time()
+        # Los logs y barras de progreso de cliente y servidor no van al reporte
+        logging.disable(logging.CRITICAL)
+        try:
+            with contextlib.redirect_stdout(io.StringIO()):
+                success, elapsed = simulation.run_transfer(network, case["direction"], case["protocol"], local,
+                                                           storage_dir, name, client_options)
+        finally:
+            logging.disable(logging.NOTSET)
+        cpu = time.process_time() - cpu_before
+        ok = success and os.path.exists(result) and storage.file_digest(result) == digest
+        shutil.rmtree(storage_dir, ignore_errors=True)
+        if not ok:
+            failures += 1
+            logging.warning(f"Corrida simulada fallida (seed {seed + run}): {case}")
+            continue
+        times.append(elapsed)
+        packets = max(math.ceil(size / case["mss"]), 1)
+        ratios.append(max(network.stats["data"] / packets - 1, 0.0))
+        cpus.append(cpu / (size / 1e6))
+    return summarize(case, repeat, failures, times, ratios, cpus)
+
+
+def summarize(case, repeat, failures, times, ratios, cpus):
+    """Resultado de un caso a partir de sus corridas exitosas"""
+    result = dict(case, runs=repeat, failures=failures)
+    if times:
+        median = statistics.median(times)
+        result.update(
+            # None: en la red simulada sin demora ni bandwidth no pasa tiempo virtual
+            goodput_mb_s=round(case["size"] / 1e6 / median, 3) if median > 0 else None,
+            retransmission_ratio=round(statistics.mean(ratios), 4),
+            completion_p50_s=round(percentile(times, 0.5), 4),
+            completion_p99_s=round(percentile(times, 0.99), 4),
+            cpu_s_per_mb=round(statistics.mean(cpus), 4),
+        )
+    return result
+
+
+def sweep(args):
+    """Corre el barrido que piden los args y devuelve el reporte (dict serializable a JSON)"""
+    host = args.host or "127.0.0.1"
+    sizes = parse_list(args.sizes or DEFAULT_SIZES, parse_size)
+    protocols = parse_list(args.protocols or DEFAULT_PROTOCOLS)
+    losses = parse_list(args.loss or DEFAULT_LOSS, float)
+    windows = parse_list(args.windows or str(handshake.DEFAULT_WINDOW), int)
+    mss_values = parse_list(args.mss or str(handshake.DEFAULT_MSS), int)
+    directions = ["upload", "download"] if args.direction == "both" else [args.direction or "upload"]
+    repeat = args.repeat or DEFAULT_REPEAT
+    timeout = args.timeout or RUN_TIMEOUT
+    seed = args.seed if args.seed is not None else 0
+
+    workdir = tempfile.mkdtemp(prefix="benchmark.")
+    storage_dir = os.path.join(workdir, "storage")
+    os.makedirs(storage_dir)
+    sources = {}
+    generator = random.Random(seed)
+    for size in sizes:
+        path = os.path.join(workdir, f"source-{size}")
+        with open(path, "wb") as file:
+            file.write(generator.randbytes(size))
+        sources[size] = (path, storage.file_digest(path))
+
+    simulated = bool(args.simulated)
+    bandwidth = args.bandwidth * 1e6 if args.bandwidth else None
+    report = {
+        "config": {
+            "delay_ms": args.delay or 0.0, "jitter_ms": args.jitter or 0.0, "reorder": args.reorder or 0.0,
+            "duplicate": args.duplicate or 0.0, "repeat": repeat, "seed": seed, "server_args": args.server_args or "",
+            "simulated": simulated, "bandwidth_mb_s": args.bandwidth if simulated else None,
+            "python": platform.python_version(), "platform": platform.platform(),
+        },
+        "results": [],
+    }
+    server = None if simulated else Server(host, storage_dir, args.server_args or "")
+    try:
+        for loss in losses:
+            impairments = Impairments(loss, (args.delay or 0.0) / 1000, (args.jitter or 0.0) / 1000,
+                                      args.reorder or 0.0, args.duplicate or 0.0)
+            relay = None if simulated else LossyRelay((host, server.port), impairments, seed=seed, host=host,
+                                                      port=args.port or 0)
+            try:
+                for direction, protocol, size, window, mss in itertools.product(directions, protocols, sizes, windows, mss_values):
+                    case = {"direction": direction, "protocol": protocol, "size": size, "loss": loss,
+                            "window": window, "mss": mss}
+                    if simulated:
+                        result = run_simulated_case(case, impairments, workdir, sources, repeat, seed, bandwidth)
+                    else:
+                        result = run_case(server, relay, host, case, workdir, sources, repeat, timeout)
+                    result["case"] = case_key(case, impairments, simulated)
+                    report["results"].append(result)
+                    logging.info(summary_line(result))
+            finally:
+                if relay is not None:
+                    relay.close()
+    finally:
+        if server is not None:
+            server.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+    return report
+
+
+def summary_line(result):
+    if "goodput_mb_s" not in result:
+        return f"{result['case']}: todas las corridas fallaron"
+    goodput = result["goodput_mb_s"]
+    return (f"{result['case']}: " + (f"{goodput:.2f} MB/s" if goodput is not None else "sin tiempo virtual")
+            + f", retransmisión {result['retransmission_ratio']:.1%}, "
+            f"p50 {result['completion_p50_s']:.3f}s, p99 {result['completion_p99_s']:.3f}s, "
+            f"{result['cpu_s_per_mb']:.3f} s CPU/MB" + (f", {result['failures']} fallidas" if result["failures"] else ""))
+
+
+def regressions(report, baseline, tolerance=DEFAULT_TOLERANCE):
+    """Casos que empeoraron respecto del baseline más allá de la tolerancia (fracción)"""
+    previous = {result["case"]: result for result in baseline.get("results", [])}
+    found = []
+    for result in report["results"]:
+        if result["failures"]:
+            found.append(f"{result['case']}: {result['failures']} de {result['runs']} corridas fallaron")
+        base = previous.get(result["case"])
+        if base is None or "goodput_mb_s" not in base or "goodput_mb_s" not in result:
+            continue
+        if None not in (result["goodput_mb_s"], base["goodput_mb_s"]) and \
+                result["goodput_mb_s"] < base["goodput_mb_s"] * (1 - tolerance):
+            found.append(f"{result['case']}: goodput {result['goodput_mb_s']:.2f} MB/s (baseline {base['goodput_mb_s']:.2f})")
+        if result["completion_p99_s"] > base["completion_p99_s"] * (1 + tolerance):
+            found.append(f"{result['case']}: p99 {result['completion_p99_s']:.3f}s (baseline {base['completion_p99_s']:.3f}s)")
+        if result["retransmission_ratio"] > base["retransmission_ratio"] * (1 + tolerance) + RETRANSMISSION_SLACK:
+            found.append(f"{result['case']}: retransmisión {result['retransmission_ratio']:.1%} "
+                         f"(baseline {base['retransmission_ratio']:.1%})")
+    return found
+
+
+def load_report(path):
+    with open(path) as file:
+        return json.load(file)
+
+
+def save_report(report, path):
+    with open(path, "w") as file:
+        json.dump(report, file, indent=2)
+        file.write("\n")
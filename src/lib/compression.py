@@ -0,0 +1,145 @@
+import logging
+import threading
+import zlib
+
+from . import packet
+
+# Compresión por paquete: cada bloque de mss bytes del archivo viaja comprimido
+# con deflate (flag FLAG_COMPRESSED) sólo si se achica; si no, va crudo. El
+# receptor lo descomprime antes de escribirlo en su offset, así que el mapeo
+# seq -> offset no cambia.
+'''CODECS'''
+ZLIB = "zlib"
+CODECS = (ZLIB,)
+# deflate sin header ni checksum: el CRC32 del paquete ya cubre el payload
+WBITS = -15
+LEVEL = 1
+'''ADELANTO'''
+# Bloques que el hilo comprime por delante del último que pidió el emisor
+AHEAD = 256
+'''BLOQUES INCOMPRESIBLES'''
+# Tras esta racha de bloques que no se achican, los siguientes SKIP_BLOCKS
+# salen crudos sin intentarlo (archivos ya comprimidos o aleatorios)
+INCOMPRESSIBLE_RUN = 16
+SKIP_BLOCKS = 256
+
+
+def compress_block(chunk, level=LEVEL):
+    """chunk comprimido, o None si no se achica"""
+    payload = zlib.compress(chunk, level, WBITS)
+    return payload if len(payload) < len(chunk) else None
+
+
+def decompress_block(payload, limit):
+    """Descomprime un bloque de a lo sumo limit bytes. ValueError si es inválido"""
+    decompressor = zlib.decompressobj(WBITS)
+    try:
+        data = decompressor.decompress(payload, limit)
+    except zlib.error as e:
+        raise ValueError(f"Bloque comprimido inválido: {e}") from e
+    if not decompressor.eof or decompressor.unconsumed_tail:
+        raise ValueError(f"Bloque comprimido incompleto o de más de {limit} bytes")
+    return data
+
+
+class CompressedSource:
+    """Fuente (ver storage.Source) que entrega los bloques comprimidos.
+
+    Un hilo comprime los bloques de block_size bytes hasta AHEAD bloques por
+    delante del que pidió el emisor, así la compresión no frena el loop de
+    envío. Cada bloque se guarda hasta que release() lo da por confirmado,
+    para que una retransmisión no lo vuelva a comprimir.
+    """
+
+    def __init__(self, source, length, block_size, level=LEVEL):
+        self.source = source
+        self.length = length
+        self.block_size = block_size
+        self.level = level
+        self.blocks = {}  # {offset: payload comprimido, o None si va crudo}
+        self.produced = 0  # offset del próximo bloque que comprime el hilo
+        self.wanted = 0  # el hilo comprime hasta este offset
+        self.closed = False
+        self.cond = threading.Condition()
+        # Estadísticas: bytes del archivo y bytes que salen, y bloques crudos
+        self.raw_bytes = 0
+        self.packed_bytes = 0
+        self.raw_blocks = 0
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    def chunk(self, offset, length):
+        return self.source.chunk(offset, length)
+
+    def block(self, offset, length):
+        """(flags, payload) del paquete que lleva ese tramo"""
+        with self.cond:
+            ahead = min(offset + AHEAD * self.block_size, self.length)
+            if ahead > self.wanted:
+                self.wanted = ahead
+                self.cond.notify_all()
+            while offset >= self.produced and offset < self.length and not self.closed:
+                self.cond.wait()
+            payload = self.blocks.get(offset, False)
+        if payload is False:
+            # Ya confirmado o el hilo terminó: se comprime acá
+            payload = compress_block(self.source.chunk(offset, length), self.level)
+        if payload is None:
+            return 0, self.source.chunk(offset, length)
+        return packet.FLAG_COMPRESSED, payload
+
+    def release(self, offset):
+        """El bloque en offset ya fue confirmado"""
+        with self.cond:
+            self.blocks.pop(offset, None)
+
+    def _run(self):
+        incompressible = skip = 0
+        try:
+            while True:
+                with self.cond:
+                    while not self.closed and self.produced >= self.wanted:
+                        self.cond.wait()
+                    if self.closed:
+                        return
+                    offset = self.produced
+                chunk = self.source.chunk(offset, min(self.block_size, self.length - offset))
+                if skip:
+                    skip -= 1
+                    payload = None
+                else:
+                    payload = compress_block(chunk, self.level)
+                    incompressible = incompressible + 1 if payload is None else 0
+                    if incompressible >= INCOMPRESSIBLE_RUN:
+                        incompressible, skip = 0, SKIP_BLOCKS
+                with self.cond:
+                    self.blocks[offset] = payload
+                    self.produced = offset + self.block_size
+                    self.raw_bytes += len(chunk)
+                    self.packed_bytes += len(chunk) if payload is None else len(payload)
+                    self.raw_blocks += payload is None
+                    self.cond.notify_all()
+        except Exception as e:
+            logging.error(f"Error en el hilo de compresión: {e}")
+            with self.cond:
+                self.closed = True
+                self.cond.notify_all()
+
+    def summary(self):
+        ratio = self.raw_bytes / self.packed_bytes if self.packed_bytes else 1.0
+        return (f"Compresión: {self.raw_bytes:,} bytes enviados como {self.packed_bytes:,} "
+                f"({ratio:.2f}x, {self.raw_blocks} bloques crudos)")
+
+    def close(self):
+        with self.cond:
+            self.closed = True
+            self.cond.notify_all()
+        self.thread.join()
+        logging.info(self.summary())
+        self.source.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -0,0 +1,130 @@
+'''VENTANA (en paquetes)'''
+INITIAL_CWND = 10
+MIN_CWND = 2
+'''VEGAS'''
+VEGAS_ALPHA = 2
+VEGAS_BETA = 4
+VEGAS_GAMMA = 1
+
+
+class CongestionController:
+    """Interfaz de control de congestión. La ventana se mide en paquetes"""
+
+    name = None
+
+    def __init__(self, max_window):
+        self.max_window = max_window
+        self.cwnd = float(min(INITIAL_CWND, max_window))
+        self.ssthresh = float(max_window)
+
+    @property
+    def window(self):
+        """Ventana de congestión entera, al menos MIN_CWND"""
+        return max(int(self.cwnd), MIN_CWND)
+
+    def on_ack(self, acked, rtt_sample):
+        """Se confirmaron `acked` paquetes nuevos. rtt_sample puede ser None"""
+
+    def on_loss(self):
+        """Pérdida detectada sin timeout (p. ej. por SACK)"""
+
+    def on_timeout(self):
+        """Venció un timer de retransmisión"""
+
+
+class FixedWindow(CongestionController):
+    """Ventana fija: el comportamiento previo de WINDOW_SIZE constante"""
+
+    name = "fixed"
+
+    def __init__(self, max_window, window=32):
+        super().__init__(max_window)
+        self.cwnd = float(min(window, max_window))
+
+
+class NewReno(CongestionController):
+    """AIMD con slow start al estilo TCP NewReno"""
+
+    name = "newreno"
+
+    def on_ack(self, acked, rtt_sample):
+        if self.cwnd < self.ssthresh:
+            # Slow start: +1 paquete por cada paquete confirmado
+            self.cwnd += acked
+        else:
+            # Congestion avoidance: +1 paquete por RTT
+            self.cwnd += acked / self.cwnd
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def on_loss(self):
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = self.ssthresh
+
+    def on_timeout(self):
+        self.ssthresh = max(self.cwnd / 2, MIN_CWND)
+        self.cwnd = 1.0
+
+
+class Vegas(NewReno):
+    """Control basado en retardo (TCP Vegas): la ventana sigue la cola estimada.
+
+    Una vez por ronda (una ventana confirmada) se calcula
+    diff = cwnd * (1 - base_rtt / min_rtt), la cantidad estimada de paquetes
+    propios encolados en el camino. Se crece mientras diff < alpha y se achica
+    si supera beta. Usar el mínimo de la ronda filtra el ruido de los ACKs
+    diferidos. Ante pérdidas se comporta como NewReno.
+    """
+
+    name = "vegas"
+
+    def __init__(self, max_window):
+        super().__init__(max_window)
+        self.base_rtt = None
+        self.round_min_rtt = None
+        self.round_acked = 0
+        # Ventana al empezar la ronda: en slow start cwnd crece tanto como round_acked
+        self.round_window = self.cwnd
+
+    def on_ack(self, acked, rtt_sample):
+        if rtt_sample is not None and rtt_sample > 0:
+            if self.base_rtt is None or rtt_sample < self.base_rtt:
+                self.base_rtt = rtt_sample
+            if self.round_min_rtt is None or rtt_sample < self.round_min_rtt:
+                self.round_min_rtt = rtt_sample
+
+        if self.cwnd < self.ssthresh:
+            self.cwnd += acked
+        self.round_acked += acked
+        if self.round_acked >= self.round_window and self.round_min_rtt is not None:
+            self._end_round()
+        self.cwnd = min(self.cwnd, self.max_window)
+
+    def _end_round(self):
+        """Ajusta la ventana con el mínimo RTT observado en la ronda"""
+        diff = self.cwnd * (1 - self.base_rtt / self.round_min_rtt)
+        if self.cwnd < self.ssthresh:
+            if diff > VEGAS_GAMMA:
+                # Sale de slow start apenas aparece cola
+                self.ssthresh = self.cwnd
+        elif diff < VEGAS_ALPHA:
+            self.cwnd += 1
+        elif diff > VEGAS_BETA:
+            self.cwnd = max(self.cwnd - 1, MIN_CWND)
+        self.round_min_rtt = None
+        self.round_acked = 0
+        self.round_window = self.cwnd
+
+
+CONTROLLERS = {
+    NewReno.name: NewReno,
+    Vegas.name: Vegas,
+    FixedWindow.name: FixedWindow,
+}
+DEFAULT = NewReno.name
+
+
+def get_controller(name, max_window):
+    """Instancia el controlador pedido. ValueError si no existe"""
+    if name not in CONTROLLERS:
+        raise ValueError(f"Control de congestión no soportado: {name}")
+    return CONTROLLERS[name](max_window)
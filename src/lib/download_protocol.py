@@ -1,45 +1,133 @@
+import copy
 import socket
 import logging
 
-from lib.selective_repeat_protocol import SelectiveRepeatProtocol
-from lib.stop_and_wait_protocol import StopAndWaitProtocol
+import os
+
+from lib import batch, handshake, metrics, protocols, storage, transport
 
 TIMEOUT = 2
-BUFFER = 1024
 MAX_RETRIES = 10
 
 
 class DownloadProtocol:
-    def __init__(self, args):
+    def __init__(self, args, network=None):
         self.args = args
-        self.socket = None
+        # Red de las sesiones: UDP real o una simulada (ver lib/transport.py)
+        self.network = network or transport.UdpNetwork()
+        self.transport = None
+        self.filesize = None
+        self.digest = None
 
     def download_file(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        manifest = getattr(self.args, "manifest", None)
+        if manifest or batch.is_pattern(self.args.name):
+            return self._download_batch(manifest)
+        streams = getattr(self.args, "streams", None) or 1
+        if streams > 1:
+            success = self._download_streams(streams)
+        elif getattr(self.args, "resume", False):
+            success = self._download_session(handshake.part_options(0, 1, resume=self._resume_ranges()))
+        else:
+            success = self._download_session()
+        return success and self._verify_digest()
+
+    def _download_batch(self, manifest):
+        """Descarga en una sola sesión los archivos que coinciden con la lista o el patrón.
+
+        Cada archivo se verifica con su digest al separar el lote en el
+        directorio destino.
+        """
+        try:
+            names = batch.LIST_SEPARATOR.join(batch.read_manifest(manifest)) if manifest else self.args.name
+        except OSError as e:
+            logging.error(f"Error: No se pudo leer el manifiesto: {e}")
+            return False
+        if len(names.encode()) > batch.MAX_LIST:
+            logging.error(f"Error: La lista de archivos no entra en el saludo (máximo {batch.MAX_LIST} bytes), usá un patrón")
+            return False
+        if (getattr(self.args, "streams", None) or 1) > 1 or getattr(self.args, "resume", False):
+            logging.warning("CLIENTE: Un lote se descarga en una sola sesión, se ignoran --streams y --resume")
+        os.makedirs(self.args.dst, exist_ok=True)
+        self.args.name = names
+        return self._download_session({handshake.OPT_BATCH: 1})
+
+    def _verify_digest(self):
+        """Compara el archivo descargado con el digest que anunció el servidor"""
+        if self.digest is None:
+            return True
+        file_path = storage.download_path(self.args)
+        if storage.file_digest(file_path) == self.digest:
+            logging.info(f"CLIENTE: Digest verificado (sha256 {self.digest[:12]}...)")
+            return True
+        logging.error("CLIENTE: El archivo descargado no coincide con el digest del servidor")
+        # Lo recibido no es confiable: no se reanuda sobre esto
+        storage.Journal.for_file(file_path).remove()
+        return False
+
+    def _resume_ranges(self):
+        """Rangos que ya están en el destino según su journal"""
+        ranges = storage.Journal.for_file(storage.download_path(self.args)).ranges()
+        if ranges:
+            logging.info(f"CLIENTE: Reanudando descarga, ya se tienen {sum(end - start for start, end in ranges):,} bytes")
+        return handshake.format_ranges(ranges)
+
+    def _download_streams(self, streams):
+        """Descarga el archivo en `streams` porciones por sesiones concurrentes"""
+        logging.info(f"CLIENTE: Descargando en {streams} porciones en paralelo")
+
+        # Cada porción con su transporte y su copia de args (la sesión cambia el puerto)
+        downloads = [DownloadProtocol(copy.copy(self.args), self.network) for _ in range(streams)]
+        if getattr(self.args, "resume", False):
+            resume = self._resume_ranges()
+        else:
+            # Se empieza de cero: lo que anotó un intento anterior no vale para este
+            resume = None
+            storage.Journal.for_file(storage.download_path(self.args)).remove()
+        results = [False] * streams
+
+        def run(index):
+            try:
+                results[index] = downloads[index]._download_session(
+                    handshake.part_options(index, streams, resume=resume)
+                )
+            finally:
+                downloads[index].close()
+
+        threads = [self.network.start_thread(run, i) for i in range(streams)]
+        for thread in threads:
+            thread.join()
 
-        protocol = self.args.protocol if self.args.protocol else "stop-and-wait"
+        # Si el archivo cambió entre saludos las porciones no encajan
+        if len({(download.filesize, download.digest) for download in downloads}) > 1:
+            logging.error("CLIENTE: El archivo cambió en el servidor durante la descarga")
+            return False
+        self.filesize, self.digest = downloads[0].filesize, downloads[0].digest
+        return all(results)
 
-        handshake_msg = f"DOWNLOAD_CLIENT:{protocol}:{self.args.name}"
+    def _download_session(self, part_options=None):
+        self.transport = self.network.open()
+
+        protocol = self.args.protocol or protocols.DEFAULT
+
+        options = protocols.session_options(self.args, self.transport, protocol)
+        options.update(part_options or {})
+        handshake_msg = handshake.format_message(
+            "DOWNLOAD_CLIENT", protocol, self.args.name, options=options,
+        )
         logging.info(f"CLIENTE: Enviando solicitud: {handshake_msg}")
 
         retries = 0
         current_timeout = TIMEOUT
         while retries < MAX_RETRIES:
-            self.socket.sendto(handshake_msg.encode(), (self.args.host, self.args.port))
+            self.transport.sendto(handshake_msg.encode(), (self.args.host, self.args.port))
             try:
-                self.socket.settimeout(current_timeout)
-                data, _ = self.socket.recvfrom(BUFFER)
-                response = data.decode()
+                response, _ = handshake.wait_response(self.transport, current_timeout)
 
                 if response.startswith("DOWNLOAD_OK:"):
-                    # Formato: "DOWNLOAD_OK:new_port:filesize"
-                    parts = response.split(":")
-                    if len(parts) != 3:
-                        logging.error(
-                            f"CLIENTE: Respuesta inválida del servidor: {response}"
-                        )
-                        continue
+                    # Formato: "DOWNLOAD_OK:new_port:filesize[:opciones]"
                     try:
+                        parts, options = handshake.parse_message(response, 3)
                         new_port = int(parts[1])
                         filesize = int(parts[2])
                     except ValueError:
@@ -48,6 +136,12 @@ class DownloadProtocol:
                         )
                         continue
 
+                    if not handshake.check_accepted(options):
+                        logging.error(
+                            f"CLIENTE: Formato de paquetes no soportado: {response}"
+                        )
+                        return False
+
                     if filesize <= 0:
                         logging.error(
                             f"CLIENTE: Tamaño de archivo inválido: {filesize}"
@@ -57,21 +151,37 @@ class DownloadProtocol:
                     logging.info(
                         f"CLIENTE: Descarga aceptada. Puerto {new_port}, archivo {filesize} bytes."
                     )
+                    if handshake.OPT_BATCH in options:
+                        logging.info(f"CLIENTE: Lote de {options[handshake.OPT_BATCH]} archivos")
                     self.args.port = new_port
+                    self.filesize = filesize
+                    if handshake.is_digest(options.get(handshake.OPT_DIGEST)):
+                        self.digest = options[handshake.OPT_DIGEST]
 
-                    if protocol == "stop-and-wait":
-                        handler = StopAndWaitProtocol(self.args, self.socket)
-                        return handler.receive_download(filesize)
-                    elif protocol == "selective-repeat":
-                        handler = SelectiveRepeatProtocol(self.args, self.socket)
-                        return handler.receive_download(filesize)
+                    handler = protocols.create_handler(protocol, self.args, self.transport, options)
+                    if handler is None:
+                        logging.error(f"CLIENTE: Protocolo no soportado: {protocol}")
+                        return False
+                    handler.stats = metrics.for_transfer(self.args, "download", protocol, self.args.name,
+                                                         (self.args.host, self.args.port))
+                    success = handler.receive_download(filesize)
+                    metrics.finish(handler.stats, success)
+                    return success
                 elif response == "ERROR:FileNotFound":
                     logging.error(
                         "CLIENTE: El archivo solicitado no existe en el servidor."
                     )
-                    if self.socket:
-                        self.socket.close()
+                    if self.transport:
+                        self.transport.close()
                     return False
+                elif (delay := handshake.retry_after(response)) is not None:
+                    # Servidor lleno: se vuelve cuando dice, sin duplicar el timeout
+                    retries += 1
+                    current_timeout = TIMEOUT
+                    logging.warning(
+                        f"CLIENTE: Servidor ocupado, reintentando en {delay:.2f}s ({retries}/{MAX_RETRIES})"
+                    )
+                    handshake.wait_busy(self.transport, delay)
                 else:
                     logging.error(
                         f"CLIENTE: El servidor rechazó la solicitud: {response}"
@@ -86,12 +196,12 @@ class DownloadProtocol:
                 )
 
         logging.error("CLIENTE: No se pudo establecer conexión con el servidor.")
-        if self.socket:
-            self.socket.close()
+        if self.transport:
+            self.transport.close()
         return False
 
     def close(self):
-        if self.socket:
-            self.socket.close()
-        self.socket = None
+        if self.transport:
+            self.transport.close()
+        self.transport = None
         logging.info("CLIENTE: Socket cerrado.")
@@ -0,0 +1,196 @@
+import logging
+
+from . import packet
+from .selective_repeat_protocol import ReceiveWindow, SelectiveRepeatProtocol, SendWindow
+
+# Corrección de errores hacia adelante sobre Selective Repeat: tras cada grupo
+# de paquetes nuevos se envía un PARITY con el XOR de sus bloques, y el
+# receptor reconstruye un paquete perdido por grupo sin esperar un RTO.
+'''GRUPOS'''
+MIN_GROUP = 2
+MAX_GROUP = 32
+'''PERDIDA'''
+# Pérdida supuesta hasta medirla: grupos de 8
+INITIAL_LOSS = 0.03
+# Peso de cada paquete en el promedio móvil de la pérdida
+LOSS_GAIN = 1 / 128
+# El receptor informa en los flags del SACK cuántos paquetes faltaban al
+# llegar cada paridad (contador acumulado, módulo 2^16)
+LOSS_COUNTER = 0xFFFF
+# El grupo se elige para que espere 1 / LOSS_FACTOR pérdidas: con dos en un
+# mismo grupo ya no alcanza la paridad
+LOSS_FACTOR = 4
+
+
+def group_size(loss_rate):
+    """Paquetes por paridad para una tasa de pérdida"""
+    if loss_rate <= 0:
+        return MAX_GROUP
+    return min(max(int(1 / (LOSS_FACTOR * loss_rate)), MIN_GROUP), MAX_GROUP)
+
+
+class FecSendWindow(SendWindow):
+    """Emisor Selective Repeat que cierra cada grupo de seq nuevos con su paridad.
+
+    La pérdida la mide el receptor, que la reconstruye antes de que el
+    emisor vea el hueco: la informa en los flags de los SACKs y se promedia
+    sobre los seq que va confirmando. Las retransmisiones no llevan paridad.
+    """
+
+    def __init__(self, protocol, source, file_size):
+        super().__init__(protocol, source, file_size)
+        self.group_start = 0
+        self.group_parity = 0  # XOR de los bloques del grupo, como entero
+        self.group_size = group_size(INITIAL_LOSS)
+        self.loss_rate = INITIAL_LOSS
+        self.loss_checked = 0  # seq desde el que falta contar la pérdida
+        self.loss_reported = 0  # último contador de pérdidas del receptor
+        self.parity_sent = 0
+
+    @property
+    def packets_sent(self):
+        return super().packets_sent + self.parity_sent
+
+    def new_datagrams(self):
+        proto = self.protocol
+        for seq_num in self.fill():
+            yield self.datagram(seq_num)
+            offset = seq_num * proto.mss
+            chunk = self.source.chunk(offset, min(proto.mss, self.file_size - offset))
+            self.group_parity ^= int.from_bytes(chunk, "little")
+            count = seq_num + 1 - self.group_start
+            if count >= self.group_size or self.bytes_sent >= self.file_size:
+                yield self._parity(count)
+
+    def _parity(self, count):
+        """Header y payload del PARITY del grupo actual; abre el siguiente"""
+        proto = self.protocol
+        payload = bytearray(packet.PARITY_COUNT.pack(count)) + self.group_parity.to_bytes(proto.mss, "little")
+        header = packet.pack_header_into(bytearray(packet.HEADER_SIZE), packet.PARITY, self.group_start,
+                                         payload, conn_id=proto.conn_id)
+        logging.debug("Paridad de seq %d-%d", self.group_start, self.group_start + count - 1)
+        self.group_start += count
+        self.group_parity = 0
+        self.group_size = group_size(self.loss_rate)
+        self.parity_sent += 1
+        return header, payload
+
+    def on_ack(self, sack):
+        super().on_ack(sack)
+        if sack.type not in (packet.SACK, packet.NACK):
+            return
+        lost = (sack.flags - self.loss_reported) & LOSS_COUNTER
+        checked = packet.sack_highest(sack) + 1 - self.loss_checked
+        if checked <= 0 or lost > LOSS_COUNTER // 2:
+            # SACK atrasado: ya se contó lo que informa
+            return
+        self.loss_reported = sack.flags
+        self.loss_checked += checked
+        weight = min(checked * LOSS_GAIN, 1.0)
+        self.loss_rate += weight * (min(lost / checked, 1.0) - self.loss_rate)
+
+
+class FecReceiveWindow(ReceiveWindow):
+    """Receptor Selective Repeat que reconstruye con la paridad el bloque que falta.
+
+    Los demás bloques del grupo se releen del archivo (ya están escritos en
+    su offset). Si al llegar la paridad falta más de uno, se guarda hasta
+    que llegue alguno de ellos o el grupo quede atrás de la ventana.
+    """
+
+    nack_gaps = False
+
+    def __init__(self, protocol, file):
+        super().__init__(protocol, file)
+        self.parities = {}  # {primer seq: (paquetes, XOR)} de grupos incompletos
+        self.recovered = 0
+        self.lost = 0
+
+    def on_data(self, pkt):
+        ack_now = super().on_data(pkt)
+        for start, (count, _) in list(self.parities.items()):
+            if start + count <= self.base_num:
+                del self.parities[start]
+            elif start <= pkt.seq < start + count:
+                ack_now = self._recover(start) or ack_now
+        return ack_now
+
+    def on_parity(self, pkt):
+        """Guarda la paridad del grupo e intenta reconstruir. True si recuperó un paquete"""
+        if len(pkt.payload) <= packet.PARITY_COUNT.size:
+            return False
+        count = packet.PARITY_COUNT.unpack_from(pkt.payload)[0]
+        start = pkt.seq
+        if not count or start + count <= self.base_num or start + count > self.base_num + self.protocol.window:
+            return False
+        if start in self.parities:
+            return False
+        self.parities[start] = (count, bytes(pkt.payload[packet.PARITY_COUNT.size:]))
+        self.lost += len(self._missing(start, count))
+        self.sack_flags = self.lost & LOSS_COUNTER
+        return self._recover(start)
+
+    def _missing(self, start, count):
+        """Seq del grupo que todavía no llegaron"""
+        return [seq for seq in range(max(start, self.base_num), start + count)
+                if not self.received >> (seq - self.base_num) & 1]
+
+    def _recover(self, start):
+        count, parity = self.parities[start]
+        missing = self._missing(start, count)
+        if len(missing) > 1:
+            return False
+        del self.parities[start]
+        if not missing:
+            return False
+
+        lost = missing[0]
+        mss = self.protocol.mss
+        value = int.from_bytes(parity, "little")
+        for seq_num in range(start, start + count):
+            if seq_num != lost:
+                value ^= int.from_bytes(self.file.read_at(seq_num * mss, mss), "little")
+        length = min(mss, self.file.length - lost * mss)
+        if length <= 0:
+            return False
+        self._write(lost, value.to_bytes(mss, "little")[:length])
+        self.recovered += 1
+        logging.debug("Paquete seq=%d reconstruido con la paridad", lost)
+        return True
+
+
+class FecProtocol(SelectiveRepeatProtocol):
+    """Selective Repeat con paridad XOR por grupos de paquetes.
+
+    Un paquete perdido por grupo se reconstruye sin ida y vuelta; si se
+    pierden más, los recupera Selective Repeat con SACKs y timers. El tamaño
+    del grupo (la redundancia) sigue a la pérdida que mide el emisor.
+    """
+
+    # La paridad lleva la cantidad de paquetes del grupo antes del bloque
+    datagram_overhead = packet.PARITY_COUNT.size
+
+    def __init__(self, args, client_transport, options=None):
+        super().__init__(args, client_transport, options)
+        self.max_datagram += self.datagram_overhead
+        # Ventana de la transferencia en curso, para el resumen final
+        self.fec_window = None
+
+    def send_window(self, source, file_size):
+        self.fec_window = FecSendWindow(self, source, file_size)
+        return self.fec_window
+
+    def receive_window(self, file):
+        self.fec_window = FecReceiveWindow(self, file)
+        return self.fec_window
+
+    def _send_file(self, source, file_size, dest_addr):
+        success = super()._send_file(source, file_size, dest_addr)
+        window = self.fec_window
+        logging.info(f"FEC: {window.parity_sent} paquetes de paridad, pérdida estimada {window.loss_rate:.1%}")
+        return success
+
+    def _receive_file(self, file, filesize, sender_addr):
+        result = super()._receive_file(file, filesize, sender_addr)
+        logging.info(f"FEC: {self.fec_window.recovered} paquetes reconstruidos con la paridad")
+        return result
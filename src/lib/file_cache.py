@@ -0,0 +1,96 @@
+import logging
+import os
+import threading
+from collections import OrderedDict
+
+from . import storage
+
+'''TAMAÑO'''
+DEFAULT_MAX_MB = 256
+
+
+class FileCache:
+    """Caché LRU de archivos mapeados del storage, compartida por las descargas.
+
+    Cada entrada es el mmap de un archivo junto con su inodo, tamaño y mtime:
+    si el archivo se reemplazó (una subida publica con un rename), el stat ya
+    no coincide y se vuelve a mapear. Las descargas concurrentes del mismo
+    archivo usan el mismo mapeo. El tope es la suma de los tamaños mapeados;
+    un mapeo desalojado sigue vivo mientras alguna descarga lo use.
+    """
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.entries = OrderedDict()  # {path: (clave de stat, mmap)}
+        self.size = 0
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def open(self, path, start=0):
+        """Fuente para enviar path desde start (ver storage.Source)"""
+        stat = os.stat(path)
+        key = _key(stat)
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is not None and entry[0] == key:
+                self.entries.move_to_end(path)
+                self.hits += 1
+                return storage.Source(path, start, entry[1])
+            self.misses += 1
+            self._remove(path)
+
+        if not stat.st_size or stat.st_size > self.max_bytes:
+            # Vacío o más grande que toda la caché: se envía sin cachear
+            return storage.Source(path, start)
+        mapping, stat = storage.map_file(path)
+        if mapping is None:
+            return storage.Source(path, start)
+        with self.lock:
+            self._remove(path)
+            self.entries[path] = (_key(stat), mapping)
+            self.size += stat.st_size
+            while self.size > self.max_bytes:
+                evicted, (evicted_key, _) = self.entries.popitem(last=False)
+                self.size -= evicted_key[1]
+                self.evictions += 1
+                logging.debug(f"Caché: se desaloja {evicted}")
+        return storage.Source(path, start, mapping)
+
+    def invalidate(self, path):
+        """Olvida path (p. ej. porque una subida lo reemplazó)"""
+        with self.lock:
+            self._remove(path)
+
+    def stats(self):
+        with self.lock:
+            return {
+                "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                "files": len(self.entries), "bytes": self.size,
+            }
+
+    def summary(self):
+        stats = self.stats()
+        return (f"Caché de archivos: {stats['hits']} aciertos, {stats['misses']} fallos, "
+                f"{stats['evictions']} desalojos, {stats['files']} archivos ({stats['bytes']:,} bytes)")
+
+    def _remove(self, path):
+        entry = self.entries.pop(path, None)
+        if entry is not None:
+            self.size -= entry[0][1]
+
+
+def from_args(args):
+    """Caché del servidor según --cache-size (MB). None si se desactivó con 0"""
+    size_mb = getattr(args, "cache_size", None)
+    if size_mb is None:
+        size_mb = DEFAULT_MAX_MB
+    if size_mb <= 0:
+        return None
+    return FileCache(size_mb * 1024 * 1024)
+
+
+def _key(stat):
+    # El tamaño va segundo: _remove y el desalojo lo usan para llevar la cuenta
+    return (stat.st_ino, stat.st_size, stat.st_mtime_ns)
@@ -11,12 +11,81 @@ fields.server_port = ProtoField.uint16("filetransfer_g8.port", "Server Port")
 fields.error_msg = ProtoField.string("filetransfer_g8.error", "Error Message")
 fields.status = ProtoField.string("filetransfer_g8.status", "Status")
 
+-- Campos del header binario (ver lib/packet.py)
+-- version (8) | tipo (8) | flags (16) | id de conexión (32) | seq/offset (64) | largo del payload (32) | crc32 (32)
+local WIRE_VERSION = 3
+local HEADER_SIZE = 24
+local packet_types = { [1] = "DATA", [2] = "ACK", [3] = "FIN", [4] = "SACK", [5] = "PROBE", [6] = "PARITY", [7] = "NACK", [8] = "FIN_ACK" }
+fields.wire_version = ProtoField.uint8("filetransfer_g8.version", "Wire Version")
+fields.packet_type = ProtoField.uint8("filetransfer_g8.type", "Packet Type", base.DEC, packet_types)
+fields.flags = ProtoField.uint16("filetransfer_g8.flags", "Flags", base.HEX)
+fields.flag_compressed = ProtoField.bool("filetransfer_g8.flags.compressed", "Compressed (deflate)", 16, nil, 0x0001)
+fields.flag_rejected = ProtoField.bool("filetransfer_g8.flags.rejected", "Rejected", 16, nil, 0x0001)
+fields.conn_id = ProtoField.uint32("filetransfer_g8.conn_id", "Connection ID")
+fields.seq = ProtoField.uint64("filetransfer_g8.seq", "Sequence")
+fields.payload_len = ProtoField.uint32("filetransfer_g8.payload_len", "Payload Length")
+fields.crc = ProtoField.uint32("filetransfer_g8.crc", "CRC32", base.HEX)
+fields.payload = ProtoField.bytes("filetransfer_g8.payload", "Payload")
+fields.sack_window = ProtoField.uint32("filetransfer_g8.sack_window", "Advertised Window")
+fields.sack_bitmap = ProtoField.bytes("filetransfer_g8.sack_bitmap", "SACK Bitmap")
+
+-- Un paquete binario tiene version conocida, tipo conocido y largo consistente.
+-- El largo se compara con el del datagrama original: los registros de --trace
+-- (ver lib/trace.py) sólo capturan el header
+local function is_binary_packet(buffer)
+    if buffer:len() < HEADER_SIZE then return false end
+    if buffer(0, 1):uint() ~= WIRE_VERSION then return false end
+    if packet_types[buffer(1, 1):uint()] == nil then return false end
+    return HEADER_SIZE + buffer(16, 4):uint() == buffer:reported_len()
+end
+
+local function dissect_binary(buffer, pinfo, tree)
+    local ptype = buffer(1, 1):uint()
+    local conn_id = buffer(4, 4):uint()
+    local seq = buffer(8, 8):uint64()
+    local length = buffer(16, 4):uint()
+    local type_name = packet_types[ptype]
+    -- Bytes del payload que están en la captura (pueden faltar todos)
+    local captured = math.min(length, buffer:len() - HEADER_SIZE)
+
+    local subtree = tree:add(file_transfer_proto, buffer(), type_name .. " Packet")
+    subtree:add(fields.wire_version, buffer(0, 1))
+    subtree:add(fields.packet_type, buffer(1, 1))
+    local flags_tree = subtree:add(fields.flags, buffer(2, 2))
+    if type_name == "FIN_ACK" then
+        flags_tree:add(fields.flag_rejected, buffer(2, 2))
+    else
+        flags_tree:add(fields.flag_compressed, buffer(2, 2))
+    end
+    subtree:add(fields.conn_id, buffer(4, 4))
+    subtree:add(fields.seq, buffer(8, 8))
+    subtree:add(fields.payload_len, buffer(16, 4))
+    subtree:add(fields.crc, buffer(20, 4))
+    if (type_name == "SACK" or type_name == "NACK") and captured >= 4 then
+        -- seq = ACK acumulativo; payload = ventana anunciada (32) | bitmap
+        subtree:add(fields.sack_window, buffer(HEADER_SIZE, 4))
+        if captured > 4 then
+            subtree:add(fields.sack_bitmap, buffer(HEADER_SIZE + 4, captured - 4))
+        end
+    elseif captured > 0 then
+        subtree:add(fields.payload, buffer(HEADER_SIZE, captured))
+    end
+
+    pinfo.cols.info = string.format("%s cid=%d seq=%s len=%d", type_name, conn_id, tostring(seq), length)
+end
+
 function file_transfer_proto.dissector(buffer, pinfo, tree)
     local length = buffer:len()
     if length == 0 then return end
     
-    local data = buffer():string()
     pinfo.cols.protocol = "FileTrans_G8"
+
+    if is_binary_packet(buffer) then
+        dissect_binary(buffer, pinfo, tree)
+        return length
+    end
+
+    local data = buffer():string()
     
     -- Parsear mensajes de tu protocolo real
     if string.match(data, "^UPLOAD_CLIENT:") then
@@ -73,8 +142,8 @@ function file_transfer_proto.dissector(buffer, pinfo, tree)
         
     else
         -- Datos del archivo o ACKs
-        local subtree = tree:add(file_transfer_proto, buffer(), "Data/ACK Packet")
-        pinfo.cols.info = string.format("DATA (%d bytes)", length)
+        local subtree = tree:add(file_transfer_proto, buffer(), "Unknown Packet")
+        pinfo.cols.info = string.format("UNKNOWN (%d bytes)", length)
     end
     
     return length
@@ -83,6 +152,11 @@ end
 -- Heurística para TU protocolo
 function file_transfer_proto.heuristic(buffer, pinfo, tree)
     if buffer:len() == 0 then return false end
+
+    if is_binary_packet(buffer) then
+        file_transfer_proto.dissector(buffer, pinfo, tree)
+        return true
+    end
     
     local data = buffer():string()
     
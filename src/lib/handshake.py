@@ -0,0 +1,282 @@
+import random
+import socket
+
+from . import compression, congestion, storage
+from .packet import HEADER_SIZE, MAX_DATAGRAM, SUPPORTED_VERSIONS
+
+# Mensajes de saludo: campos posicionales seguidos de opciones "clave=valor"
+# Ej: "UPLOAD_CLIENT:selective-repeat:archivo.txt:1024:wire=3:mss=1452:win=1024"
+SEPARATOR = ":"
+MAX_MESSAGE = 1024
+'''OPCIONES'''
+OPT_WIRE = "wire"
+OPT_CONGESTION = "cc"
+OPT_MSS = "mss"  # bytes de payload por paquete de datos
+OPT_WINDOW = "win"  # paquetes que el receptor puede tener en buffer
+OPT_RTO = "rto"  # RTO inicial en ms
+OPT_CONN_ID = "cid"  # id de conexión (servidor asíncrono de un solo socket)
+OPT_PART = "part"  # porción "i/n" del archivo en una transferencia en paralelo
+OPT_RANGE = "range"  # bytes "inicio-fin" de la porción, los calcula el servidor
+OPT_TRANSFER = "xfer"  # id que comparten todas las porciones de una subida
+OPT_DIGEST = "sha256"  # SHA-256 (hex) del archivo completo
+OPT_DEDUP = "dedup"  # el servidor ya tenía el contenido: la subida termina sin datos
+OPT_RESUME = "resume"  # reanudar: en descargas, rangos "a-b,c-d" que ya tiene el cliente
+OPT_COMPRESS = "comp"  # el emisor puede comprimir los paquetes de datos (ver lib/compression.py)
+OPT_BATCH = "batch"  # la sesión mueve un lote de archivos: cuántos (ver lib/batch.py)
+'''LIMITES DE LA SESION'''
+DEFAULT_MSS = 1024
+MIN_MSS = 512
+MAX_MSS = MAX_DATAGRAM - HEADER_SIZE
+DEFAULT_WINDOW = 1024
+# Tope de memoria de la ventana del receptor: mss * win
+MAX_WINDOW_BYTES = 32 * 1024 * 1024
+MAX_RTO_MS = 10000
+MAX_STREAMS = 64
+MAX_TRANSFER_ID = 32
+# Rangos que entran en un saludo sin pasar MAX_MESSAGE
+MAX_RESUME_RANGES = 32
+MAX_BATCH = 1_000_000
+'''SERVIDOR LLENO'''
+# Respuesta "BUSY:<segundos>" al saludo: el servidor no tiene lugar ni en la cola (ver lib/admission.py)
+BUSY = "BUSY"
+MAX_BUSY_WAIT = 60.0
+# Hasta un 25% más de espera al azar: los clientes rechazados juntos no vuelven juntos
+BUSY_JITTER = 0.25
+
+
+def parse_message(message, positional):
+    """Separa un saludo en sus campos posicionales y un dict de opciones"""
+    parts = message.split(SEPARATOR)
+    if len(parts) < positional:
+        raise ValueError(f"Se esperaban {positional} campos: {message}")
+    options = {}
+    for token in parts[positional:]:
+        key, sep, value = token.partition("=")
+        if not sep or not key:
+            raise ValueError(f"Opción inválida '{token}'")
+        options[key] = value
+    return parts[:positional], options
+
+
+def format_message(*fields, options=None):
+    """Arma un saludo a partir de sus campos y opciones"""
+    tokens = [str(field) for field in fields]
+    for key, value in (options or {}).items():
+        tokens.append(f"{key}={value}")
+    return SEPARATOR.join(tokens)
+
+
+def client_options(args, mss=None, rto=None):
+    """Opciones que ofrece el cliente en UPLOAD_CLIENT/DOWNLOAD_CLIENT.
+
+    mss y rto (segundos) vienen del sondeo de MTU cuando se hizo.
+    """
+    options = {OPT_WIRE: ",".join(str(v) for v in SUPPORTED_VERSIONS)}
+    if getattr(args, "congestion", None):
+        options[OPT_CONGESTION] = args.congestion
+    requested_mss = getattr(args, "mss", None)
+    if mss is None or (requested_mss and requested_mss < mss):
+        mss = requested_mss or DEFAULT_MSS
+    options[OPT_MSS] = mss
+    options[OPT_WINDOW] = getattr(args, "window", None) or DEFAULT_WINDOW
+    if rto is not None:
+        options[OPT_RTO] = max(int(rto * 1000), 1)
+    if getattr(args, "compress", False):
+        options[OPT_COMPRESS] = compression.ZLIB
+    return options
+
+
+def _bounded_int(value, default, low, high):
+    """Convierte una opción a entero acotado a [low, high]"""
+    try:
+        return min(max(int(value), low), high)
+    except (TypeError, ValueError):
+        return default
+
+
+def negotiate_options(offered, args):
+    """Servidor: elige las opciones de la sesión. None si no hay versión en común"""
+    try:
+        versions = {int(v) for v in offered.get(OPT_WIRE, "").split(",") if v}
+    except ValueError:
+        return None
+    common = versions.intersection(SUPPORTED_VERSIONS)
+    if not common:
+        return None
+    accepted = {OPT_WIRE: str(max(common))}
+
+    # MSS y ventana: lo menor entre lo ofrecido y los límites del servidor
+    mss = _bounded_int(offered.get(OPT_MSS), DEFAULT_MSS, MIN_MSS, MAX_MSS)
+    max_window = max(MAX_WINDOW_BYTES // mss, 1)
+    accepted[OPT_MSS] = mss
+    accepted[OPT_WINDOW] = _bounded_int(offered.get(OPT_WINDOW), min(DEFAULT_WINDOW, max_window), 1, min(DEFAULT_WINDOW, max_window))
+    if OPT_RTO in offered:
+        accepted[OPT_RTO] = _bounded_int(offered[OPT_RTO], None, 1, MAX_RTO_MS)
+        if accepted[OPT_RTO] is None:
+            del accepted[OPT_RTO]
+
+    if offered.get(OPT_COMPRESS) in compression.CODECS:
+        accepted[OPT_COMPRESS] = offered[OPT_COMPRESS]
+
+    if is_digest(offered.get(OPT_DIGEST)):
+        accepted[OPT_DIGEST] = offered[OPT_DIGEST]
+
+    # Lote: en subidas la cantidad de archivos; en descargas la pone el servidor
+    batch_count = _bounded_int(offered.get(OPT_BATCH), 0, 0, MAX_BATCH)
+    if batch_count:
+        accepted[OPT_BATCH] = batch_count
+
+    # Control de congestión: el que pide el cliente o, si no pide, el del servidor
+    if offered.get(OPT_CONGESTION) in congestion.CONTROLLERS:
+        accepted[OPT_CONGESTION] = offered[OPT_CONGESTION]
+    elif getattr(args, "congestion", None):
+        accepted[OPT_CONGESTION] = args.congestion
+    return accepted
+
+
+def is_digest(value):
+    """Valida un SHA-256 en hexadecimal"""
+    return isinstance(value, str) and len(value) == 64 and all(c in "0123456789abcdef" for c in value)
+
+
+def check_accepted(options):
+    """Cliente: verifica que el servidor aceptó una versión soportada"""
+    try:
+        return int(options.get(OPT_WIRE, "")) in SUPPORTED_VERSIONS
+    except ValueError:
+        return False
+
+
+def session_params(options):
+    """Devuelve (mss, ventana, rto inicial en segundos o None) de la sesión"""
+    mss = _bounded_int(options.get(OPT_MSS), DEFAULT_MSS, MIN_MSS, MAX_MSS)
+    window = _bounded_int(options.get(OPT_WINDOW), DEFAULT_WINDOW, 1, DEFAULT_WINDOW)
+    rto = _bounded_int(options.get(OPT_RTO), None, 1, MAX_RTO_MS)
+    return mss, window, rto / 1000 if rto is not None else None
+
+
+def session_conn_id(options):
+    """Id de conexión de la sesión, 0 si el servidor no asignó uno"""
+    try:
+        return int(options.get(OPT_CONN_ID, 0))
+    except ValueError:
+        return 0
+
+
+def part_options(index, streams, transfer_id=None, resume=None):
+    """Opciones del cliente para pedir la porción index de streams"""
+    options = {OPT_PART: f"{index}/{streams}"}
+    if transfer_id is not None:
+        options[OPT_TRANSFER] = transfer_id
+    if resume is not None:
+        options[OPT_RESUME] = resume
+    return options
+
+
+def part_range(total, index, streams):
+    """Bytes [inicio, fin) de la porción index: ambos extremos la calculan igual"""
+    return total * index // streams, total * (index + 1) // streams
+
+
+def negotiate_part(offered, accepted, total, upload, confirmed=None):
+    """Servidor: agrega a accepted el rango de la sesión. False si es inválido.
+
+    Al reanudar, el rango arranca en el primer byte que falta según confirmed
+    (el journal del servidor en subidas, los rangos del cliente en descargas).
+    """
+    resume = OPT_RESUME in offered
+    if OPT_PART not in offered and not resume:
+        return True
+    if OPT_BATCH in accepted:
+        # Un lote viaja entero por una sola sesión
+        return False
+    try:
+        index, streams = (int(v) for v in offered.get(OPT_PART, "0/1").split("/"))
+        if resume and not upload:
+            confirmed = parse_ranges(offered[OPT_RESUME])
+    except ValueError:
+        return False
+    if not 0 <= index < streams <= MAX_STREAMS:
+        return False
+    if upload:
+        # Las porciones de una misma subida se juntan por su id
+        transfer_id = offered.get(OPT_TRANSFER, "")
+        if not transfer_id.isalnum() or len(transfer_id) > MAX_TRANSFER_ID:
+            return False
+        accepted[OPT_TRANSFER] = transfer_id
+    start, end = part_range(total, index, streams)
+    if resume:
+        start = storage.first_missing(confirmed or [], start, end)
+        accepted[OPT_RESUME] = 1
+    accepted[OPT_PART] = f"{index}/{streams}"
+    accepted[OPT_RANGE] = f"{start}-{end}"
+    return True
+
+
+def format_ranges(ranges):
+    """Rangos como "a-b,c-d" para la opción resume"""
+    return ",".join(f"{start}-{end}" for start, end in ranges[:MAX_RESUME_RANGES])
+
+
+def parse_ranges(text):
+    """Inversa de format_ranges. ValueError si está mal formado"""
+    ranges = []
+    for token in filter(None, text.split(",")):
+        start, end = (int(v) for v in token.split("-"))
+        if not 0 <= start <= end:
+            raise ValueError(f"Rango inválido '{token}'")
+        ranges.append((start, end))
+    return ranges
+
+
+def session_range(options):
+    """Rango (inicio, fin) de la sesión o None si transfiere el archivo entero"""
+    try:
+        start, end = (int(v) for v in options[OPT_RANGE].split("-"))
+    except (KeyError, ValueError):
+        return None
+    return (start, end) if 0 <= start <= end else None
+
+
+def wait_response(transport, timeout):
+    """Espera una respuesta de texto del servidor durante `timeout` segundos.
+
+    Descarta los paquetes binarios que puedan llegar antes (p. ej. datos de
+    una descarga cuyo DOWNLOAD_OK se perdió). Lanza socket.timeout al vencer.
+    """
+    deadline = transport.now() + timeout
+    while True:
+        remaining = deadline - transport.now()
+        if remaining <= 0:
+            raise socket.timeout
+        received = transport.recvfrom(MAX_MESSAGE, remaining)
+        if received is None:
+            raise socket.timeout
+        data, addr = received
+        if data[:1].isalpha():
+            return data.decode(), addr
+
+
+def busy_message(retry_after):
+    return format_message(BUSY, f"{retry_after:.2f}")
+
+
+def retry_after(response):
+    """Segundos que pide esperar un BUSY:<segundos>, o None si response no es un BUSY"""
+    fields = response.split(SEPARATOR)
+    if len(fields) < 2 or fields[0] != BUSY:
+        return None
+    try:
+        seconds = float(fields[1])
+    except ValueError:
+        return None
+    if not seconds >= 0:
+        return None
+    return min(seconds, MAX_BUSY_WAIT)
+
+
+def wait_busy(transport, seconds):
+    """Deja pasar lo que pidió un BUSY (con algo de azar) descartando lo que llegue"""
+    deadline = transport.now() + seconds * random.uniform(1, 1 + BUSY_JITTER)
+    while (remaining := deadline - transport.now()) > 0:
+        transport.recvfrom(MAX_MESSAGE, remaining)
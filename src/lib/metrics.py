@@ -0,0 +1,312 @@
+import json
+import logging
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Métricas de las transferencias: estadísticas de cada una (resumen JSON al
+# terminar, ver --summary-json) y agregados del servidor que se exponen en
+# /metrics con el formato de texto de Prometheus (ver --metrics-port).
+# Desactivadas no cuestan nada: sin TransferStats los protocolos no envuelven
+# el archivo ni la E/S, y sólo llevan los contadores enteros de siempre.
+'''HTTP'''
+METRICS_HOST = "127.0.0.1"
+METRICS_PATH = "/metrics"
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+'''NOMBRES'''
+PREFIX = "file_transfer_"
+# Métodos del archivo o la fuente cuyo tiempo cuenta como espera de disco
+DISK_METHODS = frozenset(("block", "chunk", "write", "write_at", "read_at"))
+
+# Contadores de cada transferencia que se suman en el servidor: (clave del resumen, métrica, ayuda)
+TOTALS = (
+    ("bytes", "bytes_total", "Bytes transferred"),
+    ("packets_sent", "packets_sent_total", "Data and parity packets sent, retransmissions included"),
+    ("retransmissions", "retransmissions_total", "Data packets retransmitted"),
+    ("duplicates", "duplicates_total", "Data packets received more than once"),
+    ("out_of_order", "out_of_order_total", "Data packets received ahead of a gap"),
+    ("duration_s", "seconds_total", "Time spent in transfers"),
+    ("disk_s", "disk_seconds_total", "Time spent reading or writing the file"),
+    ("network_s", "network_seconds_total", "Time spent sending or waiting for datagrams"),
+)
+
+
+def from_args(args, file_cache=None, admission=None):
+    """Registry del servidor si se pidió --metrics-port, si no None"""
+    if not getattr(args, "metrics_port", None):
+        return None
+    return Registry(file_cache, admission)
+
+
+def for_transfer(args, direction, protocol, name, peer, registry=None, role="client"):
+    """TransferStats de una transferencia, o None si no se pidieron métricas"""
+    summary_path = getattr(args, "summary_json", None)
+    if registry is None and not summary_path:
+        return None
+    return TransferStats(direction, protocol, name, peer, role, registry, summary_path)
+
+
+def finish(stats, success):
+    """Cierra las estadísticas de una transferencia, si las hay"""
+    if stats is not None:
+        stats.finish(success)
+
+
+class TransferStats:
+    """Estadísticas de una transferencia.
+
+    El protocolo empieza a contar con track() (que envuelve la E/S y el
+    archivo para medir cuánto se espera a cada uno) y deja en
+    protocol.counters el objeto con los contadores: el estado del emisor o
+    del receptor (la ventana de Selective Repeat o StopAndWaitSender y
+    StopAndWaitReceiver). Quien abrió la sesión la cierra con finish(), que
+    arma el resumen.
+    """
+
+    # Un solo archivo de resúmenes por proceso: las líneas no se mezclan
+    summary_lock = threading.Lock()
+
+    def __init__(self, direction, protocol, name, peer, role, registry=None, summary_path=None):
+        self.direction = direction
+        self.protocol_name = protocol
+        self.name = name
+        self.peer = peer
+        self.role = role
+        self.registry = registry
+        self.summary_path = summary_path
+        self.protocol = None
+        self.size = 0
+        self.started = None
+        self.stopped = None
+        self.disk_time = 0.0
+        self.network_time = 0.0
+        self.finished = False
+        if registry is not None:
+            registry.start(self)
+
+    def track(self, protocol, size, io=None, data=None):
+        """Empieza a contar. Devuelve io y data (archivo o fuente) medidos"""
+        self.protocol = protocol
+        self.size = size
+        # Las esperas se miden con el reloj del protocolo: en una simulación, tiempo virtual
+        self.clock = protocol.now
+        self.started = self.clock()
+        return (TimedIO(io, self) if io is not None else None,
+                TimedData(data, self) if data is not None else None)
+
+    def stop(self):
+        """Fin de los datos: la espera del cierre del receptor no cuenta en la duración"""
+        if self.protocol is not None and self.stopped is None:
+            self.stopped = self.protocol.now()
+
+    def summary(self, success):
+        """Resumen de la transferencia como dict serializable a JSON"""
+        protocol = self.protocol
+        counters = getattr(protocol, "counters", None)
+        duration = 0.0
+        if protocol is not None:
+            duration = (self.stopped if self.stopped is not None else protocol.now()) - self.started
+        count = lambda attr: getattr(counters, attr, 0) if counters is not None else 0
+        receiver = self.role_receives()
+        transferred = count("bytes_received") if receiver else count("bytes_sent")
+        # RTT y ventana son del emisor: el receptor no los mide
+        rtt = getattr(protocol, "rtt", None) if not receiver else None
+        cc = getattr(protocol, "cc", None) if not receiver else None
+        samples = count("in_flight_samples")
+        return {
+            "direction": self.direction, "role": self.role, "protocol": self.protocol_name, "name": self.name,
+            "peer": f"{self.peer[0]}:{self.peer[1]}" if isinstance(self.peer, tuple) else str(self.peer),
+            "success": bool(success), "size": self.size, "bytes": transferred,
+            "duration_s": round(duration, 6),
+            "goodput_mb_s": round(transferred / duration / 1e6, 3) if success and duration > 0 else 0.0,
+            "packets_sent": count("packets_sent"), "retransmissions": count("retransmissions"),
+            "fast_retransmits": count("fast_retransmits"), "timeout_retransmits": count("timeout_retransmits"),
+            "packets_received": count("packets_received"), "duplicates": count("duplicates"),
+            "out_of_order": count("out_of_order"), "parity_sent": count("parity_sent"),
+            "recovered": count("recovered"),
+            "rtt_samples": rtt.samples if rtt is not None else 0,
+            "srtt_ms": round(rtt.srtt * 1000, 3) if rtt is not None and rtt.srtt is not None else None,
+            "rto_ms": round(rtt.timeout * 1000, 3) if rtt is not None else None,
+            "cwnd": round(cc.cwnd, 2) if cc is not None else None,
+            "in_flight_avg": round(count("in_flight_sum") / samples, 2) if samples else 0.0,
+            "in_flight_max": count("in_flight_max"),
+            "disk_s": round(self.disk_time, 6), "network_s": round(self.network_time, 6),
+        }
+
+    def role_receives(self):
+        """El extremo recibe el archivo: el servidor en una subida, el cliente en una descarga"""
+        return (self.direction == "upload") == (self.role == "server")
+
+    def finish(self, success):
+        """Cierra la transferencia: agrega al servidor y escribe el resumen. Idempotente"""
+        if self.finished:
+            return None
+        self.finished = True
+        summary = self.summary(success)
+        if self.registry is not None:
+            self.registry.finish(self, summary)
+        if self.summary_path:
+            try:
+                with self.summary_lock, open(self.summary_path, "a") as file:
+                    file.write(json.dumps(summary) + "\n")
+            except OSError as e:
+                logging.warning(f"No se pudo escribir el resumen en {self.summary_path}: {e}")
+        return summary
+
+
+class TimedIO:
+    """E/S en tandas (ver lib/batch_io.py) que suma su tiempo a network_time"""
+
+    def __init__(self, io, stats):
+        self.io = io
+        self.stats = stats
+
+    def send(self, datagrams, addr):
+        start = self.stats.clock()
+        try:
+            return self.io.send(datagrams, addr)
+        finally:
+            self.stats.network_time += self.stats.clock() - start
+
+    def recv(self, timeout):
+        start = self.stats.clock()
+        try:
+            return self.io.recv(timeout)
+        finally:
+            self.stats.network_time += self.stats.clock() - start
+
+
+class TimedData:
+    """Archivo o fuente cuyas lecturas y escrituras (DISK_METHODS) suman a disk_time"""
+
+    def __init__(self, data, stats):
+        self.data = data
+        self.stats = stats
+
+    def __getattr__(self, name):
+        attr = getattr(self.data, name)
+        if name not in DISK_METHODS:
+            return attr
+        stats = self.stats
+
+        def timed(*args):
+            start = stats.clock()
+            try:
+                return attr(*args)
+            finally:
+                stats.disk_time += stats.clock() - start
+
+        # Las siguientes llamadas no pasan por __getattr__
+        setattr(self, name, timed)
+        return timed
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return self.data.__exit__(exc_type, exc, tb)
+
+
+class Registry:
+    """Agregados del servidor: transferencias activas, totales, caché de archivos y cola de saludos"""
+
+    def __init__(self, file_cache=None, admission=None):
+        self.file_cache = file_cache
+        self.admission = admission
+        self.lock = threading.Lock()
+        self.active = {}  # {(dirección, protocolo): transferencias en curso}
+        self.transfers = {}  # {(dirección, protocolo, resultado): transferencias}
+        self.totals = {}  # {(métrica, dirección, protocolo): valor}
+        self.rtt = {}  # {(dirección, protocolo): [suma de SRTT, cantidad]}
+
+    def start(self, stats):
+        key = (stats.direction, stats.protocol_name)
+        with self.lock:
+            self.active[key] = self.active.get(key, 0) + 1
+
+    def finish(self, stats, summary):
+        key = (stats.direction, stats.protocol_name)
+        result = "ok" if summary["success"] else "failed"
+        with self.lock:
+            self.active[key] -= 1
+            self.transfers[key + (result,)] = self.transfers.get(key + (result,), 0) + 1
+            for field, metric, _ in TOTALS:
+                self.totals[(metric,) + key] = self.totals.get((metric,) + key, 0) + summary[field]
+            if summary["srtt_ms"] is not None:
+                total = self.rtt.setdefault(key, [0.0, 0])
+                total[0] += summary["srtt_ms"] / 1000
+                total[1] += 1
+
+    def render(self):
+        """Texto para /metrics (formato de exposición de Prometheus)"""
+        lines = []
+
+        def family(name, kind, help_text, samples):
+            lines.append(f"# HELP {PREFIX}{name} {help_text}")
+            lines.append(f"# TYPE {PREFIX}{name} {kind}")
+            for labels, value in samples:
+                label_text = ",".join(f'{key}="{value}"' for key, value in labels)
+                lines.append(f"{PREFIX}{name}{{{label_text}}} {value:g}" if label_text else f"{PREFIX}{name} {value:g}")
+
+        with self.lock:
+            family("active", "gauge", "Transfers in progress",
+                   [((("direction", d), ("protocol", p)), n) for (d, p), n in sorted(self.active.items())])
+            family("transfers_total", "counter", "Finished transfers",
+                   [((("direction", d), ("protocol", p), ("result", r)), n)
+                    for (d, p, r), n in sorted(self.transfers.items())])
+            for _, metric, help_text in TOTALS:
+                family(metric, "counter", help_text,
+                       [((("direction", d), ("protocol", p)), v)
+                        for (m, d, p), v in sorted(self.totals.items()) if m == metric])
+            rtt = sorted(self.rtt.items())
+            lines.append(f"# HELP {PREFIX}srtt_seconds Smoothed RTT at the end of each transfer")
+            lines.append(f"# TYPE {PREFIX}srtt_seconds summary")
+            for (d, p), (total, count) in rtt:
+                lines.append(f'{PREFIX}srtt_seconds_sum{{direction="{d}",protocol="{p}"}} {total:g}')
+                lines.append(f'{PREFIX}srtt_seconds_count{{direction="{d}",protocol="{p}"}} {count}')
+
+        cache = self.file_cache
+        if cache is not None:
+            with cache.lock:
+                hits, misses, evictions = cache.hits, cache.misses, cache.evictions
+                size, files = cache.size, len(cache.entries)
+            family("cache_hits_total", "counter", "Downloads served from a cached mapping", [((), hits)])
+            family("cache_misses_total", "counter", "Downloads that had to map the file", [((), misses)])
+            family("cache_evictions_total", "counter", "Mappings evicted from the cache", [((), evictions)])
+            family("cache_bytes", "gauge", "Bytes mapped by the cache", [((), size)])
+            family("cache_files", "gauge", "Files mapped by the cache", [((), files)])
+        if self.admission is not None:
+            admission = self.admission.stats()
+            family("slots_in_use", "gauge", "Transfer slots taken (see --max-transfers)", [((), admission["active"])])
+            family("queued", "gauge", "Handshakes waiting for a transfer slot", [((), admission["queued"])])
+            family("busy_total", "counter", "Handshakes answered with BUSY", [((), admission["busy"])])
+        return "\n".join(lines) + "\n"
+
+
+def serve_http(registry, port, host=METRICS_HOST):
+    """Expone registry en http://host:port/metrics desde un hilo. Devuelve el servidor
+    (shutdown() lo cierra) o None si no se pudo abrir el puerto"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?", 1)[0] != METRICS_PATH:
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            logging.debug(f"Métricas: {self.address_string()} {format % args}")
+
+    try:
+        server = ThreadingHTTPServer((host, port), Handler)
+    except OSError as e:
+        logging.error(f"No se pudo abrir el puerto de métricas {host}:{port}: {e}")
+        return None
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    logging.info(f"Métricas en http://{host}:{port}{METRICS_PATH}")
+    return server
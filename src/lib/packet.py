@@ -0,0 +1,109 @@
+import struct
+import zlib
+from typing import NamedTuple
+
+# Formato binario de paquetes de datos y control
+'''VERSION'''
+WIRE_VERSION = 3
+SUPPORTED_VERSIONS = (WIRE_VERSION,)
+'''TIPOS DE PAQUETE'''
+DATA = 1
+ACK = 2
+# FIN: seq = RTO del emisor en microsegundos (escala la espera final del receptor)
+FIN = 3
+SACK = 4
+PROBE = 5
+PARITY = 6
+# SACK enviado al aparecer un hueco: lo que falta debajo del seq más alto se perdió
+NACK = 7
+FIN_ACK = 8
+'''FLAGS'''
+# Payload de DATA comprimido con deflate (ver lib/compression.py)
+FLAG_COMPRESSED = 0x1
+# FIN_ACK: el receptor descartó el archivo (p. ej. el digest no coincide)
+FLAG_REJECTED = 0x1
+'''HEADER'''
+# version (8) | tipo (8) | flags (16) | id de conexión (32) | seq/offset (64) | largo del payload (32) | crc32 (32)
+HEADER = struct.Struct("!BBHIQII")
+HEADER_SIZE = HEADER.size
+# El CRC32 cubre los campos anteriores a él y el payload
+CRC_OFFSET = HEADER_SIZE - 4
+CRC = struct.Struct("!I")
+# Máximo payload UDP sobre IPv4 (65535 - 20 de IP - 8 de UDP)
+MAX_DATAGRAM = 65507
+# Payload de SACK: ventana anunciada por el receptor (32) | bitmap
+SACK_WINDOW = struct.Struct("!I")
+# Payload de PARITY: paquetes del grupo (16) | XOR de sus bloques; el seq es el primero del grupo
+PARITY_COUNT = struct.Struct("!H")
+
+
+class Packet(NamedTuple):
+    """Paquete parseado. El payload es un memoryview sobre el datagrama"""
+    type: int
+    flags: int
+    seq: int
+    payload: memoryview
+    conn_id: int = 0
+
+
+def pack(packet_type, seq, payload=b"", flags=0, conn_id=0):
+    """Arma un paquete binario: header fijo seguido del payload"""
+    return bytes(pack_header_into(bytearray(HEADER_SIZE), packet_type, seq, payload, flags, conn_id)) + payload
+
+
+def pack_header_into(buffer, packet_type, seq, payload, flags=0, conn_id=0):
+    """Escribe en buffer el header de un paquete con ese payload, sin copiarlo.
+
+    Para enviar header y payload por separado (scatter/gather, ver
+    BaseProtocol.send_parts).
+    """
+    HEADER.pack_into(buffer, 0, WIRE_VERSION, packet_type, flags, conn_id, seq, len(payload), 0)
+    CRC.pack_into(buffer, CRC_OFFSET, zlib.crc32(payload, zlib.crc32(memoryview(buffer)[:CRC_OFFSET])))
+    return buffer
+
+
+def unpack(datagram):
+    """Parsea un paquete binario sin copiar el payload"""
+    view = memoryview(datagram)
+    if len(view) < HEADER_SIZE:
+        raise ValueError(f"Paquete demasiado corto ({len(view)} bytes)")
+    version, packet_type, flags, conn_id, seq, length, crc = HEADER.unpack_from(view)
+    if version != WIRE_VERSION:
+        raise ValueError(f"Versión de formato no soportada: {version}")
+    if HEADER_SIZE + length > len(view):
+        raise ValueError(f"Paquete truncado: se esperaban {length} bytes de payload")
+    payload = view[HEADER_SIZE:HEADER_SIZE + length]
+    if zlib.crc32(payload, zlib.crc32(view[:CRC_OFFSET])) != crc:
+        raise ValueError(f"CRC inválido en paquete seq={seq}")
+    return Packet(packet_type, flags, seq, payload, conn_id)
+
+
+def pack_sack(cum_ack, bitmap, window, conn_id=0, flags=0, nack=False):
+    """ACK acumulativo (próximo seq esperado) + ventana anunciada (paquetes
+    desde cum_ack que acepta el receptor) + bitmap de seq recibidos fuera de
+    orden. Con nack, el paquete es un NACK.
+
+    El bit i del bitmap (little endian) indica que llegó el seq cum_ack + 1 + i.
+    """
+    payload = SACK_WINDOW.pack(window) + bitmap.to_bytes((bitmap.bit_length() + 7) // 8, "little")
+    return pack(NACK if nack else SACK, cum_ack, payload, flags, conn_id)
+
+
+def sack_window(sack):
+    """Ventana (en paquetes) que anuncia el receptor en un SACK parseado"""
+    return SACK_WINDOW.unpack_from(sack.payload)[0]
+
+
+def sack_seqs(sack):
+    """Devuelve los seq marcados en el bitmap de un SACK parseado"""
+    bitmap = int.from_bytes(sack.payload[SACK_WINDOW.size:], "little")
+    while bitmap:
+        lowest = bitmap & -bitmap
+        yield sack.seq + lowest.bit_length()
+        bitmap ^= lowest
+
+
+def sack_highest(sack):
+    """Mayor seq confirmado por un SACK parseado (sack.seq - 1 si no trae bitmap)"""
+    bits = int.from_bytes(sack.payload[SACK_WINDOW.size:], "little").bit_length()
+    return sack.seq + bits if bits else sack.seq - 1
@@ -1,17 +1,57 @@
 import argparse
 
+from .admission import POLICIES
+from .congestion import CONTROLLERS
+
+
+def add_ack_arguments(parser):
+    """Opciones del receptor Selective Repeat para agrupar ACKs"""
+    parser.add_argument("--ack-every", type=int, metavar="", help="send a SACK every N data packets")
+    parser.add_argument("--ack-delay", type=float, metavar="", help="max delay in ms before sending a SACK")
+
+
+def add_congestion_argument(parser):
+    """Algoritmo de control de congestión del emisor Selective Repeat"""
+    parser.add_argument("-c", "--congestion", choices=sorted(CONTROLLERS), metavar="", help="congestion control algorithm (" + ", ".join(sorted(CONTROLLERS)) + ")")
+
+
+def add_session_arguments(parser):
+    """Parámetros de sesión que el cliente ofrece en el handshake"""
+    parser.add_argument("--mss", type=int, metavar="", help="max payload bytes per data packet")
+    parser.add_argument("--window", type=int, metavar="", help="max receive window in packets")
+    parser.add_argument("--probe-mtu", action="store_true", help="probe the largest unfragmented datagram before the transfer")
+    parser.add_argument("--streams", type=int, metavar="", help="transfer the file as N byte ranges over concurrent sessions")
+    parser.add_argument("--resume", action="store_true", help="continue an interrupted transfer of the same file")
+    parser.add_argument("--compress", action="store_true", help="compress data packets on the fly (blocks that do not shrink are sent raw)")
+
+
+def add_summary_argument(parser):
+    """Resumen JSON de cada transferencia (ver lib/metrics.py)"""
+    parser.add_argument("--summary-json", metavar="", help="append a JSON line with the statistics of each transfer to this file")
+
+
+def add_trace_arguments(parser):
+    """Registro de paquetes en memoria (ver lib/trace.py)"""
+    parser.add_argument("--trace", metavar="", help="record every packet in memory and save it on exit to this file (.csv timeline, otherwise pcap)")
+    parser.add_argument("--trace-size", type=int, metavar="", help="packets kept by --trace, the oldest are overwritten (default 65536)")
+
+
 def get_parser(parser_type: str):
     description = ""
     usage = ""
     if parser_type == "server":
         description = "Server for file transfer application"
-        usage = "start-server [-h] [-v | -q] [-H ADDR] [-p PORT] [-s DIRPATH]"
+        usage = "start-server [-h] [-v | -q] [-H ADDR] [-p PORT] [-s DIRPATH] [--ack-every N] [--ack-delay MS] [-c ALGORITHM] [--async] [--workers N] [--cache-size MB] [--max-transfers N] [--queue-size N] [--schedule POLICY] [--metrics-port PORT] [--summary-json FILE] [--trace FILE] [--trace-size N]"
     elif parser_type == "upload":
         description = "Client to upload a file to the server"
-        usage = "upload [-h] [-v | -q] [-H ADDR] [-p PORT] [-s FILEPATH] [-n FILENAME] [-r protocol]"
+        usage = "upload [-h] [-v | -q] [-H ADDR] [-p PORT] [-s FILEPATH | DIRPATH] [-n FILENAME] [--manifest FILE] [-r protocol] [-c ALGORITHM] [--mss BYTES] [--window PACKETS] [--probe-mtu] [--streams N] [--resume] [--compress] [--summary-json FILE] [--trace FILE] [--trace-size N]"
     elif parser_type == "download":
         description = "Client to download a file from the server"
-        usage = "download [-h] [-v | -q] [-H ADDR] [-p PORT] [-d FILEPATH] [-n FILENAME] [-r protocol]"
+        usage = "download [-h] [-v | -q] [-H ADDR] [-p PORT] [-d FILEPATH | DIRPATH] [-n FILENAME | PATTERN] [--manifest FILE] [-r protocol] [--ack-every N] [--ack-delay MS] [-c ALGORITHM] [--mss BYTES] [--window PACKETS] [--probe-mtu] [--streams N] [--resume] [--compress] [--summary-json FILE] [--trace FILE] [--trace-size N]"
+
+    elif parser_type == "benchmark":
+        description = "Loopback benchmark through a lossy-link relay"
+        usage = "benchmark [-h] [-v | -q] [-H ADDR] [-p PORT] [--sizes LIST] [--protocols LIST] [--loss LIST] [--windows LIST] [--mss LIST] [--delay MS] [--jitter MS] [--reorder P] [--duplicate P] [--direction DIR] [--repeat N] [--seed N] [--timeout S] [--server-args ARGS] [--simulated] [--bandwidth MB/S] [--output FILE] [--baseline FILE] [--tolerance F]"
 
     parser = argparse.ArgumentParser(description=description, usage=usage)
 
@@ -26,16 +66,59 @@ def get_parser(parser_type: str):
     # args específicos
     if parser_type == "server":
         parser.add_argument("-s", "--storage", metavar="", help="storage dir path")
+        add_ack_arguments(parser)
+        add_congestion_argument(parser)
+        parser.add_argument("--async", dest="async_mode", action="store_true", help="serve every transfer from the listening socket with asyncio")
+        parser.add_argument("--workers", type=int, metavar="", help="number of server processes sharing the port with SO_REUSEPORT")
+        parser.add_argument("--cache-size", type=int, metavar="", help="MB of downloaded files kept mapped in memory (default 256, 0 disables)")
+        parser.add_argument("--max-transfers", type=int, metavar="", help="max concurrent transfers per process (default 32, 0 disables the limit)")
+        parser.add_argument("--queue-size", type=int, metavar="", help="handshakes waiting for a free transfer slot before answering BUSY (default 64)")
+        parser.add_argument("--schedule", choices=POLICIES, metavar="", help="order of the waiting handshakes: fifo (default) or sjf, shortest file first")
+        parser.add_argument("--metrics-port", type=int, metavar="", help="serve Prometheus metrics on http://127.0.0.1:PORT/metrics")
+        add_summary_argument(parser)
+        add_trace_arguments(parser)
     
     elif parser_type == "upload":
-        parser.add_argument("-s", "--src", metavar="", help="source file path")
+        parser.add_argument("-s", "--src", metavar="", help="source file path, or a directory to upload all its files")
         parser.add_argument("-n", "--name", metavar="", help="file name")
         parser.add_argument("-r", "--protocol", metavar="", help="error recovery protocol")
+        parser.add_argument("--manifest", metavar="", help="upload every file listed in this file (one path per line) in a single session")
+        add_congestion_argument(parser)
+        add_session_arguments(parser)
+        add_summary_argument(parser)
+        add_trace_arguments(parser)
         
     elif parser_type == "download":
-        parser.add_argument("-d", "--dst", metavar="", help="destination file path")
-        parser.add_argument("-n", "--name", metavar="", help="file name")
+        parser.add_argument("-d", "--dst", metavar="", help="destination file path, or directory for a batch")
+        parser.add_argument("-n", "--name", metavar="", help="file name, or comma separated names and glob patterns to download as a batch")
         parser.add_argument("-r", "--protocol", metavar="", help="error recovery protocol")
+        parser.add_argument("--manifest", metavar="", help="download every file name or pattern listed in this file in a single session")
+        add_ack_arguments(parser)
+        add_congestion_argument(parser)
+        add_session_arguments(parser)
+        add_summary_argument(parser)
+        add_trace_arguments(parser)
+
+    elif parser_type == "benchmark":
+        parser.add_argument("--sizes", metavar="", help="comma separated file sizes, with K/M/G suffixes (default 100K,1M)")
+        parser.add_argument("--protocols", metavar="", help="comma separated protocols (default all)")
+        parser.add_argument("--loss", metavar="", help="comma separated loss rates injected by the relay (default 0,0.02)")
+        parser.add_argument("--windows", metavar="", help="comma separated windows in packets offered by the client")
+        parser.add_argument("--mss", metavar="", help="comma separated MSS values offered by the client")
+        parser.add_argument("--delay", type=float, metavar="", help="one-way delay in ms added by the relay")
+        parser.add_argument("--jitter", type=float, metavar="", help="max random extra delay in ms")
+        parser.add_argument("--reorder", type=float, metavar="", help="probability of delaying a packet behind later ones")
+        parser.add_argument("--duplicate", type=float, metavar="", help="probability of duplicating a packet")
+        parser.add_argument("--direction", choices=("upload", "download", "both"), metavar="", help="upload, download or both (default upload)")
+        parser.add_argument("--repeat", type=int, metavar="", help="runs per case (default 3)")
+        parser.add_argument("--seed", type=int, metavar="", help="seed for the relay and the test files (default 0)")
+        parser.add_argument("--timeout", type=float, metavar="", help="seconds before a run counts as failed (default 120)")
+        parser.add_argument("--server-args", metavar="", help="extra start-server arguments, e.g. \"--async\"")
+        parser.add_argument("--simulated", action="store_true", help="run in-process over the simulated network (virtual time)")
+        parser.add_argument("--bandwidth", type=float, metavar="", help="--simulated: link rate of each endpoint in MB/s (default unlimited)")
+        parser.add_argument("--output", metavar="", help="write the JSON report to this file instead of stdout")
+        parser.add_argument("--baseline", metavar="", help="JSON report to compare with: exit 1 on regressions")
+        parser.add_argument("--tolerance", type=float, metavar="", help="allowed regression as a fraction (default 0.25)")
 
     parser._optionals.title = "optional arguments"
     return parser.parse_args()
\ No newline at end of file
@@ -0,0 +1,89 @@
+import errno
+import logging
+import socket
+import sys
+
+from . import packet
+
+'''TAMAÑOS DE DATAGRAMA A PROBAR (bytes de payload UDP, de mayor a menor)'''
+# Loopback, jumbo frames, Ethernet (1500 - 28) y mínimos conservadores
+CANDIDATES = (packet.MAX_DATAGRAM, 32768, 16384, 8972, 4096, 1472, 1400, 1232, 548)
+'''TIMEOUTS Y REINTENTOS'''
+PROBE_TIMEOUT = 0.2
+PROBE_RETRIES = 2
+'''OPCIONES DE SOCKET (Linux)'''
+# Python no siempre exporta estas constantes: valores de <linux/in.h>
+IP_MTU_DISCOVER = getattr(socket, "IP_MTU_DISCOVER", 10 if sys.platform.startswith("linux") else None)
+IP_PMTUDISC_WANT = getattr(socket, "IP_PMTUDISC_WANT", 1)
+IP_PMTUDISC_DO = getattr(socket, "IP_PMTUDISC_DO", 2)
+
+
+def _set_dont_fragment(transport, enabled):
+    """Activa/desactiva el bit DF. False si la plataforma (o el transporte) no lo permite"""
+    sock = getattr(transport, "socket", None)
+    if IP_MTU_DISCOVER is None or sock is None:
+        return False
+    try:
+        mode = IP_PMTUDISC_DO if enabled else IP_PMTUDISC_WANT
+        sock.setsockopt(socket.IPPROTO_IP, IP_MTU_DISCOVER, mode)
+        return True
+    except OSError:
+        return False
+
+
+def _probe(transport, server_addr, size):
+    """Envía un PROBE de `size` bytes y espera el eco. Devuelve el RTT o None"""
+    probe = packet.pack(packet.PROBE, size, bytes(size - packet.HEADER_SIZE))
+    for _ in range(PROBE_RETRIES):
+        try:
+            transport.sendto(probe, server_addr)
+        except OSError as e:
+            # EMSGSIZE: el kernel ya sabe que no entra en el MTU de la ruta
+            if e.errno == errno.EMSGSIZE:
+                return None
+            raise
+        sent_time = transport.now()
+        deadline = sent_time + PROBE_TIMEOUT
+        while (remaining := deadline - transport.now()) > 0:
+            received = transport.recvfrom(packet.HEADER_SIZE, remaining)
+            if received is None:
+                break
+            try:
+                echo = packet.unpack(received[0])
+            except ValueError:
+                continue
+            if echo.type == packet.PROBE and echo.seq == size:
+                return transport.now() - sent_time
+    return None
+
+
+def probe_datagram_size(transport, server_addr, max_size=packet.MAX_DATAGRAM):
+    """Busca el datagrama más grande que el camino entrega sin fragmentar.
+
+    Devuelve (tamaño, rtt) o (None, None) si ningún candidato respondió.
+    """
+    if not _set_dont_fragment(transport, True):
+        logging.warning("CLIENTE: No se puede fijar DF en esta plataforma, el sondeo puede sobreestimar el MTU")
+    try:
+        for size in CANDIDATES:
+            if size > max_size:
+                continue
+            rtt = _probe(transport, server_addr, size)
+            logging.debug(f"CLIENTE: Sondeo de {size} bytes: {'ok' if rtt is not None else 'sin respuesta'}")
+            if rtt is not None:
+                return size, rtt
+        return None, None
+    finally:
+        _set_dont_fragment(transport, False)
+
+
+def answer_probe(sock, data, addr):
+    """Servidor: responde un PROBE con un eco chico. False si no era un PROBE"""
+    try:
+        probe = packet.unpack(data)
+    except ValueError:
+        return False
+    if probe.type != packet.PROBE:
+        return False
+    sock.sendto(packet.pack(packet.PROBE, probe.seq), addr)
+    return True
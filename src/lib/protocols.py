@@ -0,0 +1,48 @@
+import logging
+
+from . import handshake, packet, path_mtu
+from .fec_protocol import FecProtocol
+from .selective_repeat_protocol import SelectiveRepeatProtocol
+from .stop_and_wait_protocol import StopAndWaitProtocol
+
+# Protocolos por el nombre que viaja en el saludo, compartidos por clientes y servidores
+'''PROTOCOLOS'''
+STOP_AND_WAIT = "stop-and-wait"
+SELECTIVE_REPEAT = "selective-repeat"
+FEC = "fec"
+DEFAULT = STOP_AND_WAIT
+
+PROTOCOLS = {
+    STOP_AND_WAIT: StopAndWaitProtocol,
+    SELECTIVE_REPEAT: SelectiveRepeatProtocol,
+    FEC: FecProtocol,
+}
+
+
+def create_handler(name, args, transport, options=None):
+    """Handler del protocolo `name` para una sesión, o None si no se soporta"""
+    protocol = PROTOCOLS.get(name)
+    if protocol is None:
+        return None
+    return protocol(args, transport, options)
+
+
+def session_options(args, transport, name=DEFAULT):
+    """Cliente: opciones del saludo, con MSS y RTO del sondeo de MTU si se pidió.
+
+    El MSS deja lugar para lo que el protocolo agrega a sus datagramas más
+    grandes (la paridad de FEC): si no, no entrarían en la MTU sondeada.
+    """
+    overhead = PROTOCOLS[name].datagram_overhead if name in PROTOCOLS else 0
+    mss = rto = None
+    if getattr(args, "probe_mtu", False):
+        size, rtt = path_mtu.probe_datagram_size(transport, (args.host, args.port))
+        if size is not None:
+            # Primer RTO como el de RFC 6298 con una sola muestra: srtt + 4 * rtt / 2
+            mss, rto = size - packet.HEADER_SIZE - overhead, 3 * rtt
+            logging.info(f"CLIENTE: Sondeo de MTU: datagramas de {size} bytes (RTT {rtt * 1000:.2f} ms)")
+        else:
+            logging.warning("CLIENTE: El sondeo de MTU no obtuvo respuesta, se usa el MSS por defecto")
+    options = handshake.client_options(args, mss, rto)
+    options[handshake.OPT_MSS] = min(options[handshake.OPT_MSS], handshake.MAX_MSS - overhead)
+    return options
@@ -0,0 +1,216 @@
+import heapq
+import logging
+import random
+import selectors
+import socket
+import threading
+import time
+from collections import namedtuple
+
+from . import handshake, packet
+
+# Relay UDP entre los clientes y el servidor que degrada el enlace como netem:
+# pérdida, demora con jitter, reordenamiento y duplicación. Cada puerto del
+# servidor (el principal y los temporales que asigna en el saludo) tiene su
+# socket en el relay, y cada cliente su socket hacia el servidor, así ninguno
+# de los dos ve la dirección del otro. Las respuestas de saludo se reescriben
+# para que el cliente siga hablando con el relay.
+'''DEGRADACION'''
+# Demora extra de un paquete reordenado: lo pasan los que salen después
+REORDER_DELAY = 0.002
+'''SOCKETS'''
+BUFFER = packet.MAX_DATAGRAM
+# Datagramas que se leen de un socket por vuelta, y buffer pedido al kernel:
+# el relay no tiene que ser el que pierde paquetes en una ráfaga
+BURST = 64
+SOCKET_BUFFER = 8 * 1024 * 1024
+# Los sockets sin tráfico por este tiempo se cierran (sesiones terminadas)
+IDLE_TIMEOUT = 10.0
+# Cada cuánto el hilo del relay revisa si debe terminar
+POLL = 0.1
+
+# Probabilidades por paquete (loss, reorder, duplicate) y tiempos en segundos
+Impairments = namedtuple("Impairments", "loss delay jitter reorder duplicate", defaults=(0.0, 0.0, 0.0, 0.0, 0.0))
+
+
+class LinkModel:
+    """Lo que el enlace degradado hace con cada datagrama: lo usan el relay y la
+    red simulada (ver lib/simulation.py), así ambos degradan igual.
+
+    Sólo se degradan los paquetes binarios de los protocolos: los saludos de
+    texto pasan con la demora pero sin pérdida, para que un saludo perdido
+    (reintento a los 2 s) no domine las mediciones. Con seed la secuencia de
+    pérdidas es reproducible.
+    """
+
+    def __init__(self, impairments=Impairments(), seed=None):
+        self.impairments = impairments
+        self.random = random.Random(seed)
+        self.stats = {}
+        self.reset_stats()
+
+    def reset_stats(self):
+        self.stats = {"forwarded": 0, "dropped": 0, "duplicated": 0, "reordered": 0, "data": 0, "parity": 0}
+
+    def delays(self, data):
+        """Demora de cada copia de data que llega a destino ([] si se pierde)"""
+        impairments = self.impairments
+        if data[:1].isalpha():
+            return [impairments.delay]
+        if len(data) > 1 and data[1] == packet.DATA:
+            self.stats["data"] += 1
+        elif len(data) > 1 and data[1] == packet.PARITY:
+            self.stats["parity"] += 1
+        if self.random.random() < impairments.loss:
+            self.stats["dropped"] += 1
+            return []
+        copies = 2 if self.random.random() < impairments.duplicate else 1
+        self.stats["duplicated"] += copies - 1
+        delays = []
+        for _ in range(copies):
+            delay = impairments.delay + self.random.uniform(0, impairments.jitter)
+            if self.random.random() < impairments.reorder:
+                self.stats["reordered"] += 1
+                delay += REORDER_DELAY
+            delays.append(delay)
+        return delays
+
+
+class LossyRelay:
+    """Relay con enlace degradado (ver LinkModel) entre clientes y un servidor en server_addr"""
+
+    def __init__(self, server_addr, impairments=Impairments(), seed=None, host="127.0.0.1", port=0):
+        self.server_host, self.server_port = server_addr
+        self.link = LinkModel(impairments, seed)
+        self.host = host
+        self.selector = selectors.DefaultSelector()
+        self.frontends = {}  # {puerto del servidor: socket que lo representa ante los clientes}
+        self.upstreams = {}  # {dirección del cliente: socket hacia el servidor}
+        self.last_seen = {}  # {socket: último datagrama}
+        self.pending = []  # heap de (cuándo, orden, socket, datos, destino)
+        self.order = 0
+        self.port = self._frontend(self.server_port, port).getsockname()[1]
+        self.running = True
+        self.thread = threading.Thread(target=self._run, daemon=True)
+        self.thread.start()
+
+    @property
+    def stats(self):
+        return self.link.stats
+
+    def reset_stats(self):
+        self.link.reset_stats()
+
+    def _frontend(self, server_port, port=0):
+        """Socket del relay que los clientes ven como el puerto server_port del servidor"""
+        sock = self.frontends.get(server_port)
+        if sock is None:
+            sock = self._open(port)
+            self.frontends[server_port] = sock
+            self.selector.register(sock, selectors.EVENT_READ, ("frontend", server_port))
+        return sock
+
+    def _upstream(self, client_addr):
+        """Socket del relay hacia el servidor para un cliente"""
+        sock = self.upstreams.get(client_addr)
+        if sock is None:
+            sock = self._open(0)
+            self.upstreams[client_addr] = sock
+            self.selector.register(sock, selectors.EVENT_READ, ("upstream", client_addr))
+        return sock
+
+    def _open(self, port):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((self.host, port))
+        sock.setblocking(False)
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                sock.setsockopt(socket.SOL_SOCKET, option, SOCKET_BUFFER)
+            except OSError:
+                pass
+        self.last_seen[sock] = time.monotonic()
+        return sock
+
+    def _run(self):
+        last_sweep = time.monotonic()
+        while self.running:
+            now = time.monotonic()
+            timeout = POLL if not self.pending else min(max(self.pending[0][0] - now, 0), POLL)
+            for key, _ in self.selector.select(timeout):
+                self._receive(key.fileobj, key.data)
+            self._flush()
+            if time.monotonic() - last_sweep > IDLE_TIMEOUT:
+                self._close_idle()
+                last_sweep = time.monotonic()
+        for sock in list(self.last_seen):
+            sock.close()
+        self.selector.close()
+
+    def _receive(self, sock, route):
+        kind, target = route
+        now = self.last_seen[sock] = time.monotonic()
+        for _ in range(BURST):
+            try:
+                data, addr = sock.recvfrom(BUFFER)
+            except OSError:
+                return
+            if kind == "frontend":
+                # Cliente -> servidor, por el socket de ese cliente
+                upstream = self._upstream(addr)
+                self.last_seen[upstream] = now
+                self._schedule(upstream, data, (self.server_host, target))
+            else:
+                # Servidor -> cliente, por el socket que representa al puerto de origen
+                frontend = self._frontend(addr[1])
+                self.last_seen[frontend] = now
+                self._schedule(frontend, self._rewrite(data), target)
+
+    def _rewrite(self, data):
+        """Cambia el puerto de un UPLOAD_OK/DOWNLOAD_OK por el del relay que lo representa"""
+        if not data.startswith((b"UPLOAD_OK" + handshake.SEPARATOR.encode(), b"DOWNLOAD_OK" + handshake.SEPARATOR.encode())):
+            return data
+        fields = data.decode().split(handshake.SEPARATOR)
+        try:
+            fields[1] = str(self._frontend(int(fields[1])).getsockname()[1])
+        except (IndexError, ValueError):
+            return data
+        return handshake.SEPARATOR.join(fields).encode()
+
+    def _schedule(self, sock, data, addr):
+        for delay in self.link.delays(data):
+            self._push(delay, sock, data, addr)
+
+    def _push(self, delay, sock, data, addr):
+        if delay <= 0 and not self.pending:
+            self._send(sock, data, addr)
+            return
+        self.order += 1
+        heapq.heappush(self.pending, (time.monotonic() + delay, self.order, sock, data, addr))
+
+    def _flush(self):
+        now = time.monotonic()
+        while self.pending and self.pending[0][0] <= now:
+            _, _, sock, data, addr = heapq.heappop(self.pending)
+            self._send(sock, data, addr)
+
+    def _send(self, sock, data, addr):
+        try:
+            sock.sendto(data, addr)
+            self.stats["forwarded"] += 1
+        except OSError as e:
+            # Socket ya cerrado o buffer lleno: para el enlace es una pérdida más
+            logging.debug(f"Relay: no se pudo reenviar a {addr}: {e}")
+
+    def _close_idle(self):
+        limit = time.monotonic() - IDLE_TIMEOUT
+        for table in (self.frontends, self.upstreams):
+            for key, sock in list(table.items()):
+                if self.last_seen[sock] < limit and not (table is self.frontends and key == self.server_port):
+                    del table[key]
+                    del self.last_seen[sock]
+                    self.selector.unregister(sock)
+                    sock.close()
+
+    def close(self):
+        self.running = False
+        self.thread.join()
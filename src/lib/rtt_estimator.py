@@ -0,0 +1,45 @@
+# Constantes de Jacobson/Karels (RFC 6298)
+ALPHA = 1 / 8
+BETA = 1 / 4
+K = 4
+MAX_BACKOFF = 64
+
+
+class RttEstimator:
+    """Estimador de RTT por sesión: SRTT + RTTVAR con backoff exponencial.
+
+    Aplica la regla de Karn: quien lo usa sólo debe llamar a sample() con
+    mediciones de paquetes que no fueron retransmitidos.
+    """
+
+    def __init__(self, min_rto, max_rto, initial_rto=None):
+        self.min_rto = min_rto
+        self.max_rto = max_rto
+        self.srtt = None
+        self.rttvar = None
+        self.rto = min(max(initial_rto, min_rto), max_rto) if initial_rto is not None else min_rto
+        self.backoff = 1
+        # Mediciones incorporadas (ver lib/metrics.py)
+        self.samples = 0
+
+    def sample(self, rtt):
+        """Incorpora una medición de RTT y recalcula el RTO"""
+        self.samples += 1
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+        else:
+            self.rttvar = (1 - BETA) * self.rttvar + BETA * abs(self.srtt - rtt)
+            self.srtt = (1 - ALPHA) * self.srtt + ALPHA * rtt
+        self.rto = min(max(self.srtt + K * self.rttvar, self.min_rto), self.max_rto)
+        # Una medición válida confirma que el camino responde: se quita el backoff
+        self.backoff = 1
+
+    def on_timeout(self):
+        """Duplica el RTO tras un timeout (backoff exponencial)"""
+        self.backoff = min(self.backoff * 2, MAX_BACKOFF)
+
+    @property
+    def timeout(self):
+        """RTO vigente, con backoff, acotado por max_rto"""
+        return min(self.rto * self.backoff, self.max_rto)
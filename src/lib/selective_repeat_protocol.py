@@ -1,37 +1,406 @@
-import socket
-import time
+import heapq
 import logging
+from . import congestion, handshake, packet
 from .base_protocol import BaseProtocol
+from .rtt_estimator import RttEstimator
 
 # Constantes
 '''TIMEOUTS'''
 BASE_TIMEOUT = 0.05
 MAX_TIMEOUT = 0.5
-'''BUFFER SIZES'''
-BUFFER = 1024
-RECEIVE_BUFFER = BUFFER + 32
-ACK_BUFFER = 64
-'''WINDOW AND RETRIES'''
-WINDOW_SIZE = 32
+'''RETRIES'''
 MAX_RETRIES = 20
+'''ACK COALESCING'''
+ACK_EVERY = 8
+ACK_DELAY = 0.005
+RECEIVER_IDLE_TIMEOUT = 60.0
+'''FAST RETRANSMIT'''
+# SACKs que confirman paquetes enviados después de uno en vuelo para darlo
+# por perdido (un NACK alcanza)
+DUP_THRESHOLD = 3
+# Un hueco es pérdida si se envió al menos esta fracción del SRTT antes que lo
+# confirmado (ventana de reordenamiento, como RACK): el jitter no dispara
+# retransmisiones ni achica la ventana
+REORDER_WINDOW = 1 / 4
+
+
+class SendWindow:
+    """Estado del emisor Selective Repeat, independiente de cómo se hace la E/S.
+
+    Lo usan tanto el loop bloqueante con selectors como las corrutinas del
+    servidor asíncrono: el llamador envía datagram(seq) por cada seq que
+    devuelven fill() y expired(). Los paquetes no se guardan: el payload de
+    una retransmisión se vuelve a tomar de la fuente (el archivo mapeado o
+    el bloque ya comprimido).
+
+    Un paquete se retransmite antes de su timer si un NACK lo reporta como
+    hueco o si DUP_THRESHOLD SACKs confirman paquetes enviados después. La
+    ventana de congestión se achica una vez por episodio de pérdida (como el
+    recover de NewReno, RFC 6582): los huecos hasta el seq más alto enviado
+    al detectar la pérdida son parte del mismo episodio.
+    """
+
+    def __init__(self, protocol, source, file_size):
+        self.protocol = protocol
+        self.source = source
+        self.file_size = file_size
+        self.base_num = 0
+        self.next_seq_num = 0
+        self.bytes_sent = 0
+        self.pkts = {}  # {seq_num: (sent_time, retries)}
+        self.timers = []  # heap de (deadline, seq_num, sent_time)
+        self.dupacks = {}  # {seq_num: SACKs que lo dejaron atrás}
+        self.fast = []  # seq a retransmitir sin esperar el timer
+        self.fast_retransmits = 0
+        self.timeout_retransmits = 0
+        # Seq más alto enviado al empezar el último episodio de pérdida (None: ninguno)
+        self.recover = None
+        # Paquetes en vuelo al llegar cada SACK (ver lib/metrics.py)
+        self.in_flight_sum = 0
+        self.in_flight_samples = 0
+        self.in_flight_max = 0
+
+    @property
+    def packets_sent(self):
+        """Paquetes de datos enviados, retransmisiones incluidas"""
+        return self.next_seq_num + self.retransmissions
+
+    @property
+    def retransmissions(self):
+        return self.fast_retransmits + self.timeout_retransmits
+
+    @property
+    def done(self):
+        """Se envió todo el archivo y todo fue confirmado"""
+        return not self.pkts and self.bytes_sent >= self.file_size
+
+    def fill(self):
+        """Genera los seq nuevos que entran en la ventana de envío"""
+        proto = self.protocol
+        timeout = proto.rtt.timeout
+        # En vuelo como mucho cwnd paquetes, sin pasar el borde que anuncia el receptor
+        while (len(self.pkts) < proto.cc.window and self.next_seq_num < self.base_num + proto.peer_window
+               and self.bytes_sent < self.file_size):
+            seq_num = self.next_seq_num
+            sent_time = proto.now()
+            self.pkts[seq_num] = (sent_time, 0)
+            heapq.heappush(self.timers, (sent_time + timeout, seq_num, sent_time))
+
+            # Los logs por paquete usan %-format: sin -v no se arma el mensaje
+            logging.debug("Enviando paquete seq=%d", seq_num)
+            self.next_seq_num += 1
+            self.bytes_sent = min(self.next_seq_num * proto.mss, self.file_size)
+            yield seq_num
+
+    def new_datagrams(self):
+        """Datagramas de los seq nuevos que entran en la ventana (ver fill)"""
+        for seq_num in self.fill():
+            yield self.datagram(seq_num)
+
+    def datagram(self, seq_num):
+        """Header y payload de seq_num (ver BaseProtocol.data_parts)"""
+        offset = seq_num * self.protocol.mss
+        flags, payload = self.source.block(offset, min(self.protocol.mss, self.file_size - offset))
+        return self.protocol.data_parts(seq_num, payload, flags)
+
+    def next_timeout(self):
+        """Segundos hasta el próximo timer de retransmisión, None si no hay"""
+        if not self.timers:
+            return None
+        return max(self.timers[0][0] - self.protocol.now(), 0)
+
+    def expired(self):
+        """Seq a retransmitir: los que detectaron los SACKs y los de timers
+        vencidos. O(log n) por evento.
+
+        Devuelve None si algún paquete agotó MAX_RETRIES.
+        """
+        proto = self.protocol
+        current_time = proto.now()
+        retransmissions, self.fast = self.fast, []
+
+        while self.timers and self.timers[0][0] <= current_time:
+            _, seq_num, timer_sent_time = heapq.heappop(self.timers)
+            entry = self.pkts.get(seq_num)
+            # Timer obsoleto: el paquete ya fue confirmado o reenviado
+            if entry is None or entry[0] != timer_sent_time:
+                continue
+
+            _, retries = entry
+            if retries >= MAX_RETRIES:
+                logging.error(f"Paquete {seq_num} falló después de {MAX_RETRIES} reintentos")
+                return None
+
+            # Un solo backoff por RTO: los paquetes enviados antes del último
+            # backoff ya fueron contemplados (como el timer único de TCP)
+            if timer_sent_time >= proto.last_backoff:
+                proto.rtt.on_timeout()
+                proto.cc.on_timeout()
+                proto.last_backoff = current_time
+                # Lo que ya estaba en vuelo no vuelve a achicar la ventana
+                self.recover = self.next_seq_num - 1
+
+            logging.debug("Reenviando paquete %d (intento %d)", seq_num, retries + 1)
+            self.pkts[seq_num] = (current_time, retries + 1)
+            heapq.heappush(self.timers, (current_time + proto.rtt.timeout, seq_num, current_time))
+            retransmissions.append(seq_num)
+            self.timeout_retransmits += 1
+
+        return retransmissions
+
+    def on_ack(self, sack):
+        """Descarta todo lo confirmado por un SACK ya parseado y desliza la ventana"""
+        proto = self.protocol
+        if sack.type not in (packet.SACK, packet.NACK):
+            return
+        in_flight = len(self.pkts)
+        self.in_flight_sum += in_flight
+        self.in_flight_samples += 1
+        if in_flight > self.in_flight_max:
+            self.in_flight_max = in_flight
+        previous_base = self.base_num
+        # Los seq en vuelo son consecutivos desde base_num: sólo se recorre lo
+        # que el ACK acumulativo acaba de confirmar, no toda la ventana
+        acked = [seq for seq in range(previous_base, min(sack.seq, self.next_seq_num)) if seq in self.pkts]
+        acked.extend(seq for seq in packet.sack_seqs(sack) if seq in self.pkts)
+
+        # Una muestra de RTT por SACK: el paquete más reciente que no fue
+        # retransmitido (regla de Karn)
+        latest_sent = None
+        newest_sent = None  # envío más reciente confirmado, retransmisiones incluidas
+        for seq_num in acked:
+            sent_time, retries = self.pkts.pop(seq_num)
+            self.dupacks.pop(seq_num, None)
+            self.source.release(seq_num * proto.mss)
+            if newest_sent is None or sent_time > newest_sent:
+                newest_sent = sent_time
+            if retries == 0 and (latest_sent is None or sent_time > latest_sent):
+                latest_sent = sent_time
+        rtt_sample = None
+        if latest_sent is not None:
+            rtt_sample = proto.now() - latest_sent
+            proto.rtt.sample(rtt_sample)
+        if acked:
+            proto.cc.on_ack(len(acked), rtt_sample)
+        if sack.seq >= previous_base:
+            # Un SACK atrasado o reordenado trae una ventana vieja
+            proto.peer_window = packet.sack_window(sack)
+        if newest_sent is not None:
+            self._detect_losses(packet.sack_highest(sack), newest_sent, sack.type == packet.NACK)
+
+        # Deslizar ventana
+        while self.base_num not in self.pkts and self.base_num < self.next_seq_num:
+            self.base_num += 1
+        logging.debug("SACK válido: acumulado=%d, cwnd=%.1f, rwnd=%d", sack.seq, proto.cc.cwnd, proto.peer_window)
+
+    def _detect_losses(self, highest, newest_sent, nack):
+        """Marca para retransmitir los huecos debajo de highest enviados antes que
+        newest_sent (por más que la ventana de reordenamiento)"""
+        proto = self.protocol
+        current_time = proto.now()
+        if proto.rtt.srtt is not None:
+            newest_sent -= proto.rtt.srtt * REORDER_WINDOW
+        # pkts está ordenado por seq: los huecos son los primeros
+        for seq_num, (sent_time, retries) in self.pkts.items():
+            if seq_num >= highest:
+                break
+            if sent_time >= newest_sent:
+                continue
+            count = DUP_THRESHOLD if nack else self.dupacks.get(seq_num, 0) + 1
+            if count < DUP_THRESHOLD:
+                self.dupacks[seq_num] = count
+                continue
+            self.dupacks.pop(seq_num, None)
+            if retries >= MAX_RETRIES:
+                # Lo resuelve su timer
+                continue
+            if self.recover is None or seq_num > self.recover:
+                # Episodio nuevo: una sola reducción hasta que se confirme lo enviado hasta acá
+                self.recover = self.next_seq_num - 1
+                proto.cc.on_loss()
+            logging.debug("Retransmisión rápida del paquete %d (intento %d)", seq_num, retries + 1)
+            self.pkts[seq_num] = (current_time, retries + 1)
+            heapq.heappush(self.timers, (current_time + proto.rtt.timeout, seq_num, current_time))
+            self.fast.append(seq_num)
+            self.fast_retransmits += 1
+
+
+class ReceiveWindow:
+    """Estado del receptor Selective Repeat, independiente de cómo se hace la E/S.
+
+    Cada chunk se escribe en su offset apenas llega (ver storage.OffsetFile):
+    no hay buffer de reordenamiento, sólo un bitmap de lo recibido. Un hueco
+    nuevo se confirma en el acto con un NACK. receive() procesa una ráfaga
+    entera: el servidor asíncrono la corre en un hilo para no bloquear el
+    event loop con el disco.
+    """
+
+    # Reportar los huecos nuevos con NACK (FEC prefiere esperar a la paridad)
+    nack_gaps = True
+
+    def __init__(self, protocol, file):
+        self.protocol = protocol
+        self.file = file
+        self.base_num = 0
+        self.bytes_received = 0
+        self.received = 0  # bit i: llegó el seq base_num + i
+        self.pending_acks = 0  # paquetes recibidos todavía no confirmados
+        self.ack_deadline = None
+        # Flags de los SACKs (FEC informa ahí la pérdida que ve, ver lib/fec_protocol.py)
+        self.sack_flags = 0
+        self.gap = False  # el próximo SACK es un NACK
+        self.packets_received = 0
+        self.duplicates = 0
+        self.out_of_order = 0  # llegaron con un hueco antes
+
+    def receive(self, pkts):
+        """Procesa paquetes parseados hasta el primer FIN. Devuelve (hay que
+        enviar un SACK ya, el FIN o None): toda la ráfaga se confirma junta"""
+        ack_now = False
+        for pkt in pkts:
+            if pkt.type == packet.FIN:
+                return ack_now, pkt
+            if pkt.type == packet.DATA:
+                ack_now = self.on_data(pkt) or ack_now
+            elif pkt.type == packet.PARITY:
+                ack_now = self.on_parity(pkt) or ack_now
+        return ack_now, None
+
+    def on_data(self, pkt):
+        """Procesa un paquete de datos. True si hay que enviar un SACK ya"""
+        proto = self.protocol
+        seq_received = pkt.seq
+        self.packets_received += 1
+        # Procesar según posición en ventana
+        if self.base_num <= seq_received < self.base_num + proto.window:
+            # CASO 1: Paquete en ventana
+            # Un hueco nuevo o un hueco que se llena se confirman en el acto
+            new_gap = seq_received > self.base_num and not self.received >> (seq_received - 1 - self.base_num) & 1
+            previous_base = self.base_num
+            self.gap = self.gap or new_gap
+            self._store(seq_received, pkt)
+            self.pending_acks += 1
+            if new_gap or self.base_num - previous_base > 1 or self.pending_acks >= proto.ack_every:
+                return True
+            if self.ack_deadline is None:
+                self.ack_deadline = proto.now() + proto.ack_delay
+            return False
+
+        if seq_received < self.base_num:
+            # CASO 2: Paquete duplicado: se perdió nuestro SACK
+            logging.debug("Paquete duplicado seq=%d", seq_received)
+            self.duplicates += 1
+            return True
+
+        # CASO 3: Paquete fuera de ventana (muy adelantado) - Ignorar
+        return False
+
+    def _store(self, seq_received, pkt):
+        """Escribe un paquete en ventana en su offset y avanza por los consecutivos"""
+        bit = 1 << (seq_received - self.base_num)
+        # Solo procesar si no lo tenemos ya
+        if self.received & bit:
+            self.duplicates += 1
+            return
+        if seq_received > self.base_num:
+            self.out_of_order += 1
+        try:
+            chunk = self.protocol.data_payload(pkt)
+        except ValueError as e:
+            logging.warning(f"Paquete seq={seq_received} descartado: {e}")
+            return
+        self._write(seq_received, chunk)
+
+    def _write(self, seq_received, chunk):
+        self.file.write_at(seq_received * self.protocol.mss, chunk)
+        self.received |= 1 << (seq_received - self.base_num)
+        self.bytes_received += len(chunk)
+        logging.debug("Escrito paquete seq=%d", seq_received)
+
+        # Los bits en 1 al inicio del bitmap son paquetes ya consecutivos
+        consecutive = (self.received ^ (self.received + 1)).bit_length() - 1
+        if consecutive:
+            self.received >>= consecutive
+            self.base_num += consecutive
+            self.file.advance(self.base_num * self.protocol.mss)
+
+    def on_parity(self, pkt):
+        """Paquete de paridad: sólo lo aprovecha FEC (ver lib/fec_protocol.py)"""
+        return False
+
+    def ack_due(self):
+        """El ACK diferido venció"""
+        return self.ack_deadline is not None and self.protocol.now() >= self.ack_deadline
+
+    def next_timeout(self, idle_timeout):
+        """Cuánto esperar el próximo paquete: hasta el ACK diferido o idle_timeout"""
+        if self.ack_deadline is None:
+            return idle_timeout
+        return max(self.ack_deadline - self.protocol.now(), 0.0001)
+
+    def sack(self):
+        """SACK con todo lo pendiente: ACK acumulativo + bitmap + ventana desde base_num.
+
+        Los paquetes fuera de orden ya están dentro de [base_num, base_num +
+        window): el emisor los cuenta al limitarse a ese borde, no se restan.
+        """
+        proto = self.protocol
+        self.pending_acks, self.ack_deadline = 0, None
+        # El bit 0 (base_num) nunca está en 1: el bitmap del SACK arranca en base_num + 1
+        out_of_order = bin(self.received).count("1")
+        nack, self.gap = self.gap and self.nack_gaps, False
+        logging.debug("%s enviado: acumulado=%d, fuera de orden=%d", "NACK" if nack else "SACK", self.base_num, out_of_order)
+        return packet.pack_sack(self.base_num, self.received >> 1, proto.window, proto.conn_id,
+                                self.sack_flags, nack)
+
 
 class SelectiveRepeatProtocol(BaseProtocol):
-    
+
+    def __init__(self, args, client_transport, options=None):
+        super().__init__(args, client_transport, options)
+        # Un SACK cada ack_every paquetes o ack_delay segundos, lo que ocurra primero
+        self.ack_every = getattr(args, "ack_every", None) or ACK_EVERY
+        ack_delay_ms = getattr(args, "ack_delay", None)
+        self.ack_delay = ack_delay_ms / 1000 if ack_delay_ms is not None else ACK_DELAY
+        self.rtt = RttEstimator(BASE_TIMEOUT, MAX_TIMEOUT, self.initial_rto)
+        self.last_backoff = 0.0
+        # Control de congestión del emisor: acordado en el handshake o elegido localmente
+        cc_name = self.options.get(handshake.OPT_CONGESTION) or getattr(args, "congestion", None) or congestion.DEFAULT
+        # self.window (acordada en el handshake) es el buffer del receptor y el
+        # tope de la ventana de congestión
+        self.cc = congestion.get_controller(cc_name, self.window)
+        # Última ventana anunciada por el receptor
+        self.peer_window = self.window
+        self.ack_buffer = packet.HEADER_SIZE + packet.SACK_WINDOW.size + (self.window + 7) // 8
+        # Datagrama más grande que recibe el receptor
+        self.max_datagram = self.mss + packet.HEADER_SIZE
+        if self.transport is not None:
+            self._size_socket_buffers(self.window)
+
+    def send_window(self, source, file_size):
+        return SendWindow(self, source, file_size)
+
+    def receive_window(self, file):
+        return ReceiveWindow(self, file)
+
     def send_upload(self, file_size):
         """Cliente: Envía archivo al servidor usando Selective Repeat"""
-        logging.info(f"CLIENTE: Iniciando envío de {file_size:,} bytes con ventana {WINDOW_SIZE}")
-        
-        with open(self.args.src, "rb") as file:
-            return self._send_file(file, file_size, (self.args.host, self.args.port))
+        logging.info(f"CLIENTE: Iniciando envío de {file_size:,} bytes con control de congestión {self.cc.name}")
+
+        with self.open_source(self.args.src) as source:
+            return self._send_file(source, self.transfer_length(file_size), (self.args.host, self.args.port))
 
     def receive_upload(self, addr, filename, filesize):
         """Servidor: Recibe archivo del cliente usando Selective Repeat"""
         file_path = self.get_file_path(filename)
         logging.info(f"SERVIDOR: Recibiendo '{filename}' ({filesize:,} bytes)")
-        
-        with open(file_path, "wb") as file:
-            success, bytes_received = self._receive_file(file, filesize, addr)
-            
+
+        with self.open_upload(file_path, filesize) as upload:
+            success, bytes_received = self._receive_file(upload.file, self.transfer_length(filesize), addr)
+            if success:
+                success = upload.commit()
+        self.close_receiver(success)
+
         if success:
             logging.info(f"Archivo {filename} recibido exitosamente: {bytes_received:,} bytes")
         return success, bytes_received
@@ -40,204 +409,135 @@ class SelectiveRepeatProtocol(BaseProtocol):
         """Servidor: Envía archivo al cliente usando Selective Repeat"""
         file_path = self.get_file_path(filename)
         logging.info(f"SERVIDOR: Enviando '{filename}' ({filesize:,} bytes)")
-        
-        with open(file_path, "rb") as file:
-            return self._send_file(file, filesize, addr)
+
+        with self.open_source(file_path) as source:
+            return self._send_file(source, self.transfer_length(filesize), addr)
 
     def receive_download(self, filesize):
         """Cliente: Recibe archivo del servidor usando Selective Repeat"""
         file_path = self._get_download_path()
         logging.info(f"CLIENTE: Recibiendo archivo ({filesize:,} bytes)")
-        
-        with open(file_path, "wb") as file:
-            success, _ = self._receive_file(file, filesize, None)
-            return success
-
-    def _send_file(self, file, file_size, dest_addr):
-        """Lógica común para enviar archivos con ventana deslizante"""
-        base_num = 0
-        next_seq_num = 0
-        bytes_sent = 0
-        pkts = {}  # {seq_num: (packet, sent_time, retries)}
-        estimated_rtt = 0.001
-        start_time = time.time()
-
-        while bytes_sent < file_size or pkts:
-            # FASE 1: Llenar ventana
-            next_seq_num, bytes_sent = self._fill_send_window(
-                file, file_size, base_num, next_seq_num, bytes_sent, pkts, dest_addr
-            )
 
-            # FASE 2: Manejar timeouts
-            if not self._handle_timeouts(pkts, estimated_rtt, dest_addr):
-                return False
+        with self.open_download(file_path, filesize) as download:
+            success, _ = self._receive_file(download.file, self.transfer_length(filesize), None)
+            if success:
+                success = download.commit()
+        self.close_receiver(success)
+        return success
 
-            # FASE 3: Procesar ACKs
-            base_num = self._process_acks(pkts, base_num, next_seq_num)
-            
-            # Mostrar progreso
-            if base_num % 20 == 0:
-                self.show_progress_bar(base_num * BUFFER, file_size)
+    def _send_file(self, source, file_size, dest_addr):
+        """Lógica común para enviar archivos con ventana deslizante.
 
-            # FASE 4: Verificar fin
-            if not pkts and bytes_sent >= file_size:
+        El loop es guiado por eventos: duerme hasta que llega un SACK o vence
+        el próximo timer de retransmisión (heap de deadlines). Los paquetes
+        nuevos y las retransmisiones salen en tandas (ver lib/batch_io.py).
+        """
+        io, source = self.track(file_size, self.transport.io(self.ack_buffer), source)
+        window = self.counters = self.send_window(source, file_size)
+        start_time = self.now()
+
+        while True:
+            # FASE 1: Llenar ventana
+            io.send(window.new_datagrams(), dest_addr)
+
+            # FASE 2: Verificar fin
+            if window.done:
                 break
-                
-            # Control de flujo
-            if len(pkts) >= WINDOW_SIZE:
-                time.sleep(0.01)
 
-        self.send_fyn(dest_addr)
+            # FASE 3: Esperar un SACK o el vencimiento del timer más próximo
+            if self._process_acks(window, io, window.next_timeout()):
+                # Mostrar progreso
+                if window.base_num % 20 == 0:
+                    self.show_progress_bar(window.base_num * self.mss, file_size)
+
+            # FASE 4: Retransmitir los paquetes cuyo timer venció
+            retransmissions = window.expired()
+            if retransmissions is None:
+                return False
+            io.send((window.datagram(seq_num) for seq_num in retransmissions), dest_addr)
+
+        # FASE 5: Cierre: FIN hasta que llegue el FIN-ACK
+        if not self.close_sender(io, dest_addr):
+            return False
 
-        # FASE 5: Limpiar ACKs finales
-        self.cleanup_duplicates()
-        
         self.show_progress_bar(file_size, file_size)
-        elapsed = time.time() - start_time
-        logging.info(f"Transferencia completada: {bytes_sent:,} bytes en {elapsed:.1f}s")
+        elapsed = self.now() - start_time
+        logging.info(f"Transferencia completada: {window.bytes_sent:,} bytes en {elapsed:.1f}s "
+                     f"({window.fast_retransmits} retransmisiones rápidas, {window.timeout_retransmits} por timeout)")
         return True
 
     def _receive_file(self, file, filesize, sender_addr):
         """Lógica común para recibir archivos con ventana deslizante"""
-        base_num = 0
-        bytes_received = 0
-        received_pkts = {}  # {seq_num: chunk}
-        start_time = time.time()
+        io, file = self.track(filesize, self.transport.io(self.max_datagram), file)
+        window = self.counters = self.receive_window(file)
+        ack_addr = sender_addr
+        start_time = self.now()
         progress_time = start_time
-        
-        self.socket.settimeout(60.0)
 
         while True:
             try:
-                packet, addr = self.socket.recvfrom(RECEIVE_BUFFER)
-                # Parsear paquete
-                try:
-                    seq_received, chunk = self.parse_packet(packet)
-                except ValueError:
-                    continue
-                
-                if seq_received == -99 and chunk == "fin":
-                    logging.debug(f"Carga Completada: No se desean recibir ACKS")
-                    self.send_fyn(addr)
+                # ACK diferido vencido: confirmar todo lo pendiente en un solo SACK
+                if window.ack_due():
+                    self.transport.sendto(window.sack(), ack_addr)
+
+                datagrams = io.recv(window.next_timeout(RECEIVER_IDLE_TIMEOUT))
+                if not datagrams:
+                    if window.ack_deadline is not None:
+                        continue
+                    logging.warning("Timeout - conexión perdida")
+                    return False, window.bytes_received
+
+                pkts = []
+                for datagram, addr in datagrams:
+                    try:
+                        pkts.append(self.parse_packet(datagram))
+                    except ValueError:
+                        continue
+                    ack_addr = sender_addr or addr
+                # Toda la ráfaga se confirma con un solo SACK
+                ack_now, fin = window.receive(pkts)
+                if ack_now:
+                    self.transport.sendto(window.sack(), ack_addr)
+
+                if fin is not None:
+                    # El FIN-ACK sale en close_receiver, cuando el archivo ya está guardado
+                    self.fin = (fin, addr)
+                    if not self.accept_fin(fin, window.bytes_received, filesize):
+                        return False, window.bytes_received
                     break
-                # Procesar según posición en ventana
-                if self._is_in_receive_window(seq_received, base_num):
-                    # CASO 1: Paquete en ventana
-                    bytes_received, base_num = self._handle_in_window_packet(
-                        seq_received, chunk, received_pkts, file, bytes_received, base_num
-                    )
-                    self.send_ack(seq_received, sender_addr or addr)
-                    
-                elif seq_received < base_num:
-                    # CASO 2: Paquete duplicado
-                    logging.debug(f"Paquete duplicado seq={seq_received}")
-                    self.send_ack(seq_received, sender_addr or addr)
-
-                # CASO 3: Paquete fuera de ventana (muy adelantado) - Ignorar
 
                 # Mostrar progreso
-                current_time = time.time()
+                current_time = self.now()
                 if current_time - progress_time > 1:
-                    self.show_progress_bar(bytes_received, filesize)
+                    self.show_progress_bar(window.bytes_received, filesize)
                     progress_time = current_time
 
-            except socket.timeout:
-                logging.warning("Timeout - conexión perdida")
-                return False, bytes_received
             except (ConnectionResetError, OSError) as e:
                 logging.info(f"Conexión interrumpida: {e}")
-                return False, bytes_received
+                return False, window.bytes_received
             except Exception as e:
                 logging.error(f"Error inesperado: {e}")
                 continue
 
         self.show_progress_bar(filesize, filesize)
-        elapsed = time.time() - start_time
-        logging.info(f"Recepción completada: {bytes_received:,} bytes en {elapsed:.1f}s")
-        
-        self.cleanup_duplicates()
-        return True, bytes_received
-
-    def _fill_send_window(self, file, file_size, base_num, next_seq_num, bytes_sent, pkts, dest_addr):
-        """Llena la ventana de envío con nuevos paquetes"""
-        while next_seq_num < base_num + WINDOW_SIZE and bytes_sent < file_size:
-            chunk = file.read(BUFFER)
-            if not chunk:
-                break
-                
-            packet = self.create_packet(next_seq_num, chunk)
-            pkts[next_seq_num] = (packet, time.time(), 0)
-            
-            logging.debug(f"Enviando paquete seq={next_seq_num}")
-            self.socket.sendto(packet, dest_addr)
-            
-            next_seq_num += 1
-            bytes_sent += len(chunk)
-        return next_seq_num, bytes_sent 
-
-    def _handle_timeouts(self, pkts, estimated_rtt, dest_addr):
-        """Maneja timeouts y retransmisiones"""
-        current_time = time.time()
-        current_timeout = self.calculate_timeout(estimated_rtt, BASE_TIMEOUT, MAX_TIMEOUT, 3.0)
-
-        for seq_num in list(pkts.keys()):
-            packet, sent_time, retries = pkts[seq_num]
-            
-            if current_time - sent_time > current_timeout:
-                if retries >= MAX_RETRIES:
-                    logging.error(f"Paquete {seq_num} falló después de {MAX_RETRIES} reintentos")
-                    return False
-                
-                logging.debug(f"Reenviando paquete {seq_num} (intento {retries + 1})")
-                self.socket.sendto(packet, dest_addr)
-                pkts[seq_num] = (packet, current_time, retries + 1)
-                
-        return True
+        elapsed = self.now() - start_time
+        logging.info(f"Recepción completada: {window.bytes_received:,} bytes en {elapsed:.1f}s")
+        return True, window.bytes_received
 
-    def _process_acks(self, pkts, base_num, next_seq_num):
-        """Procesa ACKs recibidos y desliza la ventana"""
-        self.socket.settimeout(0.05)
-        
+    def _process_acks(self, window, io, timeout):
+        """Espera hasta timeout por SACKs y procesa todos los encolados. False si no llegó ninguno"""
         try:
-            data, _ = self.socket.recvfrom(ACK_BUFFER)
-            response = data.decode().strip()
-            logging.debug(f"TOTALES ACK ESPERADOS TODAVIA NO RECIBIDOS:{len(pkts)}")
-            if response.startswith("ACK:"):
-                ack_seq = int(response.split(":")[1])
-                
-                if ack_seq in pkts:
-                    logging.debug(f"ACK válido para seq={ack_seq}")
-                    del pkts[ack_seq]
-                    
-                    # Deslizar ventana
-                    while base_num not in pkts and base_num < next_seq_num:
-                        base_num += 1
-                        
-        except socket.timeout:
-            pass
-        except (ValueError, UnicodeDecodeError, ConnectionResetError, OSError):
+            datagrams = io.recv(timeout)
+            if not datagrams:
+                return False
+            while datagrams:
+                for data, _ in datagrams:
+                    try:
+                        window.on_ack(self.parse_packet(data))
+                    except ValueError:
+                        continue
+                datagrams = io.recv(0)
+        except (ConnectionResetError, OSError):
             pass
-            
-        return base_num
-
-    def _is_in_receive_window(self, seq_num, base_num):
-        """Verifica si un número de secuencia está en la ventana de recepción"""
-        return base_num <= seq_num < base_num + WINDOW_SIZE
-
-    def _handle_in_window_packet(self, seq_received, chunk, received_pkts, file, bytes_received, base_num):
-        """Maneja paquetes que están dentro de la ventana de recepción"""
-        # Solo procesar si no lo tenemos ya
-        if seq_received not in received_pkts:
-            received_pkts[seq_received] = chunk
-            logging.debug(f"Procesado paquete seq={seq_received}")
-        
-        # Escribir paquetes consecutivos
-        while base_num in received_pkts:
-            chunk_to_write = received_pkts[base_num]
-            file.write(chunk_to_write)
-            bytes_received += len(chunk_to_write)
-            logging.debug(f"Escrito paquete seq={base_num}")
-            del received_pkts[base_num]
-            base_num += 1
-            
-        return bytes_received, base_num
+        logging.debug("TOTALES ACK ESPERADOS TODAVIA NO RECIBIDOS:%d", len(window.pkts))
+        return True
@@ -0,0 +1,309 @@
+import argparse
+import errno
+import heapq
+import itertools
+import logging
+import os
+import threading
+
+from . import batch_io, packet
+from .download_protocol import DownloadProtocol
+from .relay import Impairments, LinkModel
+from .srv_protocol import ServerProtocol
+from .upload_protocol import UploadProtocol
+
+# Red simulada en memoria para correr transferencias enteras dentro del
+# proceso, rápido y reproducible: los datagramas no pasan por el kernel, el
+# enlace se degrada con el mismo modelo que el relay (ver lib/relay.py) y el
+# tiempo es un reloj virtual.
+#
+# Cada participante (cliente, servidor, sesión) es un hilo, pero corre uno
+# solo a la vez: el que tiene el turno sigue hasta bloquearse esperando un
+# datagrama, un timeout o a otro hilo. Ahí el turno pasa al primero, en orden
+# de creación, que pueda seguir; si ninguno puede, el reloj salta al próximo
+# evento (una llegada o un timeout). El cómputo no consume tiempo virtual, así
+# que la misma seed da siempre la misma secuencia de eventos.
+'''DIRECCIONES'''
+# Todos los extremos comparten una dirección y se distinguen por el puerto
+HOST = "127.0.0.1"
+SERVER_PORT = 9000
+EPHEMERAL_PORT = 49152
+'''TRANSFERENCIAS'''
+# El servidor revisa cada este tiempo virtual si terminó el cliente
+SERVER_POLL = 1.0
+
+
+class SimulatedThread:
+    """Participante de la simulación: corre sólo cuando tiene el turno"""
+
+    def __init__(self, network, target, args):
+        self.network = network
+        self.target = target
+        self.args = args
+        self.alive = True
+        self.result = None
+        self.error = None
+        # Mientras espera: ready() dice si puede seguir y next_event() cuándo podría
+        self.ready = None
+        self.next_event = None
+        self.stalled = False
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        network = self.network
+        with network.cond:
+            network.threads[threading.get_ident()] = self
+            network._wait_turn(self)
+        try:
+            self.result = self.target(*self.args)
+        except BaseException as e:
+            self.error = e
+            logging.error(f"Simulación: {self.target.__name__} terminó con error: {e!r}")
+        finally:
+            with network.cond:
+                self.alive = False
+                network._switch()
+
+    def is_alive(self):
+        return self.alive
+
+    def join(self, timeout=None):
+        """Espera en tiempo virtual a que termine (o timeout segundos)"""
+        network = self.network
+        with network.cond:
+            deadline = None if timeout is None else network.time + timeout
+            expired = lambda: deadline is not None and network.time >= deadline
+            while self.alive and not expired():
+                network._block(lambda: not self.alive or expired(), lambda: deadline)
+
+
+class SimulatedTransport:
+    """Extremo de la red simulada con la interfaz de transport.UdpTransport"""
+
+    def __init__(self, network, port):
+        self.network = network
+        self.addr = (HOST, port)
+        self.inbox = []  # heap de (llegada, orden, datos, origen)
+        self.link_free = 0.0  # cuándo termina de salir lo encolado (con bandwidth)
+        self.closed = False
+
+    def now(self):
+        return self.network.time
+
+    def sendto(self, data, addr):
+        self.network._send(self, bytes(data), addr)
+
+    def send_parts(self, parts, addr):
+        self.network._send(self, b"".join(parts), addr)
+
+    def recvfrom(self, bufsize, timeout):
+        datagrams = self.network._receive(self, bufsize, timeout, 1)
+        return datagrams[0] if datagrams else None
+
+    def io(self, bufsize):
+        return SimulatedIO(self, bufsize)
+
+    def set_buffers(self, size):
+        """Los extremos simulados no pierden por buffer: no hay nada que ajustar"""
+
+    def getsockname(self):
+        return self.addr
+
+    def close(self):
+        self.network._close(self)
+
+    def _ready(self):
+        return bool(self.inbox) and self.inbox[0][0] <= self.network.time
+
+    def _next_arrival(self):
+        return self.inbox[0][0] if self.inbox else None
+
+
+class SimulatedIO:
+    """batch_io sobre un extremo simulado: tandas de hasta batch_io.BATCH datagramas"""
+
+    def __init__(self, transport, bufsize):
+        self.transport = transport
+        self.bufsize = bufsize
+
+    def send(self, datagrams, addr):
+        for parts in datagrams:
+            self.transport.send_parts(parts, addr)
+
+    def recv(self, timeout):
+        return self.transport.network._receive(self.transport, self.bufsize, timeout, batch_io.BATCH)
+
+
+class SimulatedNetwork:
+    """Red en memoria con reloj virtual y enlace degradado reproducible.
+
+    bandwidth (bytes/s) limita lo que sale de cada extremo, con una cola de
+    queue bytes que descarta lo que no entra (None: sin límite). Los
+    datagramas de más de mtu bytes fallan con EMSGSIZE, como con DF.
+    Se usa como la red real (ver transport.UdpNetwork): open() da extremos
+    y start_thread() participantes; run() corre la simulación.
+    """
+
+    def __init__(self, impairments=Impairments(), seed=None, bandwidth=None, queue=None, mtu=packet.MAX_DATAGRAM):
+        self.link = LinkModel(impairments, seed)
+        self.bandwidth = bandwidth
+        self.queue = queue
+        self.mtu = mtu
+        self.time = 0.0
+        self.cond = threading.Condition()
+        self.endpoints = {}  # {puerto: SimulatedTransport}
+        self.participants = []
+        self.threads = {}  # {ident del hilo: SimulatedThread}
+        self.current = None
+        self.ports = itertools.count(EPHEMERAL_PORT)
+        self.order = itertools.count()
+
+    @property
+    def stats(self):
+        return self.link.stats
+
+    def open(self, host="", port=0):
+        with self.cond:
+            if not port:
+                port = next(port for port in self.ports if port not in self.endpoints)
+            if port in self.endpoints:
+                raise OSError(errno.EADDRINUSE, os.strerror(errno.EADDRINUSE))
+            transport = self.endpoints[port] = SimulatedTransport(self, port)
+            return transport
+
+    def start_thread(self, target, *args):
+        """Agrega un participante; corre cuando le toque el turno"""
+        participant = SimulatedThread(self, target, args)
+        with self.cond:
+            self.participants.append(participant)
+        participant.thread.start()
+        return participant
+
+    def run(self):
+        """Corre hasta que terminan todos los participantes. Devuelve el tiempo virtual"""
+        with self.cond:
+            if self.current is None:
+                self._switch()
+            self.cond.wait_for(lambda: not any(participant.alive for participant in self.participants))
+        for participant in self.participants:
+            participant.thread.join()
+        return self.time
+
+    def _send(self, source, data, addr):
+        if len(data) > self.mtu:
+            raise OSError(errno.EMSGSIZE, os.strerror(errno.EMSGSIZE))
+        with self.cond:
+            departure = self.time
+            if self.bandwidth:
+                start = max(self.time, source.link_free)
+                if self.queue is not None and (start - self.time) * self.bandwidth + len(data) > self.queue:
+                    self.link.stats["dropped"] += 1
+                    return
+                departure = source.link_free = start + len(data) / self.bandwidth
+            destination = self.endpoints.get(addr[1])
+            for delay in self.link.delays(data):
+                if destination is not None:
+                    heapq.heappush(destination.inbox, (departure + delay, next(self.order), data, source.addr))
+                    self.link.stats["forwarded"] += 1
+
+    def _receive(self, transport, bufsize, timeout, limit):
+        with self.cond:
+            deadline = None if timeout is None else self.time + timeout
+            while not transport._ready():
+                if transport.closed:
+                    raise OSError(errno.EBADF, os.strerror(errno.EBADF))
+                if deadline is not None and self.time >= deadline:
+                    return []
+                self._block(lambda: transport._ready() or transport.closed
+                            or (deadline is not None and self.time >= deadline),
+                            lambda: min((t for t in (transport._next_arrival(), deadline) if t is not None), default=None))
+            datagrams = []
+            while len(datagrams) < limit and transport._ready():
+                _, _, data, source = heapq.heappop(transport.inbox)
+                datagrams.append((data[:bufsize], source))
+            return datagrams
+
+    def _close(self, transport):
+        with self.cond:
+            transport.closed = True
+            transport.inbox.clear()
+            if self.endpoints.get(transport.addr[1]) is transport:
+                del self.endpoints[transport.addr[1]]
+
+    def _block(self, ready, next_event):
+        """Cede el turno hasta que ready() sea cierto (con el lock tomado)"""
+        participant = self.threads.get(threading.get_ident())
+        if participant is None:
+            raise RuntimeError("Sólo los hilos de la simulación pueden esperar en la red simulada")
+        participant.ready, participant.next_event = ready, next_event
+        self._switch()
+        self._wait_turn(participant)
+        participant.ready = participant.next_event = None
+        if participant.stalled:
+            participant.stalled = False
+            raise OSError(errno.ETIMEDOUT, "Red simulada sin eventos pendientes")
+
+    def _wait_turn(self, participant):
+        self.cond.wait_for(lambda: self.current is participant)
+
+    def _switch(self):
+        """Da el turno al primero que puede seguir, adelantando el reloj si hace falta"""
+        while True:
+            alive = [participant for participant in self.participants if participant.alive]
+            if not alive:
+                self.current = None
+                break
+            runnable = next((p for p in alive if p.ready is None or p.ready()), None)
+            if runnable is not None:
+                self.current = runnable
+                break
+            events = [event for p in alive if (event := p.next_event()) is not None]
+            if not events:
+                # Todos esperan sin timeout algo que no va a llegar: se despierta al primero con error
+                alive[0].stalled = True
+                self.current = alive[0]
+                break
+            self.time = max(self.time, min(events))
+        self.cond.notify_all()
+
+
+def _client_args(port, protocol, name, **options):
+    return argparse.Namespace(host=HOST, port=port, protocol=protocol, name=name, src=None, dst=None,
+                              manifest=None, verbose=False, quiet=True, **options)
+
+
+def run_transfer(network, direction, protocol, local_path, storage_dir, name, client_options=None,
+                 server_options=None):
+    """Corre una subida o descarga entera, con saludo y ServerProtocol, en la red simulada.
+
+    local_path es el origen de una subida o el destino de una descarga.
+    client_options y server_options completan los args (p. ej. window, mss,
+    compress, congestion). Devuelve (éxito, segundos virtuales del cliente).
+    """
+    server_args = argparse.Namespace(host=HOST, port=SERVER_PORT, storage=storage_dir, **(server_options or {}))
+    server = ServerProtocol(server_args, network)
+    server.set_main_socket(network.open(HOST, SERVER_PORT))
+    args = _client_args(SERVER_PORT, protocol, name, **(client_options or {}))
+    if direction == "upload":
+        args.src = local_path
+        client = UploadProtocol(args, network)
+        transfer = client.upload_file
+    else:
+        args.dst = local_path
+        client = DownloadProtocol(args, network)
+        transfer = client.download_file
+    elapsed = []
+
+    def run_client():
+        start = network.time
+        try:
+            return transfer()
+        finally:
+            elapsed.append(network.time - start)
+            client.close()
+
+    client_thread = network.start_thread(run_client)
+    network.start_thread(server.serve, lambda: not client_thread.is_alive(), SERVER_POLL)
+    network.run()
+    server.main_socket.close()
+    return bool(client_thread.result), elapsed[0]
@@ -1,14 +1,18 @@
 import os
 import socket
 import logging
+import threading
 
-from lib.stop_and_wait_protocol import StopAndWaitProtocol
-from lib.selective_repeat_protocol import SelectiveRepeatProtocol
+from lib import admission, batch, file_cache, handshake, metrics, packet, path_mtu, protocols, storage, transport
 
 
 # Network Configuration
 class NetworkConfig:
     TIMEOUT = 10
+    # Cada cuánto el loop principal revisa si tiene que cerrar
+    POLL = 1.0
+    # Entra un sondeo de MTU del tamaño máximo de datagrama
+    MAIN_BUFFER = packet.MAX_DATAGRAM
     BUFFER_SIZE = 1024
     BUFFER_SIZE_SR = 4096
     BUFFER_SIZE_SW = 4096
@@ -23,6 +27,7 @@ class Messages:
     UPLOAD_COMPLETE = b"UPLOAD_COMPLETE"
     ERROR_INVALID_FORMAT = b"ERROR:InvalidFormat"
     ERROR_FILE_NOT_FOUND = b"ERROR:FileNotFound"
+    ERROR_UNSUPPORTED_VERSION = b"ERROR:UnsupportedVersion"
 
 
 # Client Message Types
@@ -33,8 +38,9 @@ class ClientMessages:
 
 # Protocol Names
 class Protocols:
-    STOP_AND_WAIT = "stop-and-wait"
-    SELECTIVE_REPEAT = "selective-repeat"
+    STOP_AND_WAIT = protocols.STOP_AND_WAIT
+    SELECTIVE_REPEAT = protocols.SELECTIVE_REPEAT
+    FEC = protocols.FEC
 
 
 # File Information
@@ -43,63 +49,220 @@ class FileInfo:
     DEFAULT_STORAGE = "storage"
 
 
+class ServerStorage:
+    """Consultas al storage del saludo, compartidas por este servidor y el
+    asíncrono (lib/async_server.py)"""
+
+    def __init__(self, args):
+        self.path = args.storage or FileInfo.DEFAULT_STORAGE
+
+    def file_path(self, filename):
+        return os.path.join(self.path, filename)
+
+    def queued_size(self, admission, filename, options):
+        """Bytes de una descarga, para ordenar la cola (0 si no existe: el error sale enseguida)"""
+        if admission is None or not admission.sized:
+            return 0
+        if handshake.OPT_BATCH in options:
+            # Sólo tamaños: los digests se calculan al abrir la sesión
+            return batch.stream_length(batch.list_matches(self.path, filename))
+        return storage.file_size(self.file_path(filename)) or 0
+
+    def negotiate_part(self, sendto, addr, options, accepted, filename, filesize, upload):
+        """Rango de una transferencia en paralelo o reanudada. False si se
+        rechazó: el error se le envía a addr con sendto"""
+        options = options or {}
+        confirmed = None
+        if upload and handshake.OPT_RESUME in options:
+            confirmed = storage.upload_ranges(self.file_path(filename), options.get(handshake.OPT_TRANSFER))
+        if handshake.negotiate_part(options, accepted, filesize, upload, confirmed):
+            return True
+        logging.warning(f"SERVIDOR: Porción inválida pedida por {addr}: {options}")
+        sendto(Messages.ERROR_INVALID_FORMAT, addr)
+        return False
+
+    def digest_index(self):
+        os.makedirs(self.path, exist_ok=True)
+        return storage.DigestIndex(self.path)
+
+
 # =============================================================================
 
 
 class ServerProtocol:
-    def __init__(self, args):
+    def __init__(self, args, network=None):
         self.args = args
+        # Storage de los archivos, compartido con lib/async_server.py
+        self.store = ServerStorage(args)
+        # Red de los sockets temporales y los hilos de sesión (ver lib/transport.py)
+        self.network = network or transport.UdpNetwork()
         self.main_socket = None
+        # Sesiones en curso por dirección del cliente: {addr: (socket, respuesta)}
+        # para reenviar la respuesta si el cliente retransmite el saludo (None
+        # mientras se negocia: todavía no hay respuesta)
+        self.sessions = {}
+        self.sessions_lock = threading.Lock()
+        # Mapeos de los archivos más descargados, compartidos por los hilos
+        self.file_cache = file_cache.from_args(args)
+        # Tope de transferencias a la vez y cola de saludos (None: sin tope)
+        self.admission = admission.from_args(args)
+        # Agregados para /metrics (None si no se pidió --metrics-port)
+        self.metrics = metrics.from_args(args, self.file_cache, self.admission)
 
     def set_main_socket(self, socket):
+        """Socket UDP principal o un transporte de self.network"""
         logging.debug(f"Seteando main_socket: {socket}")
-        self.main_socket = socket
+        self.main_socket = transport.wrap(socket)
 
     def _setup_client_socket(self):
         """Configura el socket temporal del cliente"""
         logging.debug("Creando socket temporal para cliente")
-        client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-        client_socket.bind(("", 0))
+        client_socket = self.network.open()
         client_port = client_socket.getsockname()[1]
         logging.debug(f"Socket temporal creado en puerto {client_port}")
         return client_socket, client_port
 
-    def handle_upload(self, addr, protocol, filename, filesize):
+    def answer_probe(self, data, addr):
+        """Responde los sondeos de MTU que llegan al socket principal"""
+        return path_mtu.answer_probe(self.main_socket, data, addr)
+
+    def _resend_if_active(self, addr):
+        """Si addr ya tiene una sesión, reenvía su respuesta de handshake"""
+        with self.sessions_lock:
+            if addr not in self.sessions:
+                return False
+            session = self.sessions[addr]
+        self._resend(addr, session)
+        return True
+
+    def _claim_session(self, addr):
+        """Reserva la sesión de addr antes de negociar. False si ya tiene una: un
+        saludo duplicado que llegó en otro hilo no abre una segunda sesión"""
+        with self.sessions_lock:
+            if addr not in self.sessions:
+                self.sessions[addr] = None
+                return True
+            session = self.sessions[addr]
+        self._resend(addr, session)
+        return False
+
+    def _resend(self, addr, session):
+        if session is None:
+            logging.debug(f"Saludo duplicado de {addr}, la sesión se está negociando")
+            return
+        sock, response = session
+        logging.debug(f"Saludo duplicado de {addr}, reenviando {response}")
+        sock.sendto(response, addr)
+
+    def _register_session(self, addr, sock, response):
+        with self.sessions_lock:
+            self.sessions[addr] = (sock, response)
+
+    def _unregister_session(self, addr):
+        with self.sessions_lock:
+            self.sessions.pop(addr, None)
+
+    def _negotiate(self, addr, options):
+        """Negocia las opciones de la sesión o rechaza el saludo"""
+        accepted = handshake.negotiate_options(options or {}, self.args)
+        if accepted is None:
+            logging.warning(
+                f"SERVIDOR: {addr} no ofrece una versión de formato soportada. Rechazando."
+            )
+            self.main_socket.sendto(Messages.ERROR_UNSUPPORTED_VERSION, addr)
+        return accepted
+
+    def _deduplicate(self, addr, filename, accepted):
+        """Si el storage ya tiene el contenido, publica filename y responde sin recibir datos"""
+        digest = accepted.get(handshake.OPT_DIGEST)
+        if digest is None or not self.store.digest_index().link(digest, filename):
+            return False
+        self._invalidate(filename)
+        accepted[handshake.OPT_DEDUP] = 1
+        response = handshake.format_message("UPLOAD_OK", self.main_socket.getsockname()[1], options=accepted)
+        self.main_socket.sendto(response.encode(), addr)
+        logging.info(f"SERVIDOR: '{filename}' ya estaba en el storage (sha256 {digest[:12]}...), subida de {addr} completada sin datos")
+        return True
+
+    def _invalidate(self, filename):
+        """Una subida reemplazó filename: su mapeo en caché ya no sirve"""
+        if self.file_cache is not None:
+            self.file_cache.invalidate(self.get_file_path(filename))
+
+    def get_file_path(self, filename):
+        return self.store.file_path(filename)
+
+    def _track(self, handler, direction, protocol, filename, addr):
+        """Estadísticas de la transferencia del handler, si se piden métricas"""
+        handler.stats = metrics.for_transfer(self.args, direction, protocol, filename, addr, self.metrics, "server")
+
+    def handle_upload(self, addr, protocol, filename, filesize, options=None):
+        client_socket = None
+        protocol_handler = None
+        success = False
+        if not self._claim_session(addr):
+            return
         try:
             logging.debug(
                 f"Iniciando handle_upload para {addr}, protocolo={protocol}, filename={filename}, filesize={filesize}"
             )
+            accepted = self._negotiate(addr, options)
+            if accepted is None or self._deduplicate(addr, filename, accepted):
+                return
+            if not self.store.negotiate_part(self.main_socket.sendto, addr, options, accepted, filename, filesize, True):
+                return
             client_socket, client_port = self._setup_client_socket()
             logging.info(f"SERVIDOR: Hilo para {addr} en puerto temporal {client_port}")
 
-            response = f"UPLOAD_OK:{client_port}"
+            response = handshake.format_message("UPLOAD_OK", client_port, options=accepted)
             logging.debug(f"Enviando handshake de upload: {response} a {addr}")
+            self._register_session(addr, client_socket, response.encode())
             client_socket.sendto(response.encode(), addr)
 
-            protocol_handler = self.get_protocol(protocol, self.args, client_socket)
+            protocol_handler = self.get_protocol(protocol, self.args, client_socket, accepted)
+            self._track(protocol_handler, "upload", protocol, filename, addr)
             logging.debug(f"Instanciado handler de protocolo: {protocol_handler}")
             success, _ = protocol_handler.receive_upload(addr, filename, filesize)
             logging.debug(f"Resultado de receive_upload: {success}")
             if success:
-                client_socket.close()
+                self._invalidate(filename)
                 logging.info(f"File '{filename}' received successfully from {addr}")
             else:
                 logging.error(f"File transfer from {addr} failed.")
         except Exception as e:
             logging.critical(f"Error fatal en el hilo de {addr}: {e}")
+        finally:
+            self._unregister_session(addr)
+            if protocol_handler is not None:
+                metrics.finish(protocol_handler.stats, success)
+            if client_socket is not None:
+                client_socket.close()
+                logging.debug(f"Socket temporal cerrado para {addr}")
 
-    def handle_download(self, addr, protocol, filename):
+    def handle_download(self, addr, protocol, filename, options=None):
+        client_socket = None
+        protocol_handler = None
+        success = False
+        if not self._claim_session(addr):
+            return
         try:
             logging.debug(
                 f"Iniciando handle_download para {addr}, protocolo={protocol}, filename={filename}"
             )
+            accepted = self._negotiate(addr, options)
+            if accepted is None:
+                return
 
-            storage_path = (
-                self.args.storage if self.args.storage else FileInfo.DEFAULT_STORAGE
-            )
-            file_path = os.path.join(storage_path, filename)
+            file_path = self.store.file_path(filename)
             logging.debug(f"Ruta de archivo a enviar: {file_path}")
-            if not os.path.isfile(file_path):
+            entries = None
+            if handshake.OPT_BATCH in accepted:
+                # Lote: filename es una lista de nombres o patrones
+                entries = batch.match(self.store.path, filename)
+                filesize = batch.stream_length(entries) if entries else None
+            else:
+                filesize = storage.file_size(file_path)
+            if filesize is None:
                 logging.debug(
                     f"Archivo '{filename}' no existe, enviando error a {addr}"
                 )
@@ -108,23 +271,34 @@ class ServerProtocol:
                     f"SERVIDOR: El archivo '{filename}' no existe. Enviando ERROR a {addr}."
                 )
                 return
-            filesize = os.path.getsize(file_path)
             logging.info(
                 f"SERVIDOR: Archivo '{filename}' encontrado ({filesize} bytes)."
             )
+            if not self.store.negotiate_part(self.main_socket.sendto, addr, options, accepted, filename, filesize, False):
+                return
+            if entries is not None:
+                accepted[handshake.OPT_BATCH] = len(entries)
+                logging.info(f"SERVIDOR: Lote de {len(entries)} archivos ({filesize:,} bytes)")
+            else:
+                accepted[handshake.OPT_DIGEST] = self.store.digest_index().digest_of(filename)
             client_socket, client_port = self._setup_client_socket()
             logging.info(f"SERVIDOR: Socket temporal creado en puerto {client_port}")
 
-            response = f"DOWNLOAD_OK:{client_port}:{filesize}"
+            response = handshake.format_message(
+                "DOWNLOAD_OK", client_port, filesize, options=accepted
+            )
             logging.debug(f"Enviando handshake de download: {response} a {addr}")
             
+            self._register_session(addr, self.main_socket, response.encode())
             self.main_socket.sendto(response.encode(), addr)
             
             logging.info(
                 f"SERVIDOR: Handshake enviado por socket principal: {response}"
             )
 
-            protocol_handler = self.get_protocol(protocol, self.args, client_socket)
+            protocol_handler = self.get_protocol(protocol, self.args, client_socket, accepted)
+            protocol_handler.batch = entries
+            self._track(protocol_handler, "download", protocol, filename, addr)
             logging.debug(f"Instanciado handler de protocolo: {protocol_handler}")
             success = protocol_handler.send_download(addr, filename, filesize)
             logging.debug(f"Resultado de send_download: {success}")
@@ -137,27 +311,58 @@ class ServerProtocol:
         except Exception as e:
             logging.critical(f"Error fatal en descarga para {addr}: {e}")
         finally:
+            self._unregister_session(addr)
+            if protocol_handler is not None:
+                metrics.finish(protocol_handler.stats, success)
             try:
                 client_socket.close()
                 logging.debug(f"Socket temporal cerrado para {addr}")
             except:
                 pass
 
-    def get_protocol(self, protocol_name, args, socket):
+    def get_protocol(self, protocol_name, args, socket, options=None):
         """Devuelve el manejador de protocolo correspondiente."""
         logging.debug(f"get_protocol llamado con protocol_name={protocol_name}")
-        protocols = {
-            Protocols.STOP_AND_WAIT: StopAndWaitProtocol,
-            Protocols.SELECTIVE_REPEAT: SelectiveRepeatProtocol,
-        }
-        if protocol_name in protocols:
+        handler = protocols.create_handler(protocol_name, args, socket, options)
+        if handler is not None:
             logging.debug(
                 f"Protocolo encontrado: {protocol_name}, instanciando handler"
             )
-            return protocols[protocol_name](args, socket)
+            handler.file_cache = self.file_cache
+            # Con varias sesiones a la vez las barras de progreso se mezclarían
+            handler.progress = False
+            return handler
         logging.debug(f"Protocolo no soportado: {protocol_name}")
         raise ValueError(f"Protocol {protocol_name} not supported")
 
+    def _admit(self, addr, size, target, *args):
+        """Atiende el saludo en un hilo del pool, lo encola si el servidor está
+        lleno o contesta BUSY. Devuelve el hilo o None"""
+        if self.admission is None:
+            return self.network.start_thread(target, *args)
+        if self._resend_if_active(addr):
+            return None
+        decision = self.admission.submit(addr, size, (target, args))
+        if decision == admission.START:
+            return self.network.start_thread(self._run_admitted, (target, args))
+        if decision == admission.BUSY:
+            retry_after = self.admission.retry_after()
+            logging.warning(f"SERVIDOR-MAIN: Servidor lleno, {addr} tiene que volver en {retry_after:.2f}s")
+            self.main_socket.sendto(handshake.busy_message(retry_after).encode(), addr)
+        else:
+            logging.info(f"SERVIDOR-MAIN: Servidor lleno, saludo de {addr} en cola")
+        return None
+
+    def _run_admitted(self, job):
+        """Hilo del pool: atiende su saludo y después los de la cola, mientras haya"""
+        while job is not None:
+            target, args = job
+            start = self.main_socket.now()
+            try:
+                target(*args)
+            finally:
+                job = self.admission.finish(self.main_socket.now() - start)
+
     def handle_client(self, addr, data):
         """Maneja la comunicación con un cliente."""
         try:
@@ -165,23 +370,86 @@ class ServerProtocol:
             message = data.decode()
             logging.debug(f"Mensaje decodificado: {message}")
             if message.startswith("UPLOAD_CLIENT:"):
-                # Formato: "UPLOAD_CLIENT:protocol:filename:filesize"
-                parts = message.split(":")
-                logging.debug(f"Partes de mensaje UPLOAD_CLIENT: {parts}")
+                # Formato: "UPLOAD_CLIENT:protocol:filename:filesize[:opciones]"
+                parts, options = handshake.parse_message(message, 4)
+                logging.debug(f"Partes de mensaje UPLOAD_CLIENT: {parts} {options}")
                 protocol = parts[1]
                 filename = parts[2]
                 filesize = int(parts[3])
-                self.handle_upload(addr, protocol, filename, filesize)
+                self.handle_upload(addr, protocol, filename, filesize, options)
             elif message.startswith("DOWNLOAD_CLIENT:"):
-                # Formato: "DOWNLOAD_CLIENT:protocol:filename"
-                parts = message.split(":")
-                logging.debug(f"Partes de mensaje DOWNLOAD_CLIENT: {parts}")
+                # Formato: "DOWNLOAD_CLIENT:protocol:filename[:opciones]"
+                parts, options = handshake.parse_message(message, 3)
+                logging.debug(f"Partes de mensaje DOWNLOAD_CLIENT: {parts} {options}")
                 protocol = parts[1]
                 filename = parts[2]
-                self.handle_download(addr, protocol, filename)
+                self.handle_download(addr, protocol, filename, options)
             else:
                 logging.warning(f"Mensaje desconocido de {addr}: {message}")
         except (ValueError, IndexError) as e:
             logging.warning(
                 f"Formato de mensaje inválido de {addr}: {data.decode()} - {e}"
             )
+
+    def serve(self, should_quit, poll=NetworkConfig.POLL):
+        """Atiende saludos en el socket principal, cada uno en un hilo del pool
+        (ver lib/admission.py), hasta que should_quit() sea True"""
+        active_threads = []
+        http = metrics.serve_http(self.metrics, self.args.metrics_port) if self.metrics is not None else None
+        try:
+            while True:
+                if should_quit():
+                    logging.info("Cerrando servidor...")
+                    break
+
+                received = self.main_socket.recvfrom(NetworkConfig.MAIN_BUFFER, poll)
+                if received is None:
+                    active_threads = [t for t in active_threads if t.is_alive()]
+                    continue
+                data, addr = received
+                try:
+                    if self.answer_probe(data, addr):
+                        continue
+                    message = data.decode()
+
+                    # Validamos que sea un saludo de UPLOAD correcto
+                    if message.startswith("UPLOAD_CLIENT:"):
+                        # Formato: "UPLOAD_CLIENT:protocol:filename:filesize[:opciones]"
+                        parts, options = handshake.parse_message(message, 4)
+                        logging.info(f"SERVIDOR-MAIN: Saludo de UPLOAD recibido de {addr}")
+                        filesize = int(parts[3])
+                        thread = self._admit(addr, filesize, self.handle_upload, addr, parts[1], parts[2], filesize, options)
+                    # Validamos que sea un saludo de DOWNLOAD correcto
+                    elif message.startswith("DOWNLOAD_CLIENT:"):
+                        # Formato: "DOWNLOAD_CLIENT:protocol:filename[:opciones]"
+                        parts, options = handshake.parse_message(message, 3)
+                        logging.info(f"SERVIDOR-MAIN: Saludo de DOWNLOAD recibido de {addr}")
+                        size = self.store.queued_size(self.admission, parts[2], options)
+                        thread = self._admit(addr, size, self.handle_download, addr, parts[1], parts[2], options)
+                        active_threads = [t for t in active_threads if t.is_alive()]
+                    else:
+                        logging.warning(f"SERVIDOR-MAIN: Paquete de saludo inválido de {addr}. Ignorando.")
+                        continue
+                    if thread is not None:
+                        active_threads.append(thread)
+                except (UnicodeDecodeError, ValueError) as e:
+                    logging.error(f"SERVIDOR-MAIN: Paquete corrupto de {addr}:{e}. Ignorando.")
+
+        except KeyboardInterrupt:
+            logging.info("Cerrando servidor por KeyboardInterrupt...")
+
+        logging.info("Cerrando conexiones...")
+        if self.admission is not None:
+            dropped = self.admission.close()
+            if dropped:
+                logging.info(f"Se descartan {dropped} saludos en cola")
+        if self.file_cache is not None:
+            logging.info(self.file_cache.summary())
+        active_count = len([t for t in active_threads if t.is_alive()])
+        if active_count > 0:
+            logging.info(f"Esperando {active_count} transferencias activas...")
+            for thread in active_threads:
+                if thread.is_alive():
+                    thread.join(timeout=3.0)
+        if http is not None:
+            http.shutdown()
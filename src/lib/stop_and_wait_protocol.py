@@ -1,8 +1,8 @@
-import socket
-import time
 import logging
 
+from . import packet
 from .base_protocol import BaseProtocol
+from .rtt_estimator import RttEstimator
 
 # Constantes
 '''TIMEOUTS'''
@@ -10,28 +10,166 @@ CLIENT_TIMEOUT_START = 0.02
 CLIENT_TIMEOUT_MAX = 0.5
 SERVER_TIMEOUT = 30.0
 '''BUFFER SIZES'''
-BUFFER = 800
 BUFFER_ACK = 64
 '''RETRIES'''
 MAX_RETRIES = 20
 
+
+class StopAndWaitSender:
+    """Estado del emisor Stop-and-Wait, independiente de cómo se hace la E/S.
+
+    Como SendWindow de Selective Repeat, lo usan el loop bloqueante y las
+    corrutinas del servidor asíncrono: el llamador envía datagram(), le pasa
+    a on_ack() lo que llegue hasta next_timeout() y, si no llegó el ACK,
+    llama a expired() antes de reenviar.
+    """
+
+    def __init__(self, protocol, source, file_size):
+        self.protocol = protocol
+        self.source = source
+        self.file_size = file_size
+        self.seq_num = 0
+        self.bytes_sent = 0  # confirmados
+        self.packets_sent = 0
+        self.retransmissions = 0
+        self.retries = 0
+        self.send_time = None
+        self.deadline = None
+        self._load()
+
+    @property
+    def done(self):
+        """Se envió y se confirmó todo lo que había en la fuente"""
+        return self.block is None
+
+    def _load(self):
+        """Toma de la fuente el bloque del paquete seq_num (None si no queda nada)"""
+        self.block = None
+        self.retries = 0
+        length = min(self.protocol.mss, self.file_size - self.bytes_sent)
+        if length <= 0:
+            return
+        flags, payload = self.source.block(self.bytes_sent, length)
+        if payload:
+            self.block = (length, flags, payload)
+
+    def datagram(self):
+        """Header y payload del paquete en vuelo, para enviarlo ahora: arranca su timer"""
+        proto = self.protocol
+        _, flags, payload = self.block
+        self.packets_sent += 1
+        self.retransmissions += self.retries > 0
+        self.send_time = proto.now()
+        self.deadline = self.send_time + proto.rtt.timeout
+        return proto.data_parts(self.seq_num, payload, flags)
+
+    def next_timeout(self):
+        """Segundos hasta reenviar el paquete en vuelo"""
+        return self.deadline - self.protocol.now()
+
+    def on_ack(self, pkt):
+        """Procesa un paquete del receptor. True si confirmó el paquete en vuelo
+        (los ACKs viejos no cuentan)"""
+        if pkt.type != packet.ACK or pkt.seq != self.seq_num or self.block is None:
+            return False
+        proto = self.protocol
+        # Regla de Karn: sólo se mide sin retransmisión
+        if self.retries == 0:
+            proto.rtt.sample(proto.now() - self.send_time)
+        self.source.release(self.bytes_sent)
+        self.bytes_sent += self.block[0]
+        self.seq_num += 1
+        self._load()
+        return True
+
+    def expired(self):
+        """Venció el timer sin ACK: backoff del RTO. False si se agotaron los MAX_RETRIES envíos"""
+        self.retries += 1
+        self.protocol.rtt.on_timeout()
+        if self.retries >= MAX_RETRIES:
+            logging.error(f"Paquete {self.seq_num} falló después de {MAX_RETRIES} reintentos")
+            return False
+        return True
+
+
+class StopAndWaitReceiver:
+    """Estado del receptor Stop-and-Wait, independiente de cómo se hace la E/S.
+
+    receive() procesa una ráfaga de paquetes y escribe los chunks en orden:
+    el servidor asíncrono la corre en un hilo para no bloquear el event loop
+    con el disco.
+    """
+
+    def __init__(self, protocol, file):
+        self.protocol = protocol
+        self.file = file
+        self.seq_expected = 0
+        self.bytes_received = 0
+        self.packets_received = 0
+        self.duplicates = 0
+
+    def receive(self, pkts):
+        """Procesa paquetes parseados hasta el primer FIN. Devuelve (ACKs a
+        enviar, el FIN o None)"""
+        acks = []
+        for pkt in pkts:
+            if pkt.type == packet.FIN:
+                return acks, pkt
+            if pkt.type == packet.DATA and self.on_data(pkt):
+                acks.append(packet.pack(packet.ACK, pkt.seq, conn_id=self.protocol.conn_id))
+        return acks, None
+
+    def on_data(self, pkt):
+        """Procesa un paquete de datos. True si hay que confirmarlo con un ACK"""
+        self.packets_received += 1
+        if pkt.seq == self.seq_expected:
+            try:
+                chunk = self.protocol.data_payload(pkt)
+            except ValueError as e:
+                logging.error(f"Paquete corrupto: {e}")
+                return False
+            self.file.write(chunk)
+            self.bytes_received += len(chunk)
+            self.seq_expected += 1
+            return True
+        if pkt.seq < self.seq_expected:
+            # Paquete duplicado: se perdió nuestro ACK
+            self.duplicates += 1
+            return True
+        return False
+
+
 class StopAndWaitProtocol(BaseProtocol):
-    
+
+    def __init__(self, args, client_transport, options=None):
+        super().__init__(args, client_transport, options)
+        # El estimador vive toda la sesión: cada paquete arranca con el RTO aprendido
+        self.rtt = RttEstimator(CLIENT_TIMEOUT_START, CLIENT_TIMEOUT_MAX, self.initial_rto)
+
+    def send_window(self, source, file_size):
+        return StopAndWaitSender(self, source, file_size)
+
+    def receive_window(self, file):
+        return StopAndWaitReceiver(self, file)
+
     def send_upload(self, file_size):
         """Envía archivo al servidor usando Stop-and-Wait"""
         logging.info(f"CLIENTE: Iniciando envío de {file_size:,} bytes")
         
-        with open(self.args.src, "rb") as file:
-            return self._send_file(file, file_size, (self.args.host, self.args.port))
+        with self.open_source(self.args.src) as source:
+            return self._send_file(source, self.transfer_length(file_size), (self.args.host, self.args.port))
 
     def receive_upload(self, addr, filename, filesize):
         """Recibe archivo del cliente usando Stop-and-Wait"""
         file_path = self.get_file_path(filename)
         logging.info(f"SERVIDOR: Recibiendo '{filename}' ({filesize:,} bytes)")
         
-        with open(file_path, "wb") as file:
-            success = self._receive_file(file, filesize, addr)
-            
+        with self.open_upload(file_path, filesize) as upload:
+            success = self._receive_file(upload.file, self.transfer_length(filesize), addr)
+            if success:
+                success = upload.commit()
+        self.close_receiver(success)
+
         if success:
             logging.info(f"Archivo {filename} recibido exitosamente")
         return success, filename
@@ -41,122 +179,91 @@ class StopAndWaitProtocol(BaseProtocol):
         file_path = self.get_file_path(filename)
         logging.info(f"SERVIDOR: Enviando '{filename}' ({filesize:,} bytes)")
         
-        with open(file_path, "rb") as file:
-            return self._send_file(file, filesize, addr)
+        with self.open_source(file_path) as source:
+            return self._send_file(source, self.transfer_length(filesize), addr)
 
     def receive_download(self, filesize):
         """Recibe archivo del servidor usando Stop-and-Wait"""
         file_path = self._get_download_path()
         logging.info(f"CLIENTE: Recibiendo archivo ({filesize:,} bytes)")
         
-        with open(file_path, "wb") as file:
-            return self._receive_file(file, filesize, None)
+        with self.open_download(file_path, filesize) as download:
+            success = self._receive_file(download.file, self.transfer_length(filesize), None)
+            if success:
+                success = download.commit()
+        self.close_receiver(success)
+        return success
 
-    def _send_file(self, file, file_size, dest_addr):
+    def _send_file(self, source, file_size, dest_addr):
         """Lógica común para enviar archivos"""
-        seq_num = 0
-        bytes_sent = 0
-        estimated_rtt = None
-        current_timeout = CLIENT_TIMEOUT_START
-        packet_count = 0
-        start_time = time.time()
-
-        while bytes_sent < file_size:
-            packet_count += 1
-            chunk = file.read(min(BUFFER, file_size - bytes_sent))
-            if not chunk:
-                break
-
-            self.handle_progress(packet_count, bytes_sent, file_size)
-            
-            if not self._send_packet_reliable(seq_num, chunk, dest_addr, estimated_rtt, current_timeout):
+        start_time = self.now()
+        io, source = self.track(file_size, self.transport.io(BUFFER_ACK), source)
+        sender = self.counters = self.send_window(source, file_size)
+
+        while not sender.done:
+            if sender.retries == 0:
+                self.handle_progress(sender.seq_num + 1, sender.bytes_sent, file_size)
+            # FASE 1: ENVIO
+            self.send_parts(sender.datagram(), dest_addr)
+            # FASE 2: ESPERA ACK; FASE 3: RETRANSMISION CON BACKOFF
+            if not self._wait_ack(sender, io) and not sender.expired():
                 return False
-                
-            bytes_sent += len(chunk)
-            seq_num = 1 - seq_num
+
+        if not self.close_sender(io, dest_addr):
+            return False
 
         self.show_progress_bar(file_size, file_size)
-        elapsed = time.time() - start_time
-        logging.info(f"Transferencia completada: {bytes_sent:,} bytes en {elapsed:.1f}s")
+        elapsed = self.now() - start_time
+        logging.info(f"Transferencia completada: {sender.bytes_sent:,} bytes en {elapsed:.1f}s")
         return True
 
+    def _wait_ack(self, sender, io):
+        """Espera el ACK del paquete en vuelo hasta su timer. Los ACKs viejos no
+        reinician la espera; los que llegaron juntos se leen en una sola llamada"""
+        while (remaining := sender.next_timeout()) > 0:
+            for data, _ in io.recv(remaining):
+                try:
+                    if sender.on_ack(self.parse_packet(data)):
+                        return True
+                except ValueError:
+                    continue
+        return False
+
     def _receive_file(self, file, filesize, sender_addr):
         """Lógica común para recibir archivos"""
-        seq_expected = 0
-        bytes_received = 0
-        last_correct_seq = -1
-        packet_count = 0
-        start_time = time.time()
-        
-        self.socket.settimeout(SERVER_TIMEOUT)
+        start_time = self.now()
+        io, file = self.track(filesize, self.transport.io(self.mss + packet.HEADER_SIZE), file)
+        receiver = self.counters = self.receive_window(file)
 
-        while bytes_received < filesize:
-            try:
-                packet, addr = self.socket.recvfrom(BUFFER + 100)
-                packet_count += 1
-                
-                seq_received, chunk = self.parse_packet(packet)
-                
-                self.handle_progress(packet_count, bytes_received + len(chunk), filesize, 200)
-
-                if seq_received == seq_expected:
-                    file.write(chunk)
-                    bytes_received += len(chunk)
-                    last_correct_seq = seq_received
-                    self.send_ack(seq_received, sender_addr or addr)
-                    seq_expected = 1 - seq_expected
-                    
-                    if bytes_received >= filesize:
-                        break
-                else:
-                    # Paquete duplicado
-                    if last_correct_seq != -1:
-                        self.send_ack(last_correct_seq, sender_addr or addr)
-
-            except socket.timeout:
+        # Después del último paquete se sigue escuchando hasta el FIN, por si
+        # se perdió el ACK y el emisor lo retransmite
+        while self.fin is None:
+            datagrams = io.recv(SERVER_TIMEOUT)
+            if not datagrams:
+                if receiver.bytes_received >= filesize:
+                    logging.warning("No llegó el FIN, pero el archivo está completo")
+                    break
                 logging.warning("Timeout - conexión perdida")
                 return False
-            except (ValueError, UnicodeDecodeError) as e:
-                logging.error(f"Paquete corrupto: {e}")
-                continue
+
+            pkts = []
+            for datagram, addr in datagrams:
+                try:
+                    pkts.append(self.parse_packet(datagram))
+                except ValueError as e:
+                    logging.error(f"Paquete corrupto: {e}")
+            ack_addr = sender_addr or addr
+            acks, fin = receiver.receive(pkts)
+            for ack in acks:
+                self.transport.sendto(ack, ack_addr)
+            self.handle_progress(receiver.packets_received, receiver.bytes_received, filesize, 200)
+            if fin is not None:
+                # El FIN-ACK sale en close_receiver, cuando el archivo ya está guardado
+                self.fin = (fin, addr)
+                if not self.accept_fin(fin, receiver.bytes_received, filesize):
+                    return False
 
         self.show_progress_bar(filesize, filesize)
-        elapsed = time.time() - start_time
-        logging.info(f"Recepción completada: {bytes_received:,} bytes en {elapsed:.1f}s")
-        
-        self.cleanup_duplicates()
+        elapsed = self.now() - start_time
+        logging.info(f"Recepción completada: {receiver.bytes_received:,} bytes en {elapsed:.1f}s")
         return True
-
-    def _send_packet_reliable(self, seq_num, chunk, dest_addr, estimated_rtt, current_timeout):
-        """Envía un paquete de forma confiable con reintentos"""
-        packet = self.create_packet(seq_num, chunk)
-        retries = 0
-        
-        while retries < MAX_RETRIES:
-            # FASE 1: ENVIO
-            self.socket.sendto(packet, dest_addr)
-            send_time = time.monotonic()
-            
-            try:
-                # FASE 2: ESPERA ACK
-                self.socket.settimeout(current_timeout)
-                data, _ = self.socket.recvfrom(BUFFER_ACK)
-                recv_time = time.monotonic()
-                
-                # FASE 3: MEDICION DE RTT Y ACTUALIZACION TIMEOUT
-                sample_rtt = recv_time - send_time
-                estimated_rtt = self.update_rtt(estimated_rtt, sample_rtt)
-                current_timeout = self.calculate_timeout(estimated_rtt, CLIENT_TIMEOUT_START, CLIENT_TIMEOUT_MAX)
-                
-                # FASE 4: VERIFICACION DE ACK
-                response = data.decode()
-                if self.is_expected_ack(response, seq_num):
-                    return True
-                    
-            except socket.timeout:
-                # FASE 5: RETRANSMISION
-                retries += 1
-                current_timeout = min(current_timeout * 1.3, CLIENT_TIMEOUT_MAX)
-                
-        logging.error(f"Paquete {seq_num} falló después de {MAX_RETRIES} reintentos")
-        return False
@@ -0,0 +1,576 @@
+import fcntl
+import hashlib
+import json
+import mmap
+import os
+import shutil
+import stat
+import tempfile
+import logging
+
+# Los archivos se reciben en un temporal del mismo directorio y se publican con
+# un rename atómico: varios procesos pueden compartir el storage sin que una
+# descarga vea un archivo a medio escribir
+PART_SUFFIX = ".part"
+# Journal de un archivo parcial: rangos confirmados, uno "inicio-fin" por línea
+RANGES_SUFFIX = ".ranges"
+# Cada cuántos bytes escritos se anota el avance en el journal
+JOURNAL_EVERY = 4 * 1024 * 1024
+# Índice digest -> archivo del storage, para deduplicar subidas
+INDEX_NAME = ".index.json"
+DIGEST_BLOCK = 1024 * 1024
+# mkstemp crea los temporales con 0600: al publicarlos se les dan los permisos
+# de open(), según la umask. La umask sólo se lee cambiándola, así que se lee
+# una vez al importar (antes de que haya hilos)
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+FILE_MODE = 0o666 & ~_UMASK
+
+
+class Upload:
+    """Archivo en recepción. Sólo reemplaza al destino si se llama a commit()"""
+
+    def __init__(self, path, size, digest=None):
+        self.path = path
+        self.digest = digest
+        directory, name = os.path.split(path)
+        fd, self.part_path = tempfile.mkstemp(prefix=f".{name}.", suffix=PART_SUFFIX, dir=directory or ".")
+        os.fchmod(fd, FILE_MODE)
+        self.file = OffsetFile(fd, 0, size, hashing=digest is not None)
+        self.committed = False
+
+    def commit(self):
+        """Publica el archivo completo si coincide con el digest. Si dos subidas compiten, gana la última"""
+        self.file.close()
+        self.committed = True
+        if self.digest is not None and self.file.hexdigest() != self.digest:
+            logging.error(f"El contenido recibido para {self.path} no coincide con su digest, se descarta")
+            self.discard()
+            return False
+        os.replace(self.part_path, self.path)
+        if self.digest is not None:
+            DigestIndex.for_file(self.path).record(os.path.basename(self.path), self.digest)
+        return True
+
+    def discard(self):
+        self.file.close()
+        try:
+            os.unlink(self.part_path)
+        except FileNotFoundError:
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.committed:
+            logging.debug(f"Descartando recepción incompleta {self.part_path}")
+            self.discard()
+        return False
+
+
+class Journal:
+    """Rangos confirmados de un archivo parcial, compartido entre procesos con flock"""
+
+    def __init__(self, path):
+        self.path = path
+
+    @classmethod
+    def for_file(cls, path, key=None):
+        """Journal oculto junto a path: .nombre[.key].ranges"""
+        directory, name = os.path.split(path)
+        suffix = f".{key}" if key else ""
+        return cls(os.path.join(directory, f".{name}{suffix}{RANGES_SUFFIX}"))
+
+    def create(self):
+        """Crea el journal si no existe (sólo entonces se anotan rangos)"""
+        open(self.path, "a").close()
+
+    def locked(self, create=False):
+        return _LockedFile(self.path, create)
+
+    def record(self, start, end):
+        """Anota [start, end). Devuelve todos los rangos, o None si ya no hay journal"""
+        try:
+            with self.locked() as journal:
+                return _append(journal, start, end)
+        except FileNotFoundError:
+            return None
+
+    def ranges(self):
+        """Rangos confirmados, unidos y ordenados. [] si no hay journal"""
+        try:
+            with self.locked() as journal:
+                return _read(journal)
+        except FileNotFoundError:
+            return []
+
+    def remove(self):
+        try:
+            os.unlink(self.path)
+        except FileNotFoundError:
+            pass
+
+
+class OffsetFile:
+    """Porción [start, start + length) de un archivo, escrita por offset con os.pwrite.
+
+    Los chunks se escriben apenas llegan, en cualquier orden; el receptor
+    avisa con advance() hasta dónde no quedan huecos. Sobre ese prefijo se
+    calcula el hash (hashing=True) y se anota el avance en el journal: tras
+    un corte el journal nunca promete bytes que no están en el archivo.
+    """
+
+    def __init__(self, fd, start, length, journal=None, hashing=False):
+        self.fd = fd
+        self.start = start
+        self.length = length
+        self.journal = journal
+        self.hash = hashlib.sha256() if hashing else None
+        self.position = 0  # prefijo sin huecos, relativo a start
+        self.hashed = 0
+        self.recorded = 0
+        self.closed = False
+        _preallocate(fd, start, length)
+
+    def write_at(self, offset, data):
+        """Escribe data en start + offset"""
+        written = os.pwrite(self.fd, data, self.start + offset)
+        if self.hash is not None and offset == self.hashed:
+            # Llegó en orden: se hashea al vuelo, sin releerlo
+            self.hash.update(data)
+            self.hashed += written
+        return written
+
+    def read_at(self, offset, length):
+        """Lee lo ya escrito en start + offset"""
+        return os.pread(self.fd, length, self.start + offset)
+
+    def write(self, data):
+        """Escritura en orden, a continuación del prefijo"""
+        written = self.write_at(self.position, data)
+        self.advance(self.position + written)
+        return written
+
+    def advance(self, end):
+        """Todo [0, end) ya está escrito"""
+        end = min(end, self.length)
+        if end <= self.position:
+            return
+        self.position = end
+        if self.hash is not None:
+            # Lo que llegó fuera de orden se lee de vuelta (está en el page cache)
+            while self.hashed < end:
+                block = os.pread(self.fd, min(DIGEST_BLOCK, end - self.hashed), self.start + self.hashed)
+                self.hash.update(block)
+                self.hashed += len(block)
+        if self.journal is not None and self.position - self.recorded >= JOURNAL_EVERY:
+            self.checkpoint()
+
+    def checkpoint(self):
+        if self.position > self.recorded:
+            self.journal.record(self.start, self.start + self.position)
+            self.recorded = self.position
+
+    def hexdigest(self):
+        return self.hash.hexdigest()
+
+    def close(self):
+        if self.closed:
+            return
+        if self.journal is not None:
+            self.checkpoint()
+        os.close(self.fd)
+        self.closed = True
+
+
+def _preallocate(fd, start, length):
+    """Reserva los bloques de la porción: el archivo no se fragmenta y el disco lleno falla acá"""
+    if length <= 0 or not hasattr(os, "posix_fallocate"):
+        return
+    try:
+        os.posix_fallocate(fd, start, length)
+    except OSError as e:
+        logging.debug(f"No se pudo preasignar el archivo: {e}")
+
+
+class RangeUpload:
+    """Una porción de una subida en paralelo o reanudable.
+
+    Todas las porciones (hilos o procesos distintos) escriben en el mismo
+    temporal, identificado por el id de la transferencia, y anotan en su
+    journal lo que van recibiendo. La que completa el archivo lo publica
+    con un rename atómico. Si la sesión falla, el temporal y el journal
+    quedan para reanudarla.
+    """
+
+    def __init__(self, path, transfer_id, total_size, start, end, digest=None):
+        self.path = path
+        self.digest = digest
+        self.total_size = total_size
+        self.range = (start, end)
+        directory, name = os.path.split(path)
+        self.part_path = os.path.join(directory, f".{name}.{transfer_id}{PART_SUFFIX}")
+        self.journal = Journal.for_file(path, transfer_id)
+        with self.journal.locked(create=True):
+            fd = os.open(self.part_path, os.O_RDWR | os.O_CREAT, FILE_MODE)
+            if os.fstat(fd).st_size < total_size:
+                os.ftruncate(fd, total_size)
+        # Si la sesión trae el archivo entero se hashea al vuelo, como en Upload
+        whole = start == 0 and end >= total_size
+        self.file = OffsetFile(fd, start, min(end, total_size) - start, self.journal,
+                               hashing=whole and digest is not None)
+        self.committed = False
+
+    def commit(self):
+        """Anota la porción recibida y, si completa el archivo, lo verifica y publica.
+
+        False sólo si el archivo completo no coincide con su digest.
+        """
+        self.file.close()
+        self.committed = True
+        try:
+            with self.journal.locked() as journal:
+                received = _append(journal, *self.range)
+                if covered(received) < self.total_size:
+                    return True
+                if self.digest is not None and self._digest() != self.digest:
+                    logging.error(f"El contenido recibido para {self.path} no coincide con su digest, se descarta")
+                    os.unlink(self.part_path)
+                    self.journal.remove()
+                    return False
+                os.replace(self.part_path, self.path)
+                self.journal.remove()
+        except FileNotFoundError:
+            # Otra sesión ya lo publicó
+            return True
+        logging.info(f"Todas las porciones de {self.path} recibidas")
+        if self.digest is not None:
+            DigestIndex.for_file(self.path).record(os.path.basename(self.path), self.digest)
+        return True
+
+    def _digest(self):
+        if self.file.hash is not None and self.file.hashed == self.total_size:
+            return self.file.hexdigest()
+        return file_digest(self.part_path)
+
+    def discard(self):
+        # El temporal y el journal quedan para las demás porciones o para reanudar
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if not self.committed:
+            self.discard()
+        return False
+
+
+def upload_ranges(path, transfer_id):
+    """Rangos ya recibidos de la subida transfer_id de path"""
+    if not transfer_id or not transfer_id.isalnum():
+        return []
+    return Journal.for_file(path, transfer_id).ranges()
+
+
+class Download:
+    """Destino de una descarga en el cliente.
+
+    Con range, las porciones escriben en su offset sobre el mismo archivo;
+    sin range se descarga el archivo entero desde cero. Con journal, además
+    se anota el avance para poder reanudar.
+    """
+
+    def __init__(self, path, total_size, range=None, journal=False):
+        self.total_size = total_size
+        self.range = range
+        self.journal = Journal.for_file(path) if journal else None
+        if range is None:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT | os.O_TRUNC, FILE_MODE)
+            self.range = (0, total_size)
+            if self.journal is not None:
+                # Lo que anotó un intento anterior ya no está en el archivo
+                self.journal.remove()
+        else:
+            fd = os.open(path, os.O_RDWR | os.O_CREAT, FILE_MODE)
+            # Sólo corta restos de un archivo previo más largo: no pisa otras porciones
+            os.ftruncate(fd, total_size)
+        if self.journal is not None:
+            self.journal.create()
+        start, end = self.range
+        self.file = OffsetFile(fd, start, min(end, total_size) - start, self.journal)
+
+    def commit(self):
+        """Descarga de la sesión completa: borra el journal si ya está todo el archivo"""
+        self.file.close()
+        if self.journal is None:
+            return True
+        with self.journal.locked() as journal:
+            if covered(_append(journal, *self.range)) >= self.total_size:
+                self.journal.remove()
+        return True
+
+    def discard(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.discard()
+        return False
+
+
+def download_path(args):
+    """Cliente: ruta de destino de una descarga"""
+    if getattr(args, "dst", None) and os.path.isdir(args.dst):
+        return os.path.join(args.dst, args.name)
+    return getattr(args, "dst", None) or args.name
+
+
+class Source:
+    """Archivo a enviar, mapeado en memoria.
+
+    chunk() devuelve vistas sobre el mapeo: armar un paquete o retransmitirlo
+    no lee ni copia el archivo. Los offsets son relativos a `start`. Con
+    mapping se usa un mapeo compartido (ver lib/file_cache.py), que no se
+    cierra con la fuente.
+    """
+
+    def __init__(self, path, start=0, mapping=None):
+        self.owned = mapping is None
+        if mapping is None:
+            mapping, _ = map_file(path)
+        self.map = mapping
+        self.view = memoryview(self.map if self.map is not None else b"")[start:]
+
+    def chunk(self, offset, length):
+        return self.view[offset:offset + length]
+
+    def block(self, offset, length):
+        """(flags, payload) del paquete que lleva ese tramo: sin comprimir"""
+        return 0, self.chunk(offset, length)
+
+    def release(self, offset):
+        """El tramo en offset ya fue confirmado (ver compression.CompressedSource)"""
+
+    def close(self):
+        self.view.release()
+        if self.map is None or not self.owned:
+            return
+        try:
+            self.map.close()
+        except BufferError:
+            # Queda alguna vista viva (un paquete en un buffer): se libera con ella
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def file_size(path):
+    """Tamaño de path con un solo stat, o None si no es un archivo regular"""
+    try:
+        info = os.stat(path)
+    except OSError:
+        return None
+    return info.st_size if stat.S_ISREG(info.st_mode) else None
+
+
+def map_file(path):
+    """Mapea path entero. Devuelve (mmap o None si está vacío, os.stat del archivo mapeado).
+
+    El mapeo es privado (ACCESS_COPY) para que las vistas sean escribibles y
+    ctypes pueda pasarlas a sendmmsg; nunca se escriben.
+    """
+    with open(path, "rb") as file:
+        stat = os.fstat(file.fileno())
+        # mmap no admite archivos vacíos
+        if not stat.st_size:
+            return None, stat
+        mapping = mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_COPY)
+    if hasattr(mmap, "MADV_SEQUENTIAL"):
+        mapping.madvise(mmap.MADV_SEQUENTIAL)
+    return mapping, stat
+
+
+def file_digest(path):
+    """SHA-256 (hex) del contenido de path"""
+    digest = hashlib.sha256()
+    with open(path, "rb") as file:
+        while block := file.read(DIGEST_BLOCK):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+class DigestIndex:
+    """Índice digest -> archivo de un directorio de storage.
+
+    Cada entrada guarda el tamaño y mtime del archivo cuando se indexó: si el
+    archivo cambió después, la entrada se ignora. Compartido entre procesos
+    con flock.
+    """
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.path = os.path.join(directory, INDEX_NAME)
+
+    @classmethod
+    def for_file(cls, path):
+        return cls(os.path.dirname(path) or ".")
+
+    def _locked(self):
+        return _LockedFile(self.path + ".lock", create=True)
+
+    def _load(self):
+        try:
+            with open(self.path) as index:
+                return json.load(index)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def _save(self, entries):
+        fd, tmp_path = tempfile.mkstemp(prefix=INDEX_NAME, dir=self.directory)
+        with os.fdopen(fd, "w") as index:
+            json.dump(entries, index)
+        os.replace(tmp_path, self.path)
+
+    def _is_current(self, name, entry):
+        try:
+            stat = os.stat(os.path.join(self.directory, name))
+        except FileNotFoundError:
+            return False
+        return [stat.st_size, stat.st_mtime_ns] == entry[1:]
+
+    def record(self, name, digest):
+        self.record_many({name: digest})
+
+    def record_many(self, digests):
+        """Anota {nombre: digest} con una sola escritura del índice"""
+        stats = {name: os.stat(os.path.join(self.directory, name)) for name in digests}
+        with self._locked():
+            entries = self._load()
+            for name, digest in digests.items():
+                entries[name] = [digest, stats[name].st_size, stats[name].st_mtime_ns]
+            self._save(entries)
+
+    def find(self, digest):
+        """Nombre de un archivo vigente con ese digest, o None"""
+        with self._locked():
+            for name, entry in self._load().items():
+                if entry[0] == digest and self._is_current(name, entry):
+                    return name
+        return None
+
+    def digest_of(self, name):
+        """Digest de un archivo del storage, calculándolo sólo si cambió"""
+        with self._locked():
+            entry = self._load().get(name)
+        if entry is not None and self._is_current(name, entry):
+            return entry[0]
+        digest = file_digest(os.path.join(self.directory, name))
+        self.record(name, digest)
+        return digest
+
+    def digests_of(self, names):
+        """{nombre: digest} de varios archivos leyendo el índice una sola vez"""
+        with self._locked():
+            entries = self._load()
+        digests = {}
+        missing = {}
+        for name in names:
+            entry = entries.get(name)
+            if entry is not None and self._is_current(name, entry):
+                digests[name] = entry[0]
+            else:
+                missing[name] = digests[name] = file_digest(os.path.join(self.directory, name))
+        if missing:
+            self.record_many(missing)
+        return digests
+
+    def link(self, digest, name):
+        """Publica name con el contenido ya guardado bajo ese digest. False si no hay"""
+        source = self.find(digest)
+        if source is None:
+            return False
+        if source != name:
+            path = os.path.join(self.directory, name)
+            fd, tmp_path = tempfile.mkstemp(prefix=f".{name}.", suffix=PART_SUFFIX, dir=self.directory)
+            os.close(fd)
+            os.unlink(tmp_path)
+            try:
+                # Un hard link no copia datos; os.replace de otra subida no lo afecta
+                os.link(os.path.join(self.directory, source), tmp_path)
+            except OSError:
+                shutil.copyfile(os.path.join(self.directory, source), tmp_path)
+            # El link comparte los permisos del original, que pudo publicarse con los de mkstemp
+            os.chmod(tmp_path, FILE_MODE)
+            os.replace(tmp_path, path)
+            try:
+                # Si path ya era un link al mismo archivo, rename no hace nada y deja tmp_path
+                os.unlink(tmp_path)
+            except FileNotFoundError:
+                pass
+            self.record(name, digest)
+        return True
+
+
+def merge_ranges(ranges):
+    """Une rangos solapados o contiguos. Devuelve una lista ordenada"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def covered(ranges):
+    """Largo del prefijo contiguo cubierto por los rangos"""
+    merged = merge_ranges(ranges)
+    return merged[0][1] if merged and merged[0][0] == 0 else 0
+
+
+def first_missing(ranges, start, end):
+    """Primer byte de [start, end) que no cubren los rangos"""
+    for range_start, range_end in merge_ranges(ranges):
+        if range_start <= start < range_end:
+            start = range_end
+    return min(start, end)
+
+
+class _LockedFile:
+    """Abre un archivo de texto con flock exclusivo. Sin create, debe existir"""
+
+    def __init__(self, path, create=False):
+        self.path = path
+        self.mode = "a+" if create else "r+"
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, self.mode)
+        fcntl.flock(self.file, fcntl.LOCK_EX)
+        return self.file
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.flock(self.file, fcntl.LOCK_UN)
+        self.file.close()
+        return False
+
+
+def _read(journal):
+    journal.seek(0)
+    return merge_ranges(tuple(int(v) for v in line.split("-")) for line in journal.read().split())
+
+
+def _append(journal, start, end):
+    """Anota un rango y devuelve todos los del journal"""
+    journal.seek(0, os.SEEK_END)
+    journal.write(f"{start}-{end}\n")
+    journal.flush()
+    return _read(journal)
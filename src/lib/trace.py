@@ -0,0 +1,259 @@
+import csv
+import itertools
+import logging
+import os
+import socket
+import struct
+import time
+
+from . import packet, transport
+
+# Registro de paquetes para depurar el rendimiento sin -v: cada datagrama que
+# entra o sale de un transporte deja un evento de tamaño fijo en un buffer
+# circular preasignado (sin formatear nada ni reservar memoria en el camino
+# caliente). Al terminar se vuelca como pcap, para tcpdump o Wireshark con
+# el plugin lib/file_transfer_protocol.lua, o como CSV, para graficar
+# secuencias y ACKs en el tiempo.
+'''REGISTRO'''
+# Eventos que entran en el buffer; al llenarse se pisan los más viejos
+DEFAULT_CAPACITY = 65536
+OUT = 0
+IN = 1
+# tiempo | sentido | IP local | IP remota | puerto local | puerto remoto | tamaño del datagrama,
+# seguido de sus primeros HEADER_SIZE bytes (el header de los paquetes binarios)
+EVENT = struct.Struct("<dB4s4sHHI")
+RECORD_SIZE = EVENT.size + packet.HEADER_SIZE
+'''PCAP'''
+PCAP_HEADER = struct.Struct("<IHHiIII")
+PCAP_MAGIC = 0xA1B2C3D4
+PCAP_SNAPLEN = 65535
+# Datagramas IPv4 sin capa de enlace
+LINKTYPE_RAW = 101
+PCAP_RECORD = struct.Struct("<IIII")
+IPV4 = struct.Struct("!BBHHHBBH4s4s")
+UDP = struct.Struct("!HHHH")
+IP_UDP_SIZE = IPV4.size + UDP.size
+'''CSV'''
+CSV_FIELDS = ("time_s", "direction", "local", "peer", "type", "seq", "conn_id", "flags", "size", "retransmit")
+TYPE_NAMES = {
+    packet.DATA: "DATA", packet.ACK: "ACK", packet.FIN: "FIN", packet.SACK: "SACK", packet.PROBE: "PROBE",
+    packet.PARITY: "PARITY", packet.NACK: "NACK", packet.FIN_ACK: "FIN_ACK",
+}
+UNSPECIFIED = socket.inet_aton("0.0.0.0")
+LOOPBACK = socket.inet_aton("127.0.0.1")
+
+
+def from_args(args):
+    """Recorder si se pidió --trace, si no None"""
+    if not getattr(args, "trace", None):
+        return None
+    return Recorder(getattr(args, "trace_size", None) or DEFAULT_CAPACITY)
+
+
+def network(recorder, base=None):
+    """Red cuyos transportes registran en recorder (base si no hay recorder)"""
+    if recorder is None:
+        return base
+    return TracedNetwork(base or transport.UdpNetwork(), recorder)
+
+
+def wrap(sock, recorder):
+    """Transporte para sock (ver transport.wrap) que registra en recorder, si lo hay"""
+    wrapped = transport.wrap(sock)
+    if recorder is None:
+        return wrapped
+    return TracedTransport(wrapped, recorder)
+
+
+def dump(recorder, path):
+    """Guarda el registro en path: CSV si termina en .csv, si no pcap"""
+    if recorder is None:
+        return
+    try:
+        count = recorder.write_csv(path) if path.lower().endswith(".csv") else recorder.write_pcap(path)
+    except OSError as e:
+        logging.error(f"No se pudo guardar el registro de paquetes en {path}: {e}")
+        return
+    dropped = f", se perdieron los {recorder.dropped:,} más viejos" if recorder.dropped else ""
+    logging.info(f"Registro de paquetes: {count:,} eventos en {path}{dropped}")
+
+
+class Recorder:
+    """Buffer circular de eventos de paquetes, compartido por los transportes de un proceso"""
+
+    def __init__(self, capacity=DEFAULT_CAPACITY):
+        self.capacity = capacity
+        self.buffer = bytearray(capacity * RECORD_SIZE)
+        # next() es atómico: cada evento toma su lugar sin lock
+        self.counter = itertools.count()
+        self.total = 0
+        self.addresses = {}  # {IP: IP empaquetada}
+        # Los tiempos son de los relojes de los transportes: se pasan a fecha al volcarlos
+        self.epoch = time.time() - time.monotonic()
+
+    def address(self, ip):
+        packed = self.addresses.get(ip)
+        if packed is None:
+            try:
+                packed = socket.inet_aton(ip)
+            except OSError:
+                packed = UNSPECIFIED
+            self.addresses[ip] = packed
+        return packed
+
+    def record(self, timestamp, direction, local, addr, data, size):
+        """Registra un datagrama de size bytes; data tiene (al menos) su header"""
+        offset = next(self.counter) % self.capacity * RECORD_SIZE
+        EVENT.pack_into(self.buffer, offset, timestamp, direction, local[0], self.address(addr[0]), local[1],
+                        addr[1], size)
+        captured = min(len(data), packet.HEADER_SIZE)
+        start = offset + EVENT.size
+        self.buffer[start:start + captured] = data[:captured]
+
+    @property
+    def dropped(self):
+        return max(self.total - self.capacity, 0)
+
+    def events(self):
+        """Eventos guardados, del más viejo al más nuevo: (tiempo, sentido, ip local, ip remota,
+        puerto local, puerto remoto, tamaño, bytes capturados)"""
+        self.total = next(self.counter)
+        for index in range(max(self.total - self.capacity, 0), self.total):
+            offset = index % self.capacity * RECORD_SIZE
+            event = EVENT.unpack_from(self.buffer, offset)
+            if not event[6]:
+                # Lugar tomado por un evento que todavía no terminó de escribirse
+                continue
+            start = offset + EVENT.size
+            yield event + (bytes(self.buffer[start:start + min(event[6], packet.HEADER_SIZE)]),)
+
+    def write_pcap(self, path):
+        """pcap de datagramas IPv4/UDP con sólo el header de cada paquete capturado. Devuelve los eventos"""
+        count = 0
+        with open(path, "wb") as file:
+            file.write(PCAP_HEADER.pack(PCAP_MAGIC, 2, 4, 0, 0, PCAP_SNAPLEN, LINKTYPE_RAW))
+            for timestamp, direction, local_ip, peer_ip, local_port, peer_port, size, captured in self.events():
+                if local_ip == UNSPECIFIED and peer_ip[:1] == LOOPBACK[:1]:
+                    # Socket sin dirección fija hablando por loopback
+                    local_ip = LOOPBACK
+                source, destination = (local_ip, local_port), (peer_ip, peer_port)
+                if direction == IN:
+                    source, destination = destination, source
+                length = IP_UDP_SIZE + size
+                ip = bytearray(IPV4.pack(0x45, 0, length, count & 0xFFFF, 0, 64, socket.IPPROTO_UDP, 0,
+                                         source[0], destination[0]))
+                struct.pack_into("!H", ip, 10, _checksum(ip))
+                udp = UDP.pack(source[1], destination[1], UDP.size + size, 0)
+                seconds, micros = divmod(int((self.epoch + timestamp) * 1_000_000), 1_000_000)
+                file.write(PCAP_RECORD.pack(seconds, micros, IP_UDP_SIZE + len(captured), length))
+                file.write(ip + udp + captured)
+                count += 1
+        return count
+
+    def write_csv(self, path):
+        """Línea de tiempo de los paquetes, un evento por fila. Devuelve los eventos.
+
+        Un DATA que sale con un seq que ya salió por el mismo flujo es una
+        retransmisión.
+        """
+        count = 0
+        sent = {}  # {(puerto local, extremo remoto, id de conexión): seq de DATA ya enviados}
+        start = None
+        with open(path, "w", newline="") as file:
+            writer = csv.writer(file)
+            writer.writerow(CSV_FIELDS)
+            for timestamp, direction, _, peer_ip, local_port, peer_port, size, captured in self.events():
+                if start is None:
+                    start = timestamp
+                name, seq, conn_id, flags, retransmit = "HANDSHAKE", "", "", "", ""
+                if len(captured) == packet.HEADER_SIZE and captured[0] == packet.WIRE_VERSION:
+                    _, packet_type, flags, conn_id, seq, _, _ = packet.HEADER.unpack(captured)
+                    name = TYPE_NAMES.get(packet_type, str(packet_type))
+                    if packet_type == packet.DATA and direction == OUT:
+                        seen = sent.setdefault((local_port, peer_ip, peer_port, conn_id), set())
+                        retransmit = int(seq in seen)
+                        seen.add(seq)
+                peer = f"{socket.inet_ntoa(peer_ip)}:{peer_port}"
+                writer.writerow((f"{timestamp - start:.6f}", "out" if direction == OUT else "in", local_port, peer,
+                                 name, seq, conn_id, flags, size, retransmit))
+                count += 1
+        return count
+
+
+def _checksum(header):
+    """Checksum de internet (complemento a uno de la suma de palabras de 16 bits)"""
+    total = sum(struct.unpack(f"!{len(header) // 2}H", header))
+    while total >> 16:
+        total = (total & 0xFFFF) + (total >> 16)
+    return ~total & 0xFFFF
+
+
+class TracedTransport:
+    """Transporte que registra cada datagrama que envía o recibe"""
+
+    def __init__(self, transport, recorder):
+        self.transport = transport
+        self.recorder = recorder
+        ip, port = transport.getsockname()[:2]
+        self.local = (recorder.address(ip or "0.0.0.0"), port)
+
+    def __getattr__(self, name):
+        # now, set_buffers, getsockname, close y el socket de los sondeos de MTU
+        return getattr(self.transport, name)
+
+    def sendto(self, data, addr):
+        self.transport.sendto(data, addr)
+        self.recorder.record(self.transport.now(), OUT, self.local, addr, data, len(data))
+
+    def send_parts(self, parts, addr):
+        self.transport.send_parts(parts, addr)
+        self.recorder.record(self.transport.now(), OUT, self.local, addr, parts[0], sum(map(len, parts)))
+
+    def recvfrom(self, bufsize, timeout):
+        received = self.transport.recvfrom(bufsize, timeout)
+        if received is not None:
+            data, addr = received
+            self.recorder.record(self.transport.now(), IN, self.local, addr, data, len(data))
+        return received
+
+    def io(self, bufsize):
+        return TracedIO(self.transport.io(bufsize), self)
+
+
+class TracedIO:
+    """E/S en tandas (ver lib/batch_io.py) que registra cada datagrama"""
+
+    def __init__(self, io, traced):
+        self.io = io
+        self.traced = traced
+
+    def send(self, datagrams, addr):
+        self.io.send(self._outgoing(datagrams, addr), addr)
+
+    def _outgoing(self, datagrams, addr):
+        # Se registra al armar cada datagrama: el header puede estar en un buffer que se reutiliza
+        traced = self.traced
+        for parts in datagrams:
+            traced.recorder.record(traced.transport.now(), OUT, traced.local, addr, parts[0], sum(map(len, parts)))
+            yield parts
+
+    def recv(self, timeout):
+        datagrams = self.io.recv(timeout)
+        traced = self.traced
+        for data, addr in datagrams:
+            traced.recorder.record(traced.transport.now(), IN, traced.local, addr, data, len(data))
+        return datagrams
+
+
+class TracedNetwork:
+    """Red (real o simulada) cuyos transportes registran en recorder"""
+
+    def __init__(self, network, recorder):
+        self.network = network
+        self.recorder = recorder
+
+    def __getattr__(self, name):
+        return getattr(self.network, name)
+
+    def open(self, host="", port=0):
+        return TracedTransport(self.network.open(host, port), self.recorder)
@@ -0,0 +1,85 @@
+import logging
+import socket
+import threading
+import time
+
+from . import batch_io
+from .batch_io import SENDMSG
+
+# Transporte de datagramas de los protocolos y del servidor: la interfaz que
+# usan en lugar de un socket. UdpTransport es la red real; la red simulada
+# en memoria, con reloj virtual, está en lib/simulation.py. Un transporte da
+# la hora (now) además de enviar y recibir: los timers de los protocolos
+# corren con el reloj de su red.
+'''SOCKET'''
+# Tope del buffer de socket que se pide al kernel (puede recortarlo a rmem_max)
+SOCKET_BUFFER_MAX = 8 * 1024 * 1024
+
+
+def wrap(sock):
+    """Transporte para sock: los sockets UDP se envuelven, los transportes pasan igual"""
+    if isinstance(sock, socket.socket):
+        return UdpTransport(sock)
+    return sock
+
+
+class UdpTransport:
+    """Socket UDP real y el reloj monotónico del sistema"""
+
+    def __init__(self, sock):
+        self.socket = sock
+
+    def now(self):
+        return time.monotonic()
+
+    def sendto(self, data, addr):
+        self.socket.sendto(data, addr)
+
+    def send_parts(self, parts, addr):
+        """Envía un datagrama armado por partes sin copiarlas (scatter/gather)"""
+        if SENDMSG:
+            self.socket.sendmsg(parts, (), 0, addr)
+        else:
+            self.socket.sendto(b"".join(parts), addr)
+
+    def recvfrom(self, bufsize, timeout):
+        """Espera hasta timeout (None: sin límite) un datagrama. (datos, addr) o None"""
+        self.socket.settimeout(timeout)
+        try:
+            return self.socket.recvfrom(bufsize)
+        except (socket.timeout, BlockingIOError):
+            return None
+
+    def io(self, bufsize):
+        """E/S en tandas (ver lib/batch_io.py); bufsize es el datagrama más grande que se espera"""
+        return batch_io.for_socket(self.socket, bufsize)
+
+    def set_buffers(self, size):
+        """Agranda los buffers del socket a size bytes (hasta SOCKET_BUFFER_MAX)"""
+        size = min(size, SOCKET_BUFFER_MAX)
+        for option in (socket.SO_RCVBUF, socket.SO_SNDBUF):
+            try:
+                if self.socket.getsockopt(socket.SOL_SOCKET, option) < size:
+                    self.socket.setsockopt(socket.SOL_SOCKET, option, size)
+            except OSError as e:
+                logging.debug(f"No se pudo ajustar el buffer del socket: {e}")
+
+    def getsockname(self):
+        return self.socket.getsockname()
+
+    def close(self):
+        self.socket.close()
+
+
+class UdpNetwork:
+    """Red real: abre sockets UDP del sistema y corre las sesiones en hilos comunes"""
+
+    def open(self, host="", port=0):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((host, port))
+        return UdpTransport(sock)
+
+    def start_thread(self, target, *args):
+        thread = threading.Thread(target=target, args=args)
+        thread.start()
+        return thread
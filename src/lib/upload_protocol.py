@@ -1,55 +1,157 @@
+import copy
+import hashlib
 import socket
 import os
 import logging
 
-from lib.selective_repeat_protocol import SelectiveRepeatProtocol
-from lib.stop_and_wait_protocol import StopAndWaitProtocol
+from lib import batch, handshake, metrics, protocols, storage, transport
 
 TIMEOUT = 2
-BUFFER = 1024
 MAX_RETRIES = 10
+# Valor de la opción resume en subidas: los rangos los conoce el servidor
+RESUME = 1
 
 
 class UploadProtocol:
-    def __init__(self, args):
+    def __init__(self, args, network=None):
         self.args = args
-        self.socket = None
+        # Red de las sesiones: UDP real o una simulada (ver lib/transport.py)
+        self.network = network or transport.UdpNetwork()
+        self.transport = None
+        # Archivos del lote, si se sube un directorio o un manifiesto (ver lib/batch.py)
+        self.batch = None
 
     def upload_file(self):
-        self.socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-
-        protocol = self.args.protocol if self.args.protocol else "stop-and-wait"
+        paths = batch.local_paths(self.args.src, getattr(self.args, "manifest", None))
+        if paths is not None:
+            return self._upload_batch(paths)
         if not os.path.isfile(self.args.src):
             logging.error(f"Error: El archivo de origen {self.args.src} no existe.")
             return False
-        file_size = os.path.getsize(self.args.src)
+        # El digest viaja en el saludo: el servidor verifica el archivo y puede deduplicarlo
+        digest_options = {handshake.OPT_DIGEST: storage.file_digest(self.args.src)}
+
+        streams = getattr(self.args, "streams", None) or 1
+        if streams > 1:
+            return self._upload_streams(streams, digest_options)
+        # Siempre como porción con id: el servidor guarda lo recibido y un corte
+        # se puede reanudar después con --resume
+        resume = RESUME if getattr(self.args, "resume", False) else None
+        digest_options.update(handshake.part_options(0, 1, self._transfer_id(), resume))
+        return self._upload_session(digest_options)
+
+    def _upload_batch(self, paths):
+        """Sube todos los archivos en una sola sesión, cada uno con su nombre"""
+        try:
+            self.batch = batch.collect(paths)
+        except (OSError, ValueError) as e:
+            logging.error(f"Error: {e}")
+            return False
+        if not self.batch:
+            logging.error("Error: El lote no tiene archivos")
+            return False
+        if (getattr(self.args, "streams", None) or 1) > 1 or getattr(self.args, "resume", False):
+            logging.warning("CLIENTE: Un lote se sube en una sola sesión, se ignoran --streams y --resume")
+        logging.info(f"CLIENTE: Subiendo un lote de {len(self.batch)} archivos ({batch.stream_length(self.batch):,} bytes)")
+        return self._upload_session({handshake.OPT_BATCH: len(self.batch)})
 
-        handshake_msg = f"UPLOAD_CLIENT:{protocol}:{self.args.name}:{file_size}"
+    def _transfer_id(self):
+        """Id de la subida, derivado del archivo: un intento posterior lo reanuda con el mismo id"""
+        stat = os.stat(self.args.src)
+        key = f"{os.path.abspath(self.args.src)}:{stat.st_size}:{stat.st_mtime_ns}:{self.args.name}"
+        return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+    def _upload_streams(self, streams, digest_options):
+        """Sube el archivo en `streams` porciones por sesiones concurrentes"""
+        transfer_id = self._transfer_id()
+        resume = RESUME if getattr(self.args, "resume", False) else None
+        logging.info(f"CLIENTE: Subiendo en {streams} porciones en paralelo (id {transfer_id})")
+
+        # Cada porción con su transporte y su copia de args (la sesión cambia el puerto)
+        uploads = [UploadProtocol(copy.copy(self.args), self.network) for _ in range(streams)]
+        results = [False] * streams
+
+        def run(index):
+            try:
+                results[index] = uploads[index]._upload_session(
+                    dict(digest_options, **handshake.part_options(index, streams, transfer_id, resume))
+                )
+            finally:
+                uploads[index].close()
+
+        threads = [self.network.start_thread(run, i) for i in range(streams)]
+        for thread in threads:
+            thread.join()
+        return all(results)
+
+    def _upload_session(self, extra_options=None):
+        self.transport = self.network.open()
+
+        protocol = self.args.protocol or protocols.DEFAULT
+        if self.batch is not None:
+            # El nombre de un lote sólo identifica la subida en los logs del servidor
+            file_size = batch.stream_length(self.batch)
+            name = self.args.name or os.path.basename(os.path.normpath(self.args.src or self.args.manifest))
+        elif not os.path.isfile(self.args.src):
+            logging.error(f"Error: El archivo de origen {self.args.src} no existe.")
+            return False
+        else:
+            file_size = os.path.getsize(self.args.src)
+            name = self.args.name
+
+        options = protocols.session_options(self.args, self.transport, protocol)
+        options.update(extra_options or {})
+        handshake_msg = handshake.format_message(
+            "UPLOAD_CLIENT", protocol, name, file_size, options=options,
+        )
         logging.info(f"CLIENTE: Enviando saludo: {handshake_msg}")
 
         retries = 0
         current_timeout = TIMEOUT
         while retries < MAX_RETRIES:
-            self.socket.sendto(handshake_msg.encode(), (self.args.host, self.args.port))
+            self.transport.sendto(handshake_msg.encode(), (self.args.host, self.args.port))
             try:
-                self.socket.settimeout(current_timeout)
-                data, _ = self.socket.recvfrom(BUFFER)
-                response = data.decode()
+                response, _ = handshake.wait_response(self.transport, current_timeout)
 
                 if response.startswith("UPLOAD_OK:"):
-                    new_port = int(response.split(":")[1])
+                    # Formato: "UPLOAD_OK:new_port[:opciones]"
+                    fields, options = handshake.parse_message(response, 2)
+                    new_port = int(fields[1])
+                    if not handshake.check_accepted(options):
+                        logging.error(
+                            f"CLIENTE: Formato de paquetes no soportado: {response}"
+                        )
+                        return False
 
                     logging.info(
                         f"CLIENTE: Saludo aceptado. Servidor asignó puerto {new_port}."
                     )
+                    if handshake.OPT_DEDUP in options:
+                        logging.info("CLIENTE: El servidor ya tenía el contenido, no hace falta enviarlo")
+                        return True
                     self.args.port = new_port
+                    session_range = handshake.session_range(options)
+                    if handshake.OPT_RESUME in options and session_range:
+                        logging.info(f"CLIENTE: Reanudando subida desde el byte {session_range[0]:,}")
 
-                    if protocol == "stop-and-wait":
-                        handler = StopAndWaitProtocol(self.args, self.socket)
-                        return handler.send_upload(file_size)
-                    elif protocol == "selective-repeat":
-                        handler = SelectiveRepeatProtocol(self.args, self.socket)
-                        return handler.send_upload(file_size)
+                    handler = protocols.create_handler(protocol, self.args, self.transport, options)
+                    if handler is None:
+                        logging.error(f"CLIENTE: Protocolo no soportado: {protocol}")
+                        return False
+                    handler.batch = self.batch
+                    handler.stats = metrics.for_transfer(self.args, "upload", protocol, name,
+                                                         (self.args.host, self.args.port))
+                    success = handler.send_upload(file_size)
+                    metrics.finish(handler.stats, success)
+                    return success
+                elif (delay := handshake.retry_after(response)) is not None:
+                    # Servidor lleno: se vuelve cuando dice, sin duplicar el timeout
+                    retries += 1
+                    current_timeout = TIMEOUT
+                    logging.warning(
+                        f"CLIENTE: Servidor ocupado, reintentando en {delay:.2f}s ({retries}/{MAX_RETRIES})"
+                    )
+                    handshake.wait_busy(self.transport, delay)
                 else:
                     logging.error(
                         f"CLIENTE: El servidor rechazó el saludo con: {response}"
@@ -68,7 +170,7 @@ class UploadProtocol:
         return False
 
     def close(self):
-        if self.socket:
-            self.socket.close()
-        self.socket = None
+        if self.transport:
+            self.transport.close()
+        self.transport = None
         logging.info("CLIENTE: Socket cerrado.")
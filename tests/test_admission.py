@@ -0,0 +1,137 @@
+import argparse
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import admission, handshake, simulation  # noqa: E402
+from lib.relay import Impairments  # noqa: E402
+from lib.srv_protocol import ServerProtocol  # noqa: E402
+from lib.upload_protocol import UploadProtocol  # noqa: E402
+
+'''ESCENARIO'''
+CLIENTS = 3
+FILE_SIZE = 64 * 1024
+DELAY = 0.005
+
+
+def addr(port):
+    return ("127.0.0.1", port)
+
+
+class AdmissionTest(unittest.TestCase):
+    """Lugares para transferencias, cola acotada de saludos y BUSY cuando no entran"""
+
+    def test_start_queue_busy(self):
+        slots = admission.Admission(1, 1)
+        self.assertEqual(slots.submit(addr(1), 10, "a"), admission.START)
+        self.assertEqual(slots.submit(addr(2), 10, "b"), admission.QUEUED)
+        # Un saludo retransmitido no ocupa otro lugar en la cola
+        self.assertEqual(slots.submit(addr(2), 10, "b"), admission.QUEUED)
+        self.assertEqual(slots.submit(addr(3), 10, "c"), admission.BUSY)
+        self.assertEqual(slots.stats(), {"active": 1, "queued": 1, "busy": 1})
+
+    def test_finish_hands_slot(self):
+        slots = admission.Admission(1, 4)
+        slots.submit(addr(1), 10, "a")
+        slots.submit(addr(2), 10, "b")
+        self.assertEqual(slots.finish(), "b")
+        self.assertEqual(slots.stats()["active"], 1)
+        self.assertIsNone(slots.finish())
+        self.assertEqual(slots.stats()["active"], 0)
+
+    def _order(self, policy):
+        slots = admission.Admission(1, 4, policy)
+        slots.submit(addr(1), 0, "first")
+        for port, size in ((2, 300), (3, 100), (4, 200)):
+            slots.submit(addr(port), size, size)
+        return [slots.finish() for _ in range(3)]
+
+    def test_fifo(self):
+        self.assertEqual(self._order(admission.FIFO), [300, 100, 200])
+
+    def test_sjf(self):
+        self.assertEqual(self._order(admission.SJF), [100, 200, 300])
+        self.assertTrue(admission.Admission(1, 1, admission.SJF).sized)
+
+    def test_retry_after(self):
+        slots = admission.Admission(2, 2)
+        self.assertEqual(slots.retry_after(), admission.INITIAL_DURATION)
+        for port in range(4):
+            slots.submit(addr(port), 10, port)
+        # Con la cola llena se espera también a que se vacíe
+        self.assertEqual(slots.retry_after(), 2 * admission.INITIAL_DURATION)
+        slots.finish(duration=1000.0)
+        self.assertEqual(slots.retry_after(), admission.MAX_RETRY_AFTER)
+
+    def test_close_drops_queue(self):
+        slots = admission.Admission(1, 2)
+        for port in range(3):
+            slots.submit(addr(port), 10, port)
+        self.assertEqual(slots.close(), 2)
+        self.assertIsNone(slots.finish())
+
+    def test_from_args(self):
+        self.assertIsNone(admission.from_args(argparse.Namespace(max_transfers=0)))
+        slots = admission.from_args(argparse.Namespace(schedule=admission.SJF))
+        self.assertEqual((slots.max_active, slots.queue_size, slots.policy),
+                         (admission.DEFAULT_MAX_TRANSFERS, admission.DEFAULT_QUEUE_SIZE, admission.SJF))
+
+    def test_busy_message(self):
+        message = handshake.busy_message(1.234)
+        self.assertEqual(message, "BUSY:1.23")
+        self.assertEqual(handshake.retry_after(message), 1.23)
+        self.assertEqual(handshake.retry_after("BUSY:1000"), handshake.MAX_BUSY_WAIT)
+        for response in ("UPLOAD_OK:9001", "BUSY", "BUSY:x", "BUSY:-1", "BUSY:nan"):
+            self.assertIsNone(handshake.retry_after(response))
+
+
+class BusyServerTest(unittest.TestCase):
+    """Con un solo lugar y sin cola, los clientes rechazados vuelven después del BUSY"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+
+    def _upload(self, client):
+        try:
+            return client.upload_file()
+        finally:
+            client.close()
+
+    def test_clients_retry(self):
+        network = simulation.SimulatedNetwork(Impairments(delay=DELAY), seed=1)
+        storage_dir = os.path.join(self.work, "storage")
+        server_args = argparse.Namespace(host=simulation.HOST, port=simulation.SERVER_PORT, storage=storage_dir,
+                                         max_transfers=1, queue_size=0)
+        server = ServerProtocol(server_args, network)
+        server.set_main_socket(network.open(simulation.HOST, simulation.SERVER_PORT))
+        contents, clients = [], []
+        for index in range(CLIENTS):
+            source = os.path.join(self.work, f"{index}.bin")
+            contents.append(os.urandom(FILE_SIZE))
+            with open(source, "wb") as file:
+                file.write(contents[-1])
+            args = simulation._client_args(simulation.SERVER_PORT, "selective-repeat", f"{index}.bin")
+            args.src = source
+            clients.append(network.start_thread(self._upload, UploadProtocol(args, network)))
+        network.start_thread(server.serve, lambda: not any(client.is_alive() for client in clients),
+                             simulation.SERVER_POLL)
+        network.run()
+        server.main_socket.close()
+        self.assertTrue(all(client.result for client in clients))
+        # Los rechazados pueden volver a chocar al reintentar
+        self.assertGreaterEqual(server.admission.stats()["busy"], CLIENTS - 1)
+        for index, content in enumerate(contents):
+            with open(os.path.join(storage_dir, f"{index}.bin"), "rb") as file:
+                self.assertEqual(file.read(), content)
+
+
+if __name__ == "__main__":
+    unittest.main()
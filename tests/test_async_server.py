@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+import random
+import shutil
+import socket
+import sys
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import async_server  # noqa: E402
+from lib.download_protocol import DownloadProtocol  # noqa: E402
+from lib.parser import get_parser  # noqa: E402
+from lib.upload_protocol import UploadProtocol  # noqa: E402
+
+'''ESCENARIO'''
+PROTOCOLS = ("stop-and-wait", "selective-repeat", "fec")
+FILE_SIZE = 200 * 1024
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 5.0
+
+
+def parse(kind, argv):
+    """Args de la línea de comandos de start-server, upload o download"""
+    with mock.patch.object(sys, "argv", [kind, *argv]):
+        return get_parser(kind)
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+        sock.bind((HOST, 0))
+        return sock.getsockname()[1]
+
+
+class AsyncServerTest(unittest.TestCase):
+    """Subidas y descargas de cada protocolo contra el servidor asíncrono por loopback"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.work = tempfile.mkdtemp()
+        cls.storage = os.path.join(cls.work, "storage")
+        cls.port = free_port()
+        args = parse("server", ["-H", HOST, "-p", str(cls.port), "-s", cls.storage, "--async"])
+        cls.quit = False
+        cls.thread = threading.Thread(target=asyncio.run, args=(async_server.serve(args, lambda: cls.quit),))
+        cls.thread.start()
+        cls._wait_listening()
+
+    @classmethod
+    def _wait_listening(cls):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                try:
+                    sock.bind((HOST, cls.port))
+                except OSError:
+                    return
+            time.sleep(0.05)
+        raise RuntimeError("El servidor no arrancó")
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.quit = True
+        cls.thread.join()
+        shutil.rmtree(cls.work)
+        logging.disable(logging.NOTSET)
+
+    def _client(self, kind, *argv):
+        args = parse(kind, ["-q", "-H", HOST, "-p", str(self.port), *argv])
+        return UploadProtocol(args) if kind == "upload" else DownloadProtocol(args)
+
+    def test_upload_and_download(self):
+        content = random.Random(1).randbytes(FILE_SIZE)
+        source = os.path.join(self.work, "source.bin")
+        with open(source, "wb") as file:
+            file.write(content)
+        for protocol in PROTOCOLS:
+            with self.subTest(protocol=protocol):
+                name = f"{protocol}.bin"
+                upload = self._client("upload", "-s", source, "-n", name, "-r", protocol)
+                try:
+                    self.assertTrue(upload.upload_file())
+                finally:
+                    upload.close()
+                with open(os.path.join(self.storage, name), "rb") as file:
+                    self.assertEqual(file.read(), content)
+
+                destination = os.path.join(self.work, f"download-{name}")
+                download = self._client("download", "-d", destination, "-n", name, "-r", protocol)
+                try:
+                    self.assertTrue(download.download_file())
+                finally:
+                    download.close()
+                with open(destination, "rb") as file:
+                    self.assertEqual(file.read(), content)
+
+
+if __name__ == "__main__":
+    unittest.main()
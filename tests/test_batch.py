@@ -0,0 +1,93 @@
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import batch, storage  # noqa: E402
+
+'''ARCHIVOS'''
+FILES = {"a.txt": b"alpha" * 300, "empty.bin": b"", "b.bin": bytes(range(256)) * 9}
+# Tramos que no coinciden con los bordes de los archivos, como los paquetes
+CHUNK = 700
+
+
+class BatchTest(unittest.TestCase):
+    """El flujo del lote: cada archivo precedido por su header, separado y verificado al final"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+        self.src = os.path.join(self.work, "src")
+        self.dst = os.path.join(self.work, "dst")
+        os.makedirs(self.src)
+        for name, content in FILES.items():
+            with open(os.path.join(self.src, name), "wb") as file:
+                file.write(content)
+        self.entries = batch.collect(batch.local_paths(self.src))
+
+    def _stream(self, entries):
+        with batch.BatchSource(entries) as source:
+            self.assertEqual(source.length, batch.stream_length(entries))
+            return b"".join(bytes(source.chunk(offset, CHUNK)) for offset in range(0, source.length, CHUNK))
+
+    def _receive(self, stream, **spool_args):
+        published = []
+        with batch.BatchSpool(self.dst, len(stream), on_publish=published.append, **spool_args) as spool:
+            for offset in range(0, len(stream), CHUNK):
+                spool.file.write(stream[offset:offset + CHUNK])
+            return spool.commit(), published
+
+    def test_format(self):
+        stream = self._stream(self.entries)
+        entry = self.entries[0]
+        self.assertEqual(entry.name, "a.txt")
+        self.assertEqual(stream[:batch.ENTRY_HEADER.size + 5], batch.entry_header(entry))
+        self.assertEqual(batch.ENTRY_HEADER.unpack_from(stream)[:2], (5, len(FILES["a.txt"])))
+
+    def test_roundtrip(self):
+        ok, published = self._receive(self._stream(self.entries), index=True)
+        self.assertTrue(ok)
+        self.assertEqual(sorted(os.path.basename(path) for path in published), sorted(FILES))
+        for name, content in FILES.items():
+            with open(os.path.join(self.dst, name), "rb") as file:
+                self.assertEqual(file.read(), content)
+        # No quedan ni el temporal del lote ni los parciales
+        self.assertFalse([name for name in os.listdir(self.dst) if name.endswith(storage.PART_SUFFIX)])
+        self.assertEqual(storage.DigestIndex(self.dst).find(self.entries[0].digest), "a.txt")
+
+    def test_mismatch_discards_only_that_file(self):
+        entries = [entry._replace(digest="0" * 64) if entry.name == "b.bin" else entry for entry in self.entries]
+        ok, _ = self._receive(self._stream(entries))
+        self.assertFalse(ok)
+        self.assertEqual(sorted(os.listdir(self.dst)), ["a.txt", "empty.bin"])
+
+    def test_truncated(self):
+        # Al último archivo (empty.bin) le falta un byte del nombre
+        ok, _ = self._receive(self._stream(self.entries)[:-1])
+        self.assertFalse(ok)
+        self.assertEqual(sorted(os.listdir(self.dst)), ["a.txt", "b.bin"])
+
+    def test_invalid_names(self):
+        for name in ("", ".hidden", "a/b", "x" * (batch.MAX_NAME + 1)):
+            self.assertFalse(batch.valid_name(name))
+        copy = os.path.join(self.work, "a.txt")
+        shutil.copy(os.path.join(self.src, "a.txt"), copy)
+        with self.assertRaises(ValueError):
+            batch.collect([os.path.join(self.src, "a.txt"), copy])
+
+    def test_match(self):
+        self.assertTrue(batch.is_pattern("*.bin") and batch.is_pattern("a.txt,b.bin"))
+        self.assertFalse(batch.is_pattern("a.txt"))
+        entries = batch.match(self.src, "*.bin,a.txt")
+        self.assertEqual([entry.name for entry in entries], ["a.txt", "b.bin", "empty.bin"])
+        self.assertEqual(entries, sorted(self.entries))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,71 @@
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import batch_io  # noqa: E402
+
+'''TANDA'''
+# Más que una tanda, para que el envío se parta en dos syscalls
+COUNT = batch_io.BATCH + 10
+BUFSIZE = 2048
+HOST = "127.0.0.1"
+TIMEOUT = 1.0
+
+
+class BatchIOTest(unittest.TestCase):
+    """Ida y vuelta por loopback con un envío y una recepción por tanda"""
+
+    io_class = batch_io.SocketIO
+
+    def setUp(self):
+        self.sender = self._socket()
+        self.receiver = self._socket()
+        self.sender_io = self.io_class(self.sender, BUFSIZE)
+        self.receiver_io = self.io_class(self.receiver, BUFSIZE)
+
+    def _socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 1 << 20)
+        sock.bind((HOST, 0))
+        self.addCleanup(sock.close)
+        return sock
+
+    def _datagrams(self):
+        # Payloads de sólo lectura y escribibles (como las vistas del archivo mapeado)
+        return [(bytes([i, 0]), bytes([i]) * i if i % 2 else bytearray([i]) * i) for i in range(COUNT)]
+
+    def test_roundtrip(self):
+        datagrams = self._datagrams()
+        self.sender_io.send(datagrams, self.receiver.getsockname())
+        received = []
+        while len(received) < COUNT:
+            batch = self.receiver_io.recv(TIMEOUT)
+            self.assertTrue(batch)
+            for datagram, addr in batch:
+                self.assertEqual(addr, self.sender.getsockname())
+                received.append(bytes(datagram))
+        self.assertEqual(received, [bytes(header) + bytes(payload) for header, payload in datagrams])
+
+    def test_timeout(self):
+        self.assertEqual(self.receiver_io.recv(0.01), [])
+
+
+@unittest.skipUnless(batch_io.AVAILABLE, "requiere sendmmsg/recvmmsg")
+class MmsgIOTest(BatchIOTest):
+    io_class = batch_io.MmsgIO
+
+    def test_reuses_buffers(self):
+        self.sender_io.send([(b"a", b"1"), (b"b", b"2")], self.receiver.getsockname())
+        first = self.receiver_io.recv(TIMEOUT)
+        self.assertEqual([bytes(datagram) for datagram, _ in first], [b"a1", b"b2"])
+        # Las vistas valen hasta el próximo recv: la siguiente tanda se recibe en el mismo buffer
+        self.sender_io.send([(b"c", b"3")], self.receiver.getsockname())
+        self.receiver_io.recv(TIMEOUT)
+        self.assertEqual(bytes(first[0][0]), b"c3")
+
+
+if __name__ == "__main__":
+    unittest.main()
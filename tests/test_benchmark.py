@@ -0,0 +1,126 @@
+import argparse
+import os
+import socket
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import benchmark, packet  # noqa: E402
+from lib.relay import Impairments, LinkModel, LossyRelay  # noqa: E402
+
+'''ENLACE'''
+SEED = 3
+SAMPLES = 1000
+HOST = "127.0.0.1"
+TIMEOUT = 2.0
+
+
+class LinkModelTest(unittest.TestCase):
+    """El relay y la red simulada degradan cada datagrama con el mismo modelo"""
+
+    DATA = packet.pack(packet.DATA, 1, b"x" * 100)
+
+    def test_handshakes_are_not_dropped(self):
+        link = LinkModel(Impairments(loss=1.0, delay=0.01))
+        self.assertEqual(link.delays(b"UPLOAD_CLIENT:fec:a.bin:10"), [0.01])
+        self.assertEqual(link.delays(self.DATA), [])
+        self.assertEqual((link.stats["dropped"], link.stats["data"]), (1, 1))
+
+    def test_loss_rate(self):
+        link = LinkModel(Impairments(loss=0.1), seed=SEED)
+        dropped = sum(not link.delays(self.DATA) for _ in range(SAMPLES))
+        self.assertAlmostEqual(dropped / SAMPLES, 0.1, delta=0.03)
+
+    def test_seed_repeats_losses(self):
+        first, second = LinkModel(Impairments(loss=0.3), SEED), LinkModel(Impairments(loss=0.3), SEED)
+        self.assertEqual([first.delays(self.DATA) for _ in range(100)], [second.delays(self.DATA) for _ in range(100)])
+
+    def test_duplicate_and_reorder(self):
+        link = LinkModel(Impairments(delay=0.01, jitter=0.005, reorder=1.0, duplicate=1.0), SEED)
+        delays = link.delays(self.DATA)
+        self.assertEqual(len(delays), 2)
+        for delay in delays:
+            self.assertGreaterEqual(delay, 0.01 + 0.002)
+            self.assertLessEqual(delay, 0.01 + 0.005 + 0.002)
+        self.assertEqual((link.stats["duplicated"], link.stats["reordered"]), (1, 2))
+
+
+class RelayTest(unittest.TestCase):
+    """Cada puerto del servidor tiene su socket en el relay y los saludos se reescriben"""
+
+    def _socket(self):
+        sock = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+        sock.bind((HOST, 0))
+        sock.settimeout(TIMEOUT)
+        self.addCleanup(sock.close)
+        return sock
+
+    def test_forwards_and_rewrites_handshake(self):
+        server, transfer, client = self._socket(), self._socket(), self._socket()
+        relay = LossyRelay(server.getsockname(), host=HOST)
+        self.addCleanup(relay.close)
+
+        client.sendto(b"UPLOAD_CLIENT:fec:a.bin:10", (HOST, relay.port))
+        data, upstream = server.recvfrom(packet.MAX_DATAGRAM)
+        self.assertEqual(data, b"UPLOAD_CLIENT:fec:a.bin:10")
+        self.assertNotEqual(upstream, client.getsockname())
+
+        # El servidor contesta con el puerto de la transferencia: el cliente ve el del relay
+        transfer_port = transfer.getsockname()[1]
+        transfer.sendto(f"UPLOAD_OK:{transfer_port}:mss=512".encode(), upstream)
+        data, addr = client.recvfrom(packet.MAX_DATAGRAM)
+        fields = data.decode().split(":")
+        self.assertEqual((fields[0], fields[2]), ("UPLOAD_OK", "mss=512"))
+        self.assertNotEqual(int(fields[1]), transfer_port)
+        self.assertEqual(addr[1], int(fields[1]))
+
+        datagram = packet.pack(packet.DATA, 0, b"payload")
+        client.sendto(datagram, addr)
+        self.assertEqual(transfer.recvfrom(packet.MAX_DATAGRAM), (datagram, upstream))
+
+
+class BenchmarkTest(unittest.TestCase):
+    """Parámetros del barrido, reporte y comparación con el baseline"""
+
+    def _result(self, case="upload fec", **values):
+        return dict({"case": case, "runs": 3, "failures": 0, "goodput_mb_s": 10.0, "completion_p99_s": 1.0,
+                     "retransmission_ratio": 0.05}, **values)
+
+    def test_parse(self):
+        self.assertEqual([benchmark.parse_size(text) for text in ("100K", "1.5m", "42")], [102400, 1572864, 42])
+        self.assertEqual(benchmark.parse_list("0, 0.02,", float), [0.0, 0.02])
+
+    def test_percentile(self):
+        self.assertEqual(benchmark.percentile([3, 1, 2], 0.5), 2)
+        self.assertEqual(benchmark.percentile([3, 1, 2], 0.99), 3)
+
+    def test_regressions(self):
+        baseline = {"results": [self._result()]}
+        self.assertEqual(benchmark.regressions({"results": [self._result(goodput_mb_s=8.0)]}, baseline), [])
+        found = benchmark.regressions({"results": [self._result(goodput_mb_s=7.0, completion_p99_s=1.5,
+                                                                 retransmission_ratio=0.09, failures=1)]}, baseline)
+        self.assertEqual(len(found), 4)
+        # Un caso que no está en el baseline sólo cuenta si falló
+        self.assertEqual(benchmark.regressions({"results": [self._result("otro", goodput_mb_s=1.0)]}, baseline), [])
+
+    def test_simulated_sweep(self):
+        args = argparse.Namespace(host=None, port=None, sizes="20K", protocols="selective-repeat", loss="0.05",
+                                  windows=None, mss=None, delay=5.0, jitter=None, reorder=None, duplicate=None,
+                                  direction="both", repeat=2, seed=SEED, timeout=None, server_args=None,
+                                  simulated=True, bandwidth=10.0)
+        report = benchmark.sweep(args)
+        self.assertEqual([result["direction"] for result in report["results"]], ["upload", "download"])
+        for result in report["results"]:
+            self.assertEqual(result["failures"], 0)
+            self.assertGreater(result["goodput_mb_s"], 0)
+        # En tiempo virtual el mismo barrido da los mismos números (salvo la CPU)
+        again = benchmark.sweep(args)
+        for first, second in zip(report["results"], again["results"]):
+            first.pop("cpu_s_per_mb")
+            second.pop("cpu_s_per_mb")
+            self.assertEqual(first, second)
+
+
+if __name__ == "__main__":
+    unittest.main()
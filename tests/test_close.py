@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import base_protocol, handshake, packet  # noqa: E402
+from lib.base_protocol import FinReceiver, FinSender  # noqa: E402
+from lib.selective_repeat_protocol import SelectiveRepeatProtocol  # noqa: E402
+
+'''SESION'''
+MSS = 512
+DIGEST = "ab" * 32
+
+
+class CloseTest(unittest.TestCase):
+    """Cierre con FIN y FIN-ACK: el emisor reintenta con backoff y el receptor
+    contesta los FIN retransmitidos mientras espera"""
+
+    def setUp(self):
+        self.clock = 0.0
+        self.protocol = self._protocol({handshake.OPT_MSS: MSS, handshake.OPT_DIGEST: DIGEST})
+
+    def _protocol(self, options):
+        protocol = SelectiveRepeatProtocol(argparse.Namespace(), None, options)
+        protocol.now = lambda: self.clock
+        return protocol
+
+    def _fin(self):
+        return packet.unpack(self.protocol.fin_packet())
+
+    def test_fin_carries_rto_and_digest(self):
+        fin = self._fin()
+        self.assertEqual(fin.seq, int(self.protocol.rtt.timeout * 1_000_000))
+        self.assertEqual(bytes(fin.payload).hex(), DIGEST)
+        self.assertTrue(self.protocol.accept_fin(fin, 10, 10))
+        self.assertFalse(self.protocol.accept_fin(fin, 9, 10))
+        other = self._protocol({handshake.OPT_MSS: MSS, handshake.OPT_DIGEST: "cd" * 32})
+        self.assertFalse(other.accept_fin(fin, 10, 10))
+
+    def test_sender_retries_with_backoff(self):
+        closing = FinSender(self.protocol)
+        timeout = self.protocol.rtt.timeout
+        self.assertIsNotNone(closing.datagram())
+        self.assertEqual(closing.next_timeout(), timeout)
+        self.clock += timeout
+        self.assertIsNotNone(closing.datagram())
+        self.assertAlmostEqual(closing.next_timeout(), self.protocol.rtt.timeout)
+        self.assertGreater(self.protocol.rtt.timeout, timeout)
+        for _ in range(base_protocol.FIN_RETRIES - 2):
+            self.assertIsNotNone(closing.datagram())
+        self.assertIsNone(closing.datagram())
+
+    def test_sender_result(self):
+        closing = FinSender(self.protocol)
+        self.assertIsNone(closing.on_packet(packet.unpack(packet.pack_sack(1, 0, 8))))
+        self.assertTrue(closing.on_packet(packet.unpack(self.protocol.fin_ack_packet(True))))
+        self.assertFalse(closing.on_packet(packet.unpack(self.protocol.fin_ack_packet(False))))
+
+    def test_receiver_answers_retransmitted_fin(self):
+        fin = self._fin()
+        closing = FinReceiver(self.protocol, fin, True)
+        linger = self.protocol.linger_time(fin)
+        self.assertAlmostEqual(closing.next_timeout(), linger)
+        self.clock += linger / 2
+        self.assertEqual(closing.on_packet(fin), closing.response)
+        # Cada FIN reenviado extiende la espera
+        self.assertAlmostEqual(closing.next_timeout(), linger)
+        self.assertIsNone(closing.on_packet(packet.unpack(packet.pack(packet.DATA, 3, b"x"))))
+        self.clock += linger
+        self.assertLessEqual(closing.next_timeout(), 0)
+
+    def test_linger_time(self):
+        def fin(rto):
+            return packet.unpack(packet.pack(packet.FIN, int(rto * 1_000_000)))
+
+        self.assertAlmostEqual(self.protocol.linger_time(fin(0.1)), (2 ** base_protocol.LINGER_FINS - 1) * 0.1)
+        self.assertEqual(self.protocol.linger_time(fin(0)), base_protocol.MIN_LINGER)
+        self.assertEqual(self.protocol.linger_time(fin(60)), base_protocol.MAX_LINGER)
+
+
+if __name__ == "__main__":
+    unittest.main()
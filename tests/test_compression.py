@@ -0,0 +1,106 @@
+import argparse
+import os
+import random
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import compression, handshake, packet  # noqa: E402
+
+'''BLOQUES'''
+BLOCK = 512
+TEXT = b"lorem ipsum dolor sit amet " * 20
+NOISE = random.Random(1).randbytes(BLOCK)
+
+
+class MemorySource:
+    """Fuente en memoria con la interfaz de storage.Source"""
+
+    def __init__(self, data):
+        self.data = data
+        self.closed = False
+
+    def chunk(self, offset, length):
+        return memoryview(self.data)[offset:offset + length]
+
+    def close(self):
+        self.closed = True
+
+
+class BlockTest(unittest.TestCase):
+    """Cada bloque viaja comprimido sólo si se achica"""
+
+    def test_roundtrip(self):
+        payload = compression.compress_block(TEXT[:BLOCK])
+        self.assertLess(len(payload), BLOCK)
+        self.assertEqual(compression.decompress_block(payload, BLOCK), TEXT[:BLOCK])
+
+    def test_incompressible(self):
+        self.assertIsNone(compression.compress_block(NOISE))
+
+    def test_rejects_invalid(self):
+        with self.assertRaises(ValueError):
+            compression.decompress_block(b"not deflate", BLOCK)
+        # Un bloque que se expande más allá del MSS acordado
+        with self.assertRaises(ValueError):
+            compression.decompress_block(compression.compress_block(b"a" * (BLOCK + 1)), BLOCK)
+        with self.assertRaises(ValueError):
+            compression.decompress_block(compression.compress_block(TEXT[:BLOCK])[:-2], BLOCK)
+
+    def test_negotiation(self):
+        offered = {handshake.OPT_WIRE: str(packet.WIRE_VERSION), handshake.OPT_COMPRESS: compression.ZLIB}
+        args = argparse.Namespace(congestion=None)
+        self.assertEqual(handshake.negotiate_options(offered, args)[handshake.OPT_COMPRESS], compression.ZLIB)
+        offered[handshake.OPT_COMPRESS] = "lz4"
+        self.assertNotIn(handshake.OPT_COMPRESS, handshake.negotiate_options(offered, args))
+
+
+class CompressedSourceTest(unittest.TestCase):
+    """El hilo comprime por adelantado; lo incompresible sale crudo"""
+
+    def _source(self, data):
+        source = compression.CompressedSource(MemorySource(data), len(data), BLOCK)
+        self.addCleanup(source.close)
+        return source
+
+    def _blocks(self, source, data):
+        return [source.block(offset, min(BLOCK, len(data) - offset)) for offset in range(0, len(data), BLOCK)]
+
+    def test_mixed_blocks(self):
+        data = TEXT[:BLOCK] + NOISE + TEXT[:100]
+        source = self._source(data)
+        blocks = self._blocks(source, data)
+        self.assertEqual([flags for flags, _ in blocks], [packet.FLAG_COMPRESSED, 0, packet.FLAG_COMPRESSED])
+        self.assertEqual(bytes(blocks[1][1]), NOISE)
+        self.assertEqual(compression.decompress_block(blocks[2][1], BLOCK), TEXT[:100])
+        self.assertEqual(source.raw_blocks, 1)
+        self.assertLess(source.packed_bytes, source.raw_bytes)
+
+    def test_release_keeps_retransmission_equal(self):
+        data = TEXT[:BLOCK] * 2
+        source = self._source(data)
+        first = source.block(0, BLOCK)
+        # Una retransmisión antes de la confirmación reusa el bloque ya comprimido
+        self.assertIs(source.block(0, BLOCK)[1], first[1])
+        source.release(0)
+        self.assertNotIn(0, source.blocks)
+        # Ya confirmado: si hiciera falta de nuevo, se comprime en el momento
+        self.assertEqual(source.block(0, BLOCK), first)
+
+    def test_skips_after_incompressible_run(self):
+        data = NOISE * compression.INCOMPRESSIBLE_RUN + TEXT[:BLOCK]
+        source = self._source(data)
+        flags, _ = self._blocks(source, data)[-1]
+        # El bloque compresible cae en la racha que ya no se intenta comprimir
+        self.assertEqual(flags, 0)
+        self.assertEqual(source.raw_blocks, compression.INCOMPRESSIBLE_RUN + 1)
+
+    def test_close_closes_source(self):
+        inner = MemorySource(TEXT)
+        compression.CompressedSource(inner, len(TEXT), BLOCK).close()
+        self.assertTrue(inner.closed)
+
+
+if __name__ == "__main__":
+    unittest.main()
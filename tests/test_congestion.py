@@ -0,0 +1,99 @@
+import math
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import congestion  # noqa: E402
+
+'''VENTANA'''
+MAX_WINDOW = 64
+BASE_RTT = 0.01
+
+
+class NewRenoTest(unittest.TestCase):
+    """Slow start, crecimiento lineal y reducción multiplicativa"""
+
+    def setUp(self):
+        self.cc = congestion.get_controller("newreno", MAX_WINDOW)
+
+    def test_slow_start(self):
+        self.assertEqual(self.cc.window, congestion.INITIAL_CWND)
+        self.cc.on_ack(5, None)
+        self.assertEqual(self.cc.cwnd, congestion.INITIAL_CWND + 5)
+
+    def test_congestion_avoidance(self):
+        self.cc.ssthresh = self.cc.cwnd = 20.0
+        self.cc.on_ack(20, None)
+        self.assertAlmostEqual(self.cc.cwnd, 21.0)
+
+    def test_capped_by_receiver(self):
+        self.cc.on_ack(1000, None)
+        self.assertEqual(self.cc.window, MAX_WINDOW)
+
+    def test_loss_halves(self):
+        self.cc.cwnd = 30.0
+        self.cc.on_loss()
+        self.assertEqual((self.cc.cwnd, self.cc.ssthresh), (15.0, 15.0))
+
+    def test_timeout_restarts(self):
+        self.cc.cwnd = 30.0
+        self.cc.on_timeout()
+        self.assertEqual((self.cc.cwnd, self.cc.ssthresh), (1.0, 15.0))
+        # La ventana entera nunca baja de MIN_CWND
+        self.assertEqual(self.cc.window, congestion.MIN_CWND)
+
+    def test_unknown(self):
+        with self.assertRaises(ValueError):
+            congestion.get_controller("cubic", MAX_WINDOW)
+
+
+class VegasTest(unittest.TestCase):
+    """La ventana sigue la cola estimada con el mínimo RTT de cada ronda"""
+
+    def setUp(self):
+        self.cc = congestion.get_controller("vegas", MAX_WINDOW)
+
+    def _round(self, rtt):
+        """Confirma la ventana de la ronda con el mismo RTT"""
+        for _ in range(math.ceil(self.cc.round_window)):
+            self.cc.on_ack(1, rtt)
+
+    def test_leaves_slow_start_on_queue(self):
+        self._round(BASE_RTT)
+        self.assertEqual(self.cc.cwnd, 2 * congestion.INITIAL_CWND)
+        self._round(BASE_RTT * 2)
+        self.assertEqual(self.cc.ssthresh, self.cc.cwnd)
+        # Fuera de slow start la ventana ya no se duplica por ronda
+        self._round(BASE_RTT * 2)
+        self.assertLess(self.cc.cwnd, self.cc.ssthresh)
+
+    def test_grows_without_queue(self):
+        self.cc.ssthresh = self.cc.cwnd = 20.0
+        self._round(BASE_RTT)
+        self.assertEqual(self.cc.cwnd, 21.0)
+
+    def test_shrinks_with_queue(self):
+        self.cc.ssthresh = self.cc.cwnd = 20.0
+        self._round(BASE_RTT)
+        # diff = 21 * (1 - 1 / 2) > VEGAS_BETA: se pasa de lo que debería encolar
+        self._round(BASE_RTT * 2)
+        self.assertEqual(self.cc.cwnd, 20.0)
+
+    def test_holds_between_thresholds(self):
+        self.cc.ssthresh = self.cc.cwnd = 20.0
+        self._round(BASE_RTT)
+        cwnd = self.cc.cwnd
+        # diff = 21 * (1 - 1 / 1.15) ~ 2.7, entre VEGAS_ALPHA y VEGAS_BETA
+        self._round(BASE_RTT * 1.15)
+        self.assertEqual(self.cc.cwnd, cwnd)
+
+    def test_loss_like_newreno(self):
+        self.cc.cwnd = 30.0
+        self.cc.on_loss()
+        self.assertEqual(self.cc.cwnd, 15.0)
+
+
+if __name__ == "__main__":
+    unittest.main()
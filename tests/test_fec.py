@@ -0,0 +1,127 @@
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import fec_protocol, handshake, packet, protocols  # noqa: E402
+from lib.fec_protocol import FecProtocol  # noqa: E402
+
+'''SESION'''
+MSS = 512
+WINDOW = 64
+GROUP = fec_protocol.group_size(fec_protocol.INITIAL_LOSS)
+# Dos grupos enteros y uno corto, con el último paquete incompleto
+SIZE = (2 * GROUP + 3) * MSS - 100
+
+
+class MemoryFile:
+    """Destino en memoria con la interfaz de storage.OffsetFile"""
+
+    def __init__(self, length):
+        self.data = bytearray(length)
+        self.length = length
+
+    def write_at(self, offset, data):
+        self.data[offset:offset + len(data)] = data
+        return len(data)
+
+    def read_at(self, offset, length):
+        return bytes(self.data[offset:offset + length])
+
+    def advance(self, end):
+        pass
+
+
+class MemorySource:
+    """Fuente en memoria con la interfaz de storage.Source"""
+
+    def __init__(self, size):
+        self.data = bytes((i * 7) % 251 for i in range(size))
+
+    def chunk(self, offset, length):
+        return memoryview(self.data)[offset:offset + length]
+
+    def block(self, offset, length):
+        return 0, self.chunk(offset, length)
+
+    def release(self, offset):
+        pass
+
+
+class FecTest(unittest.TestCase):
+    """Cada grupo de paquetes nuevos cierra con su paridad, y el receptor
+    reconstruye un paquete perdido por grupo"""
+
+    def setUp(self):
+        self.protocol = self._protocol()
+        self.protocol.cc.cwnd = WINDOW
+        self.source = MemorySource(SIZE)
+        self.sender = self.protocol.send_window(self.source, SIZE)
+
+    def _protocol(self):
+        return FecProtocol(argparse.Namespace(), None, {handshake.OPT_MSS: MSS, handshake.OPT_WINDOW: WINDOW})
+
+    def _packets(self):
+        return [packet.unpack(bytes(header) + bytes(payload)) for header, payload in self.sender.new_datagrams()]
+
+    def _receiver(self):
+        file = MemoryFile(SIZE)
+        return file, self._protocol().receive_window(file)
+
+    def test_group_size(self):
+        self.assertEqual(fec_protocol.group_size(0), fec_protocol.MAX_GROUP)
+        self.assertEqual(fec_protocol.group_size(0.5), fec_protocol.MIN_GROUP)
+        self.assertEqual(fec_protocol.group_size(0.01), 25)
+
+    def test_parity_closes_each_group(self):
+        pkts = self._packets()
+        parities = [(pkt.seq, packet.PARITY_COUNT.unpack_from(pkt.payload)[0])
+                    for pkt in pkts if pkt.type == packet.PARITY]
+        self.assertEqual(parities, [(0, GROUP), (GROUP, GROUP), (2 * GROUP, 3)])
+        # Paridad del grupo corto: XOR de sus bloques, con el último completado con ceros
+        expected = 0
+        for seq in range(2 * GROUP, 2 * GROUP + 3):
+            expected ^= int.from_bytes(self.source.data[seq * MSS:(seq + 1) * MSS], "little")
+        self.assertEqual(pkts[-1].payload[packet.PARITY_COUNT.size:], expected.to_bytes(MSS, "little"))
+        self.assertEqual(self.sender.packets_sent, 2 * GROUP + 3 + 3)
+
+    def test_recovers_one_loss_per_group(self):
+        file, receiver = self._receiver()
+        lost = {1, GROUP + GROUP - 1, 2 * GROUP + 2}
+        receiver.receive([pkt for pkt in self._packets() if pkt.type == packet.PARITY or pkt.seq not in lost])
+        self.assertEqual(receiver.recovered, 3)
+        self.assertEqual(receiver.base_num, 2 * GROUP + 3)
+        self.assertEqual(bytes(file.data), self.source.data)
+
+    def test_waits_for_second_loss(self):
+        file, receiver = self._receiver()
+        pkts = self._packets()[:GROUP + 1]
+        late = pkts.pop(3)
+        pkts.pop(1)
+        receiver.receive(pkts)
+        # Faltan dos: la paridad se guarda hasta que llegue uno de ellos
+        self.assertEqual((receiver.recovered, receiver.base_num, receiver.lost), (0, 1, 2))
+        receiver.receive([late])
+        self.assertEqual((receiver.recovered, receiver.base_num), (1, GROUP))
+        self.assertEqual(bytes(file.data[:GROUP * MSS]), self.source.data[:GROUP * MSS])
+
+    def test_loss_rate_follows_receiver(self):
+        self._packets()
+        # El receptor vio 4 pérdidas en los primeros 2 * GROUP paquetes
+        self.sender.on_ack(packet.unpack(packet.pack_sack(2 * GROUP, 0, WINDOW, flags=4)))
+        self.assertGreater(self.sender.loss_rate, fec_protocol.INITIAL_LOSS)
+        rate = self.sender.loss_rate
+        # Un SACK atrasado no vuelve a contar lo ya informado
+        self.sender.on_ack(packet.unpack(packet.pack_sack(GROUP, 0, WINDOW, flags=2)))
+        self.assertEqual(self.sender.loss_rate, rate)
+
+    def test_mss_leaves_room_for_parity(self):
+        args = argparse.Namespace(probe_mtu=False, mss=handshake.MAX_MSS, window=None)
+        options = protocols.session_options(args, None, protocols.FEC)
+        self.assertEqual(options[handshake.OPT_MSS], handshake.MAX_MSS - packet.PARITY_COUNT.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
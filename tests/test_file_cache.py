@@ -0,0 +1,83 @@
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import file_cache  # noqa: E402
+
+'''ARCHIVOS'''
+FILE_SIZE = 1000
+MAX_BYTES = 2 * FILE_SIZE
+
+
+class FileCacheTest(unittest.TestCase):
+    """Las descargas del mismo archivo comparten el mapeo hasta que se reemplaza o se desaloja"""
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+        self.cache = file_cache.FileCache(MAX_BYTES)
+
+    def _file(self, name, fill=b"a", size=FILE_SIZE):
+        path = os.path.join(self.work, name)
+        with open(path, "wb") as file:
+            file.write(fill * size)
+        return path
+
+    def _read(self, path, start=0):
+        with self.cache.open(path, start) as source:
+            return bytes(source.chunk(0, FILE_SIZE))
+
+    def test_hit_shares_mapping(self):
+        path = self._file("a.bin")
+        first, second = self.cache.open(path), self.cache.open(path, 10)
+        self.assertIs(first.map, second.map)
+        self.assertEqual(bytes(second.chunk(0, 5)), b"aaaaa")
+        first.close()
+        second.close()
+        self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+
+    def test_replaced_file_is_remapped(self):
+        path = self._file("a.bin")
+        self.assertEqual(self._read(path), b"a" * FILE_SIZE)
+        # Una subida publica con un rename: otro inodo
+        os.replace(self._file("new.bin", b"b"), path)
+        self.assertEqual(self._read(path), b"b" * FILE_SIZE)
+        self.assertEqual(self.cache.stats()["files"], 1)
+        self.assertEqual(self.cache.misses, 2)
+
+    def test_evicts_least_recently_used(self):
+        a, b, c = self._file("a.bin"), self._file("b.bin"), self._file("c.bin")
+        self._read(a)
+        self._read(b)
+        self._read(a)
+        self._read(c)
+        self.assertEqual(list(self.cache.entries), [a, c])
+        self.assertEqual(self.cache.stats()["bytes"], MAX_BYTES)
+        self.assertEqual(self.cache.evictions, 1)
+
+    def test_large_and_empty_files_are_not_cached(self):
+        large = self._file("large.bin", size=MAX_BYTES + 1)
+        empty = self._file("empty.bin", size=0)
+        self.assertEqual(self._read(large), b"a" * FILE_SIZE)
+        self.assertEqual(self._read(empty), b"")
+        self.assertEqual(self.cache.stats()["files"], 0)
+
+    def test_invalidate(self):
+        path = self._file("a.bin")
+        self._read(path)
+        self.cache.invalidate(path)
+        self.assertEqual(self.cache.stats(), {"hits": 0, "misses": 1, "evictions": 0, "files": 0, "bytes": 0})
+
+    def test_from_args(self):
+        self.assertEqual(file_cache.from_args(argparse.Namespace()).max_bytes,
+                         file_cache.DEFAULT_MAX_MB * 1024 * 1024)
+        self.assertIsNone(file_cache.from_args(argparse.Namespace(cache_size=0)))
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,161 @@
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import handshake, packet, path_mtu, protocols, simulation  # noqa: E402
+
+'''RED'''
+PATH_MTU = 1500
+
+
+def server_args(**values):
+    return argparse.Namespace(**dict({"congestion": None}, **values))
+
+
+class MessageTest(unittest.TestCase):
+    """Saludos de texto: campos posicionales seguidos de opciones clave=valor"""
+
+    def test_roundtrip(self):
+        message = handshake.format_message("UPLOAD_CLIENT", "fec", "a.bin", 10, options={"mss": 1400, "win": 64})
+        self.assertEqual(message, "UPLOAD_CLIENT:fec:a.bin:10:mss=1400:win=64")
+        fields, options = handshake.parse_message(message, 4)
+        self.assertEqual(fields, ["UPLOAD_CLIENT", "fec", "a.bin", "10"])
+        self.assertEqual(options, {"mss": "1400", "win": "64"})
+
+    def test_invalid(self):
+        with self.assertRaises(ValueError):
+            handshake.parse_message("DOWNLOAD_CLIENT:fec", 3)
+        with self.assertRaises(ValueError):
+            handshake.parse_message("DOWNLOAD_CLIENT:fec:a.bin:mss", 3)
+
+
+class NegotiationTest(unittest.TestCase):
+    """El servidor acota lo que ofrece el cliente y el cliente lo adopta"""
+
+    def _negotiate(self, offered, **args):
+        return handshake.negotiate_options(offered, server_args(**args))
+
+    def _offer(self, **options):
+        return dict({handshake.OPT_WIRE: str(packet.WIRE_VERSION)}, **options)
+
+    def test_version(self):
+        self.assertIsNone(self._negotiate({handshake.OPT_WIRE: "1,2"}))
+        self.assertIsNone(self._negotiate({handshake.OPT_WIRE: "x"}))
+        accepted = self._negotiate({handshake.OPT_WIRE: f"1,{packet.WIRE_VERSION}"})
+        self.assertTrue(handshake.check_accepted(accepted))
+
+    def test_defaults(self):
+        accepted = self._negotiate(self._offer())
+        self.assertEqual(handshake.session_params(accepted),
+                         (handshake.DEFAULT_MSS, handshake.DEFAULT_WINDOW, None))
+
+    def test_bounds(self):
+        accepted = self._negotiate(self._offer(mss="10", win="99999", rto="250"))
+        self.assertEqual(handshake.session_params(accepted), (handshake.MIN_MSS, handshake.DEFAULT_WINDOW, 0.25))
+        # La ventana del receptor no pasa MAX_WINDOW_BYTES en memoria
+        accepted = self._negotiate(self._offer(mss=str(handshake.MAX_MSS), win="1024"))
+        mss, window, _ = handshake.session_params(accepted)
+        self.assertLessEqual(mss * window, handshake.MAX_WINDOW_BYTES)
+
+    def test_congestion(self):
+        self.assertEqual(self._negotiate(self._offer(cc="vegas"), congestion="newreno")[handshake.OPT_CONGESTION], "vegas")
+        self.assertEqual(self._negotiate(self._offer(cc="nope"), congestion="fixed")[handshake.OPT_CONGESTION], "fixed")
+        self.assertNotIn(handshake.OPT_CONGESTION, self._negotiate(self._offer(cc="nope")))
+
+    def test_client_options(self):
+        args = argparse.Namespace(mss=None, window=None)
+        options = handshake.client_options(args, mss=1400, rto=0.03)
+        self.assertEqual((options[handshake.OPT_MSS], options[handshake.OPT_RTO]), (1400, 30))
+        # Un --mss menor que el sondeado gana
+        args.mss = 900
+        self.assertEqual(handshake.client_options(args, mss=1400)[handshake.OPT_MSS], 900)
+
+    def test_session_options_without_probe(self):
+        args = argparse.Namespace(probe_mtu=False, mss=None, window=32)
+        options = protocols.session_options(args, None)
+        self.assertEqual((options[handshake.OPT_MSS], options[handshake.OPT_WINDOW]), (handshake.DEFAULT_MSS, 32))
+
+
+class PartTest(unittest.TestCase):
+    """Porciones de una transferencia en paralelo: ambos extremos calculan el mismo rango"""
+
+    def _accepted(self, offered, total=1000, upload=True, confirmed=None):
+        accepted = {}
+        if not handshake.negotiate_part(offered, accepted, total, upload, confirmed):
+            return None
+        return accepted
+
+    def test_ranges_cover_file(self):
+        ranges = [handshake.part_range(1001, index, 3) for index in range(3)]
+        self.assertEqual(ranges, [(0, 333), (333, 667), (667, 1001)])
+
+    def test_upload_part(self):
+        accepted = self._accepted(handshake.part_options(1, 4, "abc"))
+        self.assertEqual(accepted[handshake.OPT_TRANSFER], "abc")
+        self.assertEqual(handshake.session_range(accepted), (250, 500))
+
+    def test_whole_file(self):
+        self.assertEqual(self._accepted({}), {})
+
+    def test_invalid(self):
+        self.assertIsNone(self._accepted(handshake.part_options(4, 4, "abc")))
+        self.assertIsNone(self._accepted({handshake.OPT_PART: "x/2", handshake.OPT_TRANSFER: "abc"}))
+        self.assertIsNone(self._accepted(handshake.part_options(0, handshake.MAX_STREAMS + 1, "abc")))
+        # Una subida en porciones necesita el id que las junta
+        self.assertIsNone(self._accepted(handshake.part_options(0, 2)))
+        self.assertIsNone(self._accepted(handshake.part_options(0, 2, "../x")))
+        self.assertIsNotNone(self._accepted(handshake.part_options(0, 2), upload=False))
+
+
+class ResumeTest(unittest.TestCase):
+    """Al reanudar, la sesión arranca en el primer byte que falta"""
+
+    _accepted = PartTest._accepted
+
+    def test_upload_from_journal(self):
+        accepted = self._accepted(handshake.part_options(0, 1, "abc", 1), confirmed=[(0, 300), (500, 600)])
+        self.assertEqual(handshake.session_range(accepted), (300, 1000))
+        self.assertEqual(accepted[handshake.OPT_RESUME], 1)
+
+    def test_download_from_client_ranges(self):
+        resume = handshake.format_ranges([(0, 250), (250, 400)])
+        accepted = self._accepted(handshake.part_options(0, 2, resume=resume), upload=False)
+        self.assertEqual(handshake.session_range(accepted), (400, 500))
+        # Una porción ya completa queda vacía
+        accepted = self._accepted(handshake.part_options(0, 1, resume="0-1000"), upload=False)
+        self.assertEqual(handshake.session_range(accepted), (1000, 1000))
+
+    def test_invalid_ranges(self):
+        self.assertIsNone(self._accepted(handshake.part_options(0, 1, resume="5-2"), upload=False))
+        with self.assertRaises(ValueError):
+            handshake.parse_ranges("1-x")
+
+
+class PathMtuTest(unittest.TestCase):
+    """El sondeo encuentra el datagrama más grande que pasa sin fragmentar"""
+
+    def test_probe(self):
+        network = simulation.SimulatedNetwork(mtu=PATH_MTU)
+        server, client = network.open(), network.open()
+        result = []
+
+        def serve():
+            while (received := server.recvfrom(packet.MAX_DATAGRAM, 1.0)) is not None:
+                path_mtu.answer_probe(server, *received)
+
+        def probe():
+            result.append(path_mtu.probe_datagram_size(client, server.getsockname()))
+
+        network.start_thread(serve)
+        network.start_thread(probe)
+        network.run()
+        size, rtt = result[0]
+        self.assertEqual(size, max(c for c in path_mtu.CANDIDATES if c <= PATH_MTU))
+        self.assertIsNotNone(rtt)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,146 @@
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import unittest
+import urllib.error
+import urllib.request
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import admission, file_cache, metrics, simulation  # noqa: E402
+from lib.relay import Impairments  # noqa: E402
+
+'''TRANSFERENCIAS'''
+FILE_SIZE = 32 * 1024
+DELAY = 0.01
+
+
+def summary(success=True, **values):
+    """Resumen con los campos que agrega el Registry"""
+    fields = dict({field: 0 for field, _, _ in metrics.TOTALS}, srtt_ms=None)
+    return dict(fields, success=success, **values)
+
+
+def stats(direction="upload", protocol="fec"):
+    return metrics.TransferStats(direction, protocol, "a.bin", ("127.0.0.1", 1), "server")
+
+
+class RegistryTest(unittest.TestCase):
+    """Agregados del servidor en el formato de texto de Prometheus"""
+
+    def _finish(self, registry, success, **values):
+        transfer = stats()
+        registry.start(transfer)
+        registry.finish(transfer, summary(success, **values))
+
+    def test_render(self):
+        registry = metrics.Registry()
+        registry.start(stats("download", "stop-and-wait"))
+        self._finish(registry, True, bytes=1000, srtt_ms=20.0)
+        self._finish(registry, False, bytes=500, srtt_ms=40.0)
+        lines = registry.render().splitlines()
+        for line in (
+            "# TYPE file_transfer_active gauge",
+            'file_transfer_active{direction="download",protocol="stop-and-wait"} 1',
+            'file_transfer_active{direction="upload",protocol="fec"} 0',
+            'file_transfer_transfers_total{direction="upload",protocol="fec",result="failed"} 1',
+            'file_transfer_transfers_total{direction="upload",protocol="fec",result="ok"} 1',
+            "# TYPE file_transfer_bytes_total counter",
+            'file_transfer_bytes_total{direction="upload",protocol="fec"} 1500',
+            'file_transfer_srtt_seconds_sum{direction="upload",protocol="fec"} 0.06',
+            'file_transfer_srtt_seconds_count{direction="upload",protocol="fec"} 2',
+        ):
+            self.assertIn(line, lines)
+        # Cada familia tiene su HELP y su TYPE
+        help_lines = [line for line in lines if line.startswith("# HELP")]
+        self.assertEqual(len(help_lines), len([line for line in lines if line.startswith("# TYPE")]))
+        self.assertEqual(len(help_lines), 3 + len(metrics.TOTALS))
+
+    def test_cache_and_admission(self):
+        cache = file_cache.FileCache(1024)
+        cache.hits = 3
+        slots = admission.Admission(1, 1)
+        slots.submit(("127.0.0.1", 1), 10, "a")
+        slots.submit(("127.0.0.1", 2), 10, "b")
+        slots.submit(("127.0.0.1", 3), 10, "c")
+        lines = metrics.Registry(cache, slots).render().splitlines()
+        for line in ("file_transfer_cache_hits_total 3", "file_transfer_slots_in_use 1", "file_transfer_queued 1",
+                     "file_transfer_busy_total 1"):
+            self.assertIn(line, lines)
+
+    def test_http(self):
+        registry = metrics.Registry()
+        self._finish(registry, True)
+        server = metrics.serve_http(registry, 0)
+        self.addCleanup(server.server_close)
+        self.addCleanup(server.shutdown)
+        url = f"http://{metrics.METRICS_HOST}:{server.server_address[1]}"
+        with urllib.request.urlopen(url + metrics.METRICS_PATH) as response:
+            self.assertEqual(response.headers["Content-Type"], metrics.CONTENT_TYPE)
+            self.assertEqual(response.read().decode(), registry.render())
+        with self.assertRaises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(url + "/other")
+        self.assertEqual(error.exception.code, 404)
+        error.exception.close()
+
+
+class MemoryFile:
+    def read_at(self, offset, length):
+        return bytes(length)
+
+    def checkpoint(self):
+        pass
+
+
+class TimedDataTest(unittest.TestCase):
+    """Sólo las lecturas y escrituras del archivo cuentan como espera de disco"""
+
+    def test_disk_methods(self):
+        transfer = stats()
+        clock = iter(range(100))
+        transfer.clock = lambda: next(clock)
+        timed = metrics.TimedData(MemoryFile(), transfer)
+        timed.checkpoint()
+        self.assertEqual(transfer.disk_time, 0)
+        self.assertEqual(timed.read_at(0, 3), bytes(3))
+        timed.read_at(0, 1)
+        # Una unidad del reloj por llamada medida
+        self.assertEqual(transfer.disk_time, 2)
+
+
+class SummaryTest(unittest.TestCase):
+    """--summary-json: una línea JSON por transferencia, de cada extremo"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+
+    def test_transfer_summaries(self):
+        source = os.path.join(self.work, "source.bin")
+        with open(source, "wb") as file:
+            file.write(os.urandom(FILE_SIZE))
+        path = os.path.join(self.work, "summary.jsonl")
+        network = simulation.SimulatedNetwork(Impairments(delay=DELAY), seed=1)
+        ok, _ = simulation.run_transfer(network, "upload", "selective-repeat", source, self.work, "copy.bin",
+                                        {"summary_json": path}, {"summary_json": path})
+        self.assertTrue(ok)
+        with open(path) as file:
+            summaries = {line["role"]: line for line in map(json.loads, file)}
+        client, server = summaries["client"], summaries["server"]
+        for line in (client, server):
+            self.assertTrue(line["success"])
+            self.assertEqual((line["direction"], line["protocol"], line["bytes"]),
+                             ("upload", "selective-repeat", FILE_SIZE))
+        self.assertEqual(client["retransmissions"], 0)
+        self.assertGreaterEqual(client["srtt_ms"], 2 * DELAY * 1000)
+        self.assertIsNone(server["srtt_ms"])
+        self.assertEqual(server["packets_received"], client["packets_sent"])
+
+
+if __name__ == "__main__":
+    unittest.main()
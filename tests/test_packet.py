@@ -0,0 +1,73 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import packet  # noqa: E402
+
+
+class PacketTest(unittest.TestCase):
+    """Header binario: ida y vuelta, y rechazo de datagramas inválidos"""
+
+    def test_roundtrip(self):
+        datagram = packet.pack(packet.DATA, 2 ** 40, b"payload", flags=packet.FLAG_COMPRESSED, conn_id=7)
+        self.assertEqual(len(datagram), packet.HEADER_SIZE + len(b"payload"))
+        pkt = packet.unpack(datagram)
+        self.assertEqual((pkt.type, pkt.flags, pkt.seq, pkt.conn_id),
+                         (packet.DATA, packet.FLAG_COMPRESSED, 2 ** 40, 7))
+        self.assertEqual(bytes(pkt.payload), b"payload")
+
+    def test_header_into_matches_pack(self):
+        payload = b"x" * 100
+        header = packet.pack_header_into(bytearray(packet.HEADER_SIZE), packet.ACK, 5, payload, conn_id=3)
+        self.assertEqual(bytes(header) + payload, packet.pack(packet.ACK, 5, payload, conn_id=3))
+
+    def test_rejects_corrupt(self):
+        datagram = bytearray(packet.pack(packet.DATA, 1, b"payload"))
+        datagram[-1] ^= 0xFF
+        with self.assertRaises(ValueError):
+            packet.unpack(bytes(datagram))
+
+    def test_rejects_short_and_truncated(self):
+        datagram = packet.pack(packet.DATA, 1, b"payload")
+        with self.assertRaises(ValueError):
+            packet.unpack(datagram[:packet.HEADER_SIZE - 1])
+        with self.assertRaises(ValueError):
+            packet.unpack(datagram[:-1])
+
+    def test_rejects_unknown_version(self):
+        datagram = bytearray(packet.pack(packet.DATA, 1, b"payload"))
+        datagram[0] = packet.WIRE_VERSION + 1
+        with self.assertRaises(ValueError):
+            packet.unpack(bytes(datagram))
+
+
+class SackTest(unittest.TestCase):
+    """SACK: ACK acumulativo, ventana anunciada y bitmap de lo recibido fuera de orden"""
+
+    def _parse(self, datagram):
+        return packet.unpack(datagram)
+
+    def test_bitmap_roundtrip(self):
+        # Bits 0, 2 y 9: llegaron 11, 13 y 20 con el acumulado en 10
+        sack = self._parse(packet.pack_sack(10, 0b1000000101, 64, conn_id=5))
+        self.assertEqual((sack.type, sack.seq, sack.conn_id), (packet.SACK, 10, 5))
+        self.assertEqual(list(packet.sack_seqs(sack)), [11, 13, 20])
+        self.assertEqual(packet.sack_window(sack), 64)
+        self.assertEqual(packet.sack_highest(sack), 20)
+
+    def test_without_bitmap(self):
+        sack = self._parse(packet.pack_sack(7, 0, 32))
+        self.assertEqual(len(sack.payload), packet.SACK_WINDOW.size)
+        self.assertEqual(list(packet.sack_seqs(sack)), [])
+        self.assertEqual(packet.sack_highest(sack), 6)
+
+    def test_nack(self):
+        sack = self._parse(packet.pack_sack(3, 0b10, 16, nack=True))
+        self.assertEqual(sack.type, packet.NACK)
+        self.assertEqual(list(packet.sack_seqs(sack)), [5])
+
+
+if __name__ == "__main__":
+    unittest.main()
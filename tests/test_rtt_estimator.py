@@ -0,0 +1,57 @@
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib.rtt_estimator import MAX_BACKOFF, RttEstimator  # noqa: E402
+
+'''LIMITES'''
+MIN_RTO = 0.05
+MAX_RTO = 2.0
+
+
+class RttEstimatorTest(unittest.TestCase):
+    """SRTT y RTTVAR de RFC 6298, con backoff exponencial acotado"""
+
+    def setUp(self):
+        self.rtt = RttEstimator(MIN_RTO, MAX_RTO)
+
+    def test_initial_rto(self):
+        self.assertEqual(self.rtt.timeout, MIN_RTO)
+        self.assertEqual(RttEstimator(MIN_RTO, MAX_RTO, 0.3).timeout, 0.3)
+        self.assertEqual(RttEstimator(MIN_RTO, MAX_RTO, 10).timeout, MAX_RTO)
+
+    def test_first_sample(self):
+        self.rtt.sample(0.1)
+        self.assertEqual((self.rtt.srtt, self.rtt.rttvar), (0.1, 0.05))
+        self.assertAlmostEqual(self.rtt.timeout, 0.1 + 4 * 0.05)
+
+    def test_smoothing(self):
+        self.rtt.sample(0.1)
+        self.rtt.sample(0.2)
+        self.assertAlmostEqual(self.rtt.rttvar, 0.75 * 0.05 + 0.25 * 0.1)
+        self.assertAlmostEqual(self.rtt.srtt, 0.875 * 0.1 + 0.125 * 0.2)
+        self.assertEqual(self.rtt.samples, 2)
+
+    def test_rto_floor(self):
+        for _ in range(20):
+            self.rtt.sample(0.001)
+        self.assertEqual(self.rtt.timeout, MIN_RTO)
+
+    def test_backoff(self):
+        self.rtt.sample(0.1)
+        rto = self.rtt.timeout
+        self.rtt.on_timeout()
+        self.assertAlmostEqual(self.rtt.timeout, 2 * rto)
+        for _ in range(20):
+            self.rtt.on_timeout()
+        self.assertEqual(self.rtt.backoff, MAX_BACKOFF)
+        self.assertEqual(self.rtt.timeout, MAX_RTO)
+        # Una muestra válida (regla de Karn: de un paquete no retransmitido) quita el backoff
+        self.rtt.sample(0.1)
+        self.assertEqual(self.rtt.backoff, 1)
+
+
+if __name__ == "__main__":
+    unittest.main()
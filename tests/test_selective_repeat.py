@@ -0,0 +1,237 @@
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import congestion, handshake, packet  # noqa: E402
+from lib.selective_repeat_protocol import DUP_THRESHOLD, SelectiveRepeatProtocol  # noqa: E402
+
+'''SESION'''
+MSS = 512
+WINDOW = 16
+PACKETS = 40
+RTT = 0.01
+
+
+class MemoryFile:
+    """Destino en memoria con la interfaz de storage.OffsetFile"""
+
+    def __init__(self):
+        self.data = bytearray()
+        self.position = 0
+
+    def write_at(self, offset, data):
+        if len(self.data) < offset:
+            self.data.extend(bytes(offset - len(self.data)))
+        self.data[offset:offset + len(data)] = data
+        return len(data)
+
+    def advance(self, end):
+        self.position = max(self.position, end)
+
+
+class MemorySource:
+    """Fuente en memoria con la interfaz de storage.Source"""
+
+    def __init__(self, size):
+        self.data = bytes(seq % 256 for seq in range(size))
+        self.released = set()
+
+    def block(self, offset, length):
+        return 0, self.data[offset:offset + length]
+
+    def release(self, offset):
+        self.released.add(offset)
+
+
+class WindowTest(unittest.TestCase):
+    def setUp(self):
+        self.clock = 0.0
+        options = {handshake.OPT_MSS: MSS, handshake.OPT_WINDOW: WINDOW}
+        self.protocol = SelectiveRepeatProtocol(argparse.Namespace(), None, options)
+        self.protocol.now = lambda: self.clock
+
+    def _data(self, seq):
+        return packet.unpack(packet.pack(packet.DATA, seq, bytes([seq]) * MSS))
+
+
+class ReceiveWindowTest(WindowTest):
+    """El receptor confirma con el acumulado y un bitmap de lo que llegó fuera de orden"""
+
+    def setUp(self):
+        super().setUp()
+        self.file = MemoryFile()
+        self.window = self.protocol.receive_window(self.file)
+
+    def _sack(self):
+        return packet.unpack(self.window.sack())
+
+    def test_in_order(self):
+        ack_now, fin = self.window.receive([self._data(0), self._data(1)])
+        self.assertFalse(ack_now)
+        self.assertIsNone(fin)
+        sack = self._sack()
+        self.assertEqual((sack.type, sack.seq), (packet.SACK, 2))
+        self.assertEqual(list(packet.sack_seqs(sack)), [])
+        self.assertEqual(packet.sack_window(sack), WINDOW)
+        self.assertEqual(self.file.position, 2 * MSS)
+
+    def test_gap_sends_nack(self):
+        ack_now, _ = self.window.receive([self._data(0), self._data(2), self._data(3)])
+        self.assertTrue(ack_now)
+        sack = self._sack()
+        self.assertEqual((sack.type, sack.seq), (packet.NACK, 1))
+        self.assertEqual(list(packet.sack_seqs(sack)), [2, 3])
+        self.assertEqual(self.window.out_of_order, 2)
+
+        # Llenar el hueco confirma todo lo consecutivo de una vez
+        self.assertTrue(self.window.on_data(self._data(1)))
+        sack = self._sack()
+        self.assertEqual((sack.type, sack.seq), (packet.SACK, 4))
+        self.assertEqual(bytes(self.file.data), b"".join(bytes([seq]) * MSS for seq in range(4)))
+
+    def test_duplicate_is_acked(self):
+        self.window.receive([self._data(0)])
+        self.assertTrue(self.window.on_data(self._data(0)))
+        self.assertEqual(self.window.duplicates, 1)
+
+    def test_stops_at_fin(self):
+        fin = packet.unpack(packet.pack(packet.FIN, 0))
+        _, received_fin = self.window.receive([self._data(0), fin, self._data(1)])
+        self.assertEqual(received_fin.type, packet.FIN)
+        self.assertEqual(self.window.base_num, 1)
+
+
+class SenderTest(WindowTest):
+    def setUp(self):
+        super().setUp()
+        self.source = MemorySource(PACKETS * MSS)
+        self.window = self.protocol.send_window(self.source, PACKETS * MSS)
+
+    def _ack(self, cum_ack, bitmap=0, window=WINDOW, nack=False):
+        self.window.on_ack(packet.unpack(packet.pack_sack(cum_ack, bitmap, window, nack=nack)))
+
+
+class SendWindowTest(SenderTest):
+    """El emisor sólo recorre lo recién confirmado y retransmite con timers en un heap"""
+
+    def test_fill_respects_cwnd(self):
+        sent = list(self.window.fill())
+        self.assertEqual(sent, list(range(congestion.INITIAL_CWND)))
+        self.assertEqual(list(self.window.fill()), [])
+
+    def test_fill_respects_peer_window(self):
+        self.protocol.cc.cwnd = WINDOW
+        self.protocol.peer_window = 4
+        self.assertEqual(list(self.window.fill()), [0, 1, 2, 3])
+
+    def test_cumulative_ack_slides(self):
+        list(self.window.fill())
+        self.clock += RTT
+        self._ack(4)
+        self.assertEqual(self.window.base_num, 4)
+        self.assertEqual(self.source.released, {seq * MSS for seq in range(4)})
+        self.assertEqual(self.protocol.rtt.samples, 1)
+        self.assertAlmostEqual(self.protocol.rtt.srtt, RTT)
+        # Slow start: la ventana crece con cada paquete confirmado
+        self.assertEqual(self.protocol.cc.cwnd, congestion.INITIAL_CWND + 4)
+
+    def test_selective_ack_leaves_hole(self):
+        list(self.window.fill())
+        self._ack(1, 0b11)  # llegaron 0, 2 y 3
+        self.assertEqual(self.window.base_num, 1)
+        self.assertEqual(sorted(self.window.pkts)[:3], [1, 4, 5])
+
+    def test_stale_sack_keeps_window(self):
+        list(self.window.fill())
+        self._ack(5, window=8)
+        self._ack(3, window=2)
+        self.assertEqual(self.protocol.peer_window, 8)
+
+    def test_timer_retransmits_once(self):
+        list(self.window.fill())
+        self._ack(2)
+        self.clock += self.protocol.rtt.timeout
+        expired = self.window.expired()
+        self.assertEqual(expired, list(range(2, congestion.INITIAL_CWND)))
+        self.assertEqual(self.protocol.rtt.backoff, 2)
+        self.assertEqual(self.protocol.cc.cwnd, 1.0)
+        # Los timers reprogramados no vencen hasta el nuevo RTO
+        self.assertEqual(self.window.expired(), [])
+        self.assertEqual(self.window.timeout_retransmits, len(expired))
+
+    def test_karn_rule(self):
+        list(self.window.fill())
+        self.clock += self.protocol.rtt.timeout
+        self.window.expired()
+        self.clock += RTT
+        self._ack(congestion.INITIAL_CWND)
+        # Todo lo confirmado fue retransmitido: el RTT es ambiguo y no se mide
+        self.assertEqual(self.protocol.rtt.samples, 0)
+        self.assertEqual(self.protocol.rtt.backoff, 2)
+
+    def test_datagram_is_rebuilt_from_source(self):
+        list(self.window.fill())
+        first = b"".join(bytes(part) for part in self.window.datagram(1))
+        # La ventana no guarda copias: la retransmisión se arma de nuevo desde la fuente
+        self.assertEqual(self.window.pkts[1], (self.clock, 0))
+        self.assertEqual(b"".join(bytes(part) for part in self.window.datagram(1)), first)
+        pkt = packet.unpack(first)
+        self.assertEqual((pkt.seq, bytes(pkt.payload)), (1, self.source.data[MSS:2 * MSS]))
+
+    def test_done(self):
+        while not self.window.done:
+            sent = list(self.window.fill())
+            self.assertTrue(sent)
+            self._ack(sent[-1] + 1)
+        self.assertEqual(self.window.base_num, PACKETS)
+        self.assertEqual(self.window.retransmissions, 0)
+
+
+class FastRetransmitTest(SenderTest):
+    """Un NACK o DUP_THRESHOLD SACKs retransmiten el hueco sin esperar el timer,
+    con una sola reducción de la ventana por episodio de pérdida"""
+
+    def _fill(self):
+        """Envía la ventana inicial, un paquete cada RTT / 2 (más que la ventana de
+        reordenamiento); los SACKs llegan un RTT después del envío de seq 2"""
+        for _ in self.window.fill():
+            self.clock += RTT / 2
+        self.clock = RTT + RTT
+
+    def test_nack_retransmits_at_once(self):
+        self._fill()
+        self._ack(1, 0b1, nack=True)  # llegó 2, falta 1
+        self.assertEqual(self.window.expired(), [1])
+        # Slow start con 0 y 2 confirmados, y después la mitad
+        self.assertEqual(self.protocol.cc.cwnd, (congestion.INITIAL_CWND + 2) / 2)
+        self.assertEqual(self.window.fast_retransmits, 1)
+
+    def test_sacks_reach_threshold(self):
+        self._fill()
+        for count in range(1, DUP_THRESHOLD + 1):
+            self._ack(1, (1 << count) - 1)
+            self.assertEqual(self.window.expired(), [] if count < DUP_THRESHOLD else [1])
+
+    def test_one_reduction_per_episode(self):
+        self._fill()
+        self._ack(1, 0b1, nack=True)
+        self._ack(1, 0b101, nack=True)  # también falta 3, enviado antes de detectar la pérdida
+        self.assertEqual(self.window.expired(), [1, 3])
+        self.assertEqual(self.protocol.cc.ssthresh, (congestion.INITIAL_CWND + 2) / 2)
+        self.assertGreater(self.protocol.cc.cwnd, self.protocol.cc.ssthresh)
+
+    def test_reordering_is_not_loss(self):
+        for _ in self.window.fill():
+            pass
+        self.clock += RTT
+        # 1 y 2 salieron juntos: que 2 llegue antes es reordenamiento, no pérdida
+        self._ack(1, 0b1, nack=True)
+        self.assertEqual(self.window.expired(), [])
+        self.assertEqual(self.protocol.cc.cwnd, congestion.INITIAL_CWND + 2)
+
+
+if __name__ == "__main__":
+    unittest.main()
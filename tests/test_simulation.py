@@ -0,0 +1,202 @@
+import errno
+import logging
+import os
+import random
+import shutil
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import packet, simulation  # noqa: E402
+from lib.relay import Impairments  # noqa: E402
+
+'''ESCENARIO'''
+PROTOCOLS = ("stop-and-wait", "selective-repeat", "fec")
+FILE_SIZE = 64 * 1024
+LOSS = 0.05
+DELAY = 0.01
+JITTER = 0.002
+BANDWIDTH = 12.5e6
+SEED = 1
+STREAMS = 3
+
+
+class SimulatedNetworkTest(unittest.TestCase):
+    """Reloj virtual: las llegadas siguen la demora, el bandwidth y la cola del enlace"""
+
+    def _run(self, network, receive, *senders):
+        """Corre receive(extremo) contra los senders(extremo, dirección); devuelve lo que recibió"""
+        server, client = network.open(), network.open()
+        result = []
+        network.start_thread(lambda: result.extend(receive(server)))
+        for send in senders:
+            network.start_thread(send, client, server.getsockname())
+        network.run()
+        return result
+
+    def _arrivals(self, network, count):
+        def receive(server):
+            for _ in range(count):
+                server.recvfrom(packet.MAX_DATAGRAM, None)
+                yield network.time
+
+        return lambda server: list(receive(server))
+
+    def test_delay_and_bandwidth(self):
+        network = simulation.SimulatedNetwork(Impairments(delay=DELAY), bandwidth=1e6)
+
+        def send(client, addr):
+            for _ in range(3):
+                client.sendto(b"\x01" * 1000, addr)
+
+        arrivals = self._run(network, self._arrivals(network, 3), send)
+        for arrival, expected in zip(arrivals, (DELAY + 0.001, DELAY + 0.002, DELAY + 0.003)):
+            self.assertAlmostEqual(arrival, expected)
+
+    def test_queue_drops(self):
+        network = simulation.SimulatedNetwork(bandwidth=1e6, queue=2500)
+
+        def send(client, addr):
+            for _ in range(3):
+                client.sendto(b"\x01" * 1000, addr)
+
+        def receive(server):
+            return list(iter(lambda: server.recvfrom(packet.MAX_DATAGRAM, 1.0), None))
+
+        # El que se está transmitiendo y uno en cola entran; el tercero se descarta
+        self.assertEqual(len(self._run(network, receive, send)), 2)
+        self.assertEqual(network.stats["dropped"], 1)
+
+    def test_timeout_advances_clock(self):
+        network = simulation.SimulatedNetwork()
+        result = self._run(network, lambda server: [server.recvfrom(packet.MAX_DATAGRAM, 0.25), network.time])
+        self.assertEqual(result, [None, 0.25])
+
+    def test_mtu(self):
+        network = simulation.SimulatedNetwork(mtu=1500)
+        errors = []
+
+        def send(client, addr):
+            client.sendto(b"\x01" * 1500, addr)
+            try:
+                client.sendto(b"\x01" * 1501, addr)
+            except OSError as e:
+                errors.append(e.errno)
+
+        self.assertEqual(len(self._run(network, self._arrivals(network, 1), send)), 1)
+        self.assertEqual(errors, [errno.EMSGSIZE])
+
+    def test_stall(self):
+        network = simulation.SimulatedNetwork()
+        errors = []
+
+        def receive(server):
+            try:
+                server.recvfrom(packet.MAX_DATAGRAM, None)
+            except OSError as e:
+                errors.append(e.errno)
+            return []
+
+        # Nadie va a enviar: en vez de colgarse, el que espera recibe un error
+        self._run(network, receive)
+        self.assertEqual(errors, [errno.ETIMEDOUT])
+
+
+class SimulatedTransferTest(unittest.TestCase):
+    """Transferencias enteras en la red simulada con pérdida: llegan intactas y
+    la misma semilla repite exactamente la misma transferencia"""
+
+    @classmethod
+    def setUpClass(cls):
+        logging.disable(logging.CRITICAL)
+        cls.content = random.Random(SEED).randbytes(FILE_SIZE)
+
+    @classmethod
+    def tearDownClass(cls):
+        logging.disable(logging.NOTSET)
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+
+    def _transfer(self, direction, protocol, run, client_options=None):
+        """Corre una transferencia en un directorio propio: (éxito, segundos, stats, contenido recibido)"""
+        storage_dir = os.path.join(self.work, f"{run}-storage")
+        os.makedirs(storage_dir)
+        source = os.path.join(self.work, "source.bin")
+        with open(source, "wb") as file:
+            file.write(self.content)
+        if direction == "upload":
+            local_path, received = source, os.path.join(storage_dir, "file.bin")
+        else:
+            shutil.copy(source, os.path.join(storage_dir, "file.bin"))
+            local_path = received = os.path.join(self.work, f"{run}-download.bin")
+        network = simulation.SimulatedNetwork(Impairments(loss=LOSS, delay=DELAY, jitter=JITTER),
+                                              seed=SEED, bandwidth=BANDWIDTH)
+        ok, elapsed = simulation.run_transfer(network, direction, protocol, local_path, storage_dir, "file.bin",
+                                              client_options)
+        with open(received, "rb") as file:
+            return ok, elapsed, dict(network.stats), file.read()
+
+    def _check(self, direction):
+        for protocol in PROTOCOLS:
+            with self.subTest(protocol=protocol):
+                first = self._transfer(direction, protocol, f"{protocol}-1")
+                self.assertTrue(first[0])
+                self.assertEqual(first[3], self.content)
+                self.assertGreater(first[2].get("dropped", 0), 0)
+                self.assertEqual(self._transfer(direction, protocol, f"{protocol}-2"), first)
+
+    def test_upload(self):
+        self._check("upload")
+
+    def test_download(self):
+        self._check("download")
+
+    def test_dedup(self):
+        storage_dir = os.path.join(self.work, "dedup-storage")
+        os.makedirs(storage_dir)
+        source = os.path.join(self.work, "source.bin")
+        with open(source, "wb") as file:
+            file.write(self.content)
+        forwarded = []
+        for name in ("file.bin", "copy.bin"):
+            network = simulation.SimulatedNetwork(seed=SEED)
+            ok, _ = simulation.run_transfer(network, "upload", "selective-repeat", source, storage_dir, name)
+            self.assertTrue(ok)
+            forwarded.append(network.stats["forwarded"])
+            with open(os.path.join(storage_dir, name), "rb") as file:
+                self.assertEqual(file.read(), self.content)
+        # La segunda subida es sólo el saludo y su respuesta
+        self.assertEqual(forwarded[1], 2)
+        self.assertGreater(forwarded[0], FILE_SIZE // 1024)
+
+    def test_compress(self):
+        storage_dir = os.path.join(self.work, "compress-storage")
+        os.makedirs(storage_dir)
+        source = os.path.join(self.work, "text.bin")
+        # Mitad compresible y mitad aleatoria: viajan bloques comprimidos y crudos
+        content = b"lorem ipsum dolor sit amet " * (FILE_SIZE // 54) + self.content[:FILE_SIZE // 2]
+        with open(source, "wb") as file:
+            file.write(content)
+        network = simulation.SimulatedNetwork(Impairments(loss=LOSS, delay=DELAY, jitter=JITTER), seed=SEED,
+                                              bandwidth=BANDWIDTH)
+        ok, _ = simulation.run_transfer(network, "upload", "selective-repeat", source, storage_dir, "text.bin",
+                                        {"compress": True})
+        self.assertTrue(ok)
+        with open(os.path.join(storage_dir, "text.bin"), "rb") as file:
+            self.assertEqual(file.read(), content)
+
+    def test_streams(self):
+        for direction in ("upload", "download"):
+            with self.subTest(direction=direction):
+                ok, _, _, received = self._transfer(direction, "selective-repeat", f"streams-{direction}",
+                                                    {"streams": STREAMS})
+                self.assertTrue(ok)
+                self.assertEqual(received, self.content)
+
+
+if __name__ == "__main__":
+    unittest.main()
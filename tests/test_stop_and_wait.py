@@ -0,0 +1,112 @@
+import argparse
+import os
+import sys
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import handshake, packet  # noqa: E402
+from lib.stop_and_wait_protocol import MAX_RETRIES, StopAndWaitProtocol  # noqa: E402
+
+'''SESION'''
+MSS = 512
+SIZE = 3 * MSS - 100
+RTT = 0.01
+
+
+class MemorySource:
+    """Fuente en memoria con la interfaz de storage.Source"""
+
+    def __init__(self, size):
+        self.data = bytes(i % 256 for i in range(size))
+        self.released = []
+
+    def block(self, offset, length):
+        return 0, self.data[offset:offset + length]
+
+    def release(self, offset):
+        self.released.append(offset)
+
+
+class MemoryFile:
+    """Destino en memoria para escrituras en orden"""
+
+    def __init__(self):
+        self.data = bytearray()
+
+    def write(self, data):
+        self.data += data
+        return len(data)
+
+
+class StopAndWaitTest(unittest.TestCase):
+    """Emisor y receptor Stop-and-Wait sin E/S: los comparten el loop
+    bloqueante y el servidor asíncrono"""
+
+    def setUp(self):
+        self.clock = 0.0
+        self.protocol = StopAndWaitProtocol(argparse.Namespace(), None, {handshake.OPT_MSS: MSS})
+        self.protocol.now = lambda: self.clock
+        self.source = MemorySource(SIZE)
+        self.sender = self.protocol.send_window(self.source, SIZE)
+        self.file = MemoryFile()
+        self.receiver = self.protocol.receive_window(self.file)
+
+    def _send(self):
+        return packet.unpack(b"".join(bytes(part) for part in self.sender.datagram()))
+
+    def _ack(self, seq):
+        return packet.unpack(packet.pack(packet.ACK, seq))
+
+    def test_transfer(self):
+        while not self.sender.done:
+            acks, fin = self.receiver.receive([self._send()])
+            self.assertIsNone(fin)
+            self.clock += RTT
+            self.assertTrue(self.sender.on_ack(packet.unpack(acks[0])))
+        self.assertEqual(bytes(self.file.data), self.source.data)
+        self.assertEqual((self.sender.packets_sent, self.sender.retransmissions), (3, 0))
+        self.assertEqual(self.source.released, [0, MSS, 2 * MSS])
+        self.assertEqual(self.protocol.rtt.samples, 3)
+
+    def test_stale_ack(self):
+        self._send()
+        self.assertFalse(self.sender.on_ack(self._ack(1)))
+        self.assertTrue(self.sender.on_ack(self._ack(0)))
+        self.assertFalse(self.sender.on_ack(self._ack(0)))
+        self.assertEqual(self.sender.seq_num, 1)
+
+    def test_retransmission(self):
+        self._send()
+        self.clock += self.sender.next_timeout()
+        self.assertTrue(self.sender.expired())
+        self.assertEqual(self.protocol.rtt.backoff, 2)
+        self._send()
+        self.assertTrue(self.sender.on_ack(self._ack(0)))
+        # Regla de Karn: el ACK de un paquete reenviado no da muestra de RTT
+        self.assertEqual(self.protocol.rtt.samples, 0)
+        self.assertEqual(self.sender.retransmissions, 1)
+
+    def test_gives_up(self):
+        self._send()
+        for _ in range(MAX_RETRIES - 1):
+            self.assertTrue(self.sender.expired())
+        self.assertFalse(self.sender.expired())
+
+    def test_duplicate_is_acked_again(self):
+        data = self._send()
+        first, _ = self.receiver.receive([data])
+        again, _ = self.receiver.receive([data])
+        self.assertEqual(again, first)
+        self.assertEqual((self.receiver.duplicates, self.receiver.bytes_received), (1, MSS))
+
+    def test_burst_stops_at_fin(self):
+        data = self._send()
+        fin = packet.unpack(packet.pack(packet.FIN, 0))
+        acks, received_fin = self.receiver.receive([data, fin])
+        self.assertEqual(len(acks), 1)
+        self.assertEqual(received_fin.type, packet.FIN)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,235 @@
+import argparse
+import hashlib
+import os
+import shutil
+import stat
+import sys
+import tempfile
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import storage  # noqa: E402
+from lib.upload_protocol import UploadProtocol  # noqa: E402
+
+'''CONTENIDO'''
+CONTENT = bytes(range(256)) * 64
+DIGEST = hashlib.sha256(CONTENT).hexdigest()
+HALF = len(CONTENT) // 2
+TRANSFER_ID = "abc123"
+# Umask distinta de la habitual, para que los permisos fijos (0o644) se noten
+UMASK = 0o002
+
+
+class StorageTest(unittest.TestCase):
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+        self.path = os.path.join(self.work, "file.bin")
+
+    def _mode(self, path):
+        return stat.S_IMODE(os.stat(path).st_mode)
+
+    def _write(self, target, start=0, end=len(CONTENT)):
+        target.file.write(CONTENT[start:end])
+        return target.commit()
+
+    def _read(self, path):
+        with open(path, "rb") as file:
+            return file.read()
+
+
+class FileModeTest(StorageTest):
+    """Los archivos publicados tienen los permisos de open() según la umask"""
+
+    def setUp(self):
+        super().setUp()
+        previous = os.umask(UMASK)
+        self.addCleanup(os.umask, previous)
+        patcher = mock.patch.object(storage, "FILE_MODE", 0o666 & ~UMASK)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_upload(self):
+        with storage.Upload(self.path, len(CONTENT)) as upload:
+            self.assertTrue(self._write(upload))
+        self.assertEqual(self._mode(self.path), storage.FILE_MODE)
+
+    def test_range_upload(self):
+        with storage.RangeUpload(self.path, TRANSFER_ID, len(CONTENT), 0, len(CONTENT)) as upload:
+            self.assertTrue(self._write(upload))
+        self.assertEqual(self._mode(self.path), storage.FILE_MODE)
+
+    def test_download(self):
+        with storage.Download(self.path, len(CONTENT)) as download:
+            self.assertTrue(self._write(download))
+        self.assertEqual(self._mode(self.path), storage.FILE_MODE)
+        with storage.Download(self.path, len(CONTENT), range=(0, len(CONTENT))) as download:
+            self.assertTrue(self._write(download))
+        self.assertEqual(self._mode(self.path), storage.FILE_MODE)
+
+
+class ResumeTest(StorageTest):
+    """Un corte deja el journal y el archivo parcial; el intento siguiente
+    sigue desde el primer byte que falta"""
+
+    def test_range_upload_resumes(self):
+        with storage.RangeUpload(self.path, TRANSFER_ID, len(CONTENT), 0, len(CONTENT), DIGEST) as upload:
+            upload.file.write(CONTENT[:HALF])
+        self.assertFalse(os.path.exists(self.path))
+        confirmed = storage.upload_ranges(self.path, TRANSFER_ID)
+        self.assertEqual([tuple(r) for r in confirmed], [(0, HALF)])
+        start = storage.first_missing(confirmed, 0, len(CONTENT))
+        with storage.RangeUpload(self.path, TRANSFER_ID, len(CONTENT), start, len(CONTENT), DIGEST) as upload:
+            self.assertTrue(self._write(upload, start))
+        self.assertEqual(self._read(self.path), CONTENT)
+        leftovers = [name for name in os.listdir(self.work)
+                     if name.endswith((storage.PART_SUFFIX, storage.RANGES_SUFFIX))]
+        self.assertEqual(leftovers, [])
+
+    def test_range_upload_rejects_digest(self):
+        with storage.RangeUpload(self.path, TRANSFER_ID, len(CONTENT), 0, len(CONTENT), "0" * 64) as upload:
+            self.assertFalse(self._write(upload))
+        self.assertFalse(os.path.exists(self.path))
+        self.assertEqual(storage.upload_ranges(self.path, TRANSFER_ID), [])
+
+    def test_download_resumes(self):
+        with storage.Download(self.path, len(CONTENT), journal=True) as download:
+            download.file.write(CONTENT[:HALF])
+        confirmed = storage.Journal.for_file(self.path).ranges()
+        self.assertEqual([tuple(r) for r in confirmed], [(0, HALF)])
+        with storage.Download(self.path, len(CONTENT), (HALF, len(CONTENT)), journal=True) as download:
+            self.assertTrue(self._write(download, HALF))
+        self.assertEqual(self._read(self.path), CONTENT)
+        self.assertEqual(storage.Journal.for_file(self.path).ranges(), [])
+
+    def test_download_from_scratch_resets_journal(self):
+        storage.Journal.for_file(self.path).create()
+        storage.Journal.for_file(self.path).record(0, len(CONTENT))
+        with storage.Download(self.path, len(CONTENT), journal=True) as download:
+            download.file.write(CONTENT[:HALF])
+        confirmed = storage.Journal.for_file(self.path).ranges()
+        self.assertEqual([tuple(r) for r in confirmed], [(0, HALF)])
+
+    def test_transfer_id_is_deterministic(self):
+        with open(self.path, "wb") as file:
+            file.write(CONTENT)
+        args = argparse.Namespace(src=self.path, name="file.bin", resume=False)
+        first = UploadProtocol(args)._transfer_id()
+        self.assertEqual(UploadProtocol(argparse.Namespace(src=self.path, name="file.bin", resume=True))._transfer_id(),
+                         first)
+        self.assertNotEqual(UploadProtocol(argparse.Namespace(src=self.path, name="other.bin"))._transfer_id(),
+                            first)
+        self.assertTrue(first.isalnum())
+
+
+class OffsetFileTest(StorageTest):
+    """Los chunks se escriben por offset al llegar; el hash y el journal siguen el prefijo sin huecos"""
+
+    def setUp(self):
+        super().setUp()
+        self.journal = storage.Journal.for_file(self.path)
+        self.journal.create()
+        fd = os.open(self.path, os.O_RDWR | os.O_CREAT, storage.FILE_MODE)
+        self.file = storage.OffsetFile(fd, HALF, HALF, self.journal, hashing=True)
+        self.addCleanup(self.file.close)
+
+    def test_out_of_order(self):
+        second = CONTENT[HALF + 100:]
+        self.file.write_at(100, second)
+        # Hay un hueco: no se hashea ni se anota nada
+        self.assertEqual((self.file.position, self.file.hashed), (0, 0))
+        self.file.write_at(0, CONTENT[HALF:HALF + 100])
+        self.file.advance(HALF)
+        self.assertEqual(self.file.hexdigest(), hashlib.sha256(CONTENT[HALF:]).hexdigest())
+        self.assertEqual(self.file.read_at(0, 10), CONTENT[HALF:HALF + 10])
+        self.file.close()
+        self.assertEqual(self._read(self.path)[HALF:], CONTENT[HALF:])
+        self.assertEqual(self.journal.ranges(), [(HALF, len(CONTENT))])
+
+    def test_advance_is_clamped(self):
+        self.file.write(CONTENT[HALF:])
+        self.file.advance(10)
+        self.file.advance(len(CONTENT))
+        self.assertEqual(self.file.position, HALF)
+
+    def test_checkpoint_every(self):
+        with mock.patch.object(storage, "JOURNAL_EVERY", 1000):
+            self.file.write(CONTENT[HALF:HALF + 999])
+            self.assertEqual(self.journal.ranges(), [])
+            self.file.write(CONTENT[HALF + 999:HALF + 1000])
+        self.assertEqual(self.journal.ranges(), [(HALF, HALF + 1000)])
+
+
+class SourceTest(StorageTest):
+    """La fuente entrega vistas sobre el archivo mapeado, sin copiarlo"""
+
+    def setUp(self):
+        super().setUp()
+        with open(self.path, "wb") as file:
+            file.write(CONTENT)
+
+    def test_chunk_is_a_view(self):
+        with storage.Source(self.path, start=HALF) as source:
+            chunk = source.chunk(10, 100)
+            self.assertIsInstance(chunk, memoryview)
+            self.assertEqual(bytes(chunk), CONTENT[HALF + 10:HALF + 110])
+            self.assertEqual(source.block(0, 4), (0, source.chunk(0, 4)))
+            chunk.release()
+
+    def test_empty_file(self):
+        empty = os.path.join(self.work, "empty.bin")
+        open(empty, "wb").close()
+        with storage.Source(empty) as source:
+            self.assertEqual(bytes(source.chunk(0, 10)), b"")
+
+    def test_close_with_live_view(self):
+        source = storage.Source(self.path)
+        chunk = source.chunk(0, 10)
+        # Un paquete todavía en un buffer no impide cerrar la fuente
+        source.close()
+        self.assertEqual(bytes(chunk), CONTENT[:10])
+
+    def test_shared_mapping_stays_open(self):
+        mapping, _ = storage.map_file(self.path)
+        self.addCleanup(mapping.close)
+        storage.Source(self.path, mapping=mapping).close()
+        self.assertFalse(mapping.closed)
+
+
+class DigestTest(StorageTest):
+    """Sólo se publica lo que coincide con su digest, y el índice permite deduplicar"""
+
+    def test_upload_verifies_digest(self):
+        with storage.Upload(self.path, len(CONTENT), DIGEST) as upload:
+            self.assertTrue(self._write(upload))
+        self.assertEqual(storage.DigestIndex(self.work).find(DIGEST), "file.bin")
+
+    def test_upload_rejects_digest(self):
+        with storage.Upload(self.path, len(CONTENT), "0" * 64) as upload:
+            self.assertFalse(self._write(upload))
+        self.assertEqual(os.listdir(self.work), [])
+
+    def test_link(self):
+        with storage.Upload(self.path, len(CONTENT), DIGEST) as upload:
+            self._write(upload)
+        index = storage.DigestIndex(self.work)
+        self.assertTrue(index.link(DIGEST, "copy.bin"))
+        self.assertEqual(self._read(os.path.join(self.work, "copy.bin")), CONTENT)
+        self.assertEqual(index.digest_of("copy.bin"), DIGEST)
+        self.assertFalse(index.link("1" * 64, "other.bin"))
+
+    def test_changed_file_is_not_linked(self):
+        with storage.Upload(self.path, len(CONTENT), DIGEST) as upload:
+            self._write(upload)
+        with open(self.path, "ab") as file:
+            file.write(b"x")
+        index = storage.DigestIndex(self.work)
+        self.assertIsNone(index.find(DIGEST))
+        # digest_of rehashea lo que cambió
+        self.assertEqual(index.digest_of("file.bin"), hashlib.sha256(CONTENT + b"x").hexdigest())
+
+
+if __name__ == "__main__":
+    unittest.main()
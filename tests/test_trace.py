@@ -0,0 +1,108 @@
+import csv
+import logging
+import os
+import shutil
+import socket
+import struct
+import sys
+import tempfile
+import unittest
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from lib import packet, simulation, trace  # noqa: E402
+
+'''EXTREMOS'''
+LOCAL = (socket.inet_aton("127.0.0.1"), 5000)
+PEER = ("127.0.0.1", 6000)
+FILE_SIZE = 16 * 1024
+
+
+class RecorderTest(unittest.TestCase):
+    """Buffer circular de eventos y su volcado como pcap y CSV"""
+
+    def setUp(self):
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+        self.recorder = trace.Recorder(4)
+
+    def _record(self, direction, data, timestamp=1.0):
+        self.recorder.record(timestamp, direction, LOCAL, PEER, data, len(data))
+
+    def test_ring(self):
+        for seq in range(6):
+            self._record(trace.OUT, packet.pack(packet.DATA, seq, b"x" * 10), seq)
+        events = list(self.recorder.events())
+        self.assertEqual([event[0] for event in events], [2, 3, 4, 5])
+        self.assertEqual(self.recorder.dropped, 2)
+        # Sólo se guarda el header: el tamaño es el del datagrama entero
+        self.assertEqual((events[0][6], len(events[0][7])), (packet.HEADER_SIZE + 10, packet.HEADER_SIZE))
+
+    def test_pcap(self):
+        data = packet.pack(packet.DATA, 7, b"x" * 100)
+        self._record(trace.OUT, data)
+        self._record(trace.IN, packet.pack_sack(8, 0, 64))
+        path = os.path.join(self.work, "trace.pcap")
+        self.assertEqual(self.recorder.write_pcap(path), 2)
+        with open(path, "rb") as file:
+            content = file.read()
+        magic, _, _, _, _, _, linktype = trace.PCAP_HEADER.unpack_from(content)
+        self.assertEqual((magic, linktype), (trace.PCAP_MAGIC, trace.LINKTYPE_RAW))
+        offset = trace.PCAP_HEADER.size
+        ports = []
+        for _ in range(2):
+            _, _, captured, length = trace.PCAP_RECORD.unpack_from(content, offset)
+            offset += trace.PCAP_RECORD.size
+            ip = content[offset:offset + trace.IPV4.size]
+            self.assertEqual(trace._checksum(ip), 0)
+            self.assertEqual(struct.unpack_from("!H", ip, 2)[0], length)
+            ports.append(trace.UDP.unpack_from(content, offset + trace.IPV4.size)[:2])
+            offset += captured
+        self.assertEqual(len(content), offset)
+        # Un evento entrante va del extremo remoto al local
+        self.assertEqual(ports, [(LOCAL[1], PEER[1]), (PEER[1], LOCAL[1])])
+
+    def test_csv(self):
+        self._record(trace.OUT, b"UPLOAD_CLIENT:fec:a.bin:10", 1.0)
+        for seq, timestamp in ((0, 1.5), (1, 1.6), (0, 2.0)):
+            self._record(trace.OUT, packet.pack(packet.DATA, seq, b"x"), timestamp)
+        path = os.path.join(self.work, "trace.csv")
+        trace.dump(self.recorder, path)
+        with open(path, newline="") as file:
+            rows = list(csv.DictReader(file))
+        self.assertEqual([row["type"] for row in rows], ["HANDSHAKE", "DATA", "DATA", "DATA"])
+        self.assertEqual([row["retransmit"] for row in rows], ["", "0", "0", "1"])
+        self.assertEqual((rows[3]["time_s"], rows[3]["peer"]), ("1.000000", "127.0.0.1:6000"))
+
+
+class TracedTransferTest(unittest.TestCase):
+    """Una transferencia por una red registrada deja todos sus paquetes en el trace"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+
+    def test_transfer(self):
+        source = os.path.join(self.work, "source.bin")
+        with open(source, "wb") as file:
+            file.write(os.urandom(FILE_SIZE))
+        recorder = trace.Recorder()
+        network = simulation.SimulatedNetwork()
+        ok, _ = simulation.run_transfer(trace.network(recorder, network), "upload", "selective-repeat", source,
+                                        self.work, "copy.bin", {"mss": 1024})
+        self.assertTrue(ok)
+        path = os.path.join(self.work, "trace.csv")
+        recorder.write_csv(path)
+        with open(path, newline="") as file:
+            rows = list(csv.DictReader(file))
+        # Cada datagrama queda dos veces: al salir de un extremo y al entrar al otro
+        self.assertEqual(len(rows), 2 * network.stats["forwarded"])
+        data = [row for row in rows if row["type"] == "DATA" and row["direction"] == "out"]
+        self.assertEqual(len(data), FILE_SIZE // 1024)
+        self.assertLessEqual({"HANDSHAKE", "SACK", "FIN", "FIN_ACK"}, {row["type"] for row in rows})
+
+
+if __name__ == "__main__":
+    unittest.main()
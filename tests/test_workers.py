@@ -0,0 +1,85 @@
+import logging
+import os
+import random
+import shutil
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+sys.path.insert(0, SRC)
+
+from lib.parser import get_parser  # noqa: E402
+from lib.upload_protocol import UploadProtocol  # noqa: E402
+
+'''ESCENARIO'''
+WORKERS = 2
+UPLOADS = 4
+FILE_SIZE = 64 * 1024
+HOST = "127.0.0.1"
+STARTUP_TIMEOUT = 5.0
+
+
+@unittest.skipUnless(hasattr(socket, "SO_REUSEPORT") and hasattr(os, "fork"), "requiere SO_REUSEPORT y fork")
+class WorkersTest(unittest.TestCase):
+    """start-server --workers: varios procesos comparten el puerto y cada
+    transferencia se completa en el proceso que recibió su saludo"""
+
+    def setUp(self):
+        logging.disable(logging.CRITICAL)
+        self.addCleanup(logging.disable, logging.NOTSET)
+        self.work = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.work)
+        self.storage = os.path.join(self.work, "storage")
+        with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+            sock.bind((HOST, 0))
+            self.port = sock.getsockname()[1]
+        self.server = subprocess.Popen(
+            [sys.executable, "start-server", "-q", "-H", HOST, "-p", str(self.port), "-s", self.storage,
+             "--workers", str(WORKERS)],
+            cwd=SRC, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL,
+        )
+        self.addCleanup(self._stop)
+        self._wait_listening()
+
+    def _wait_listening(self):
+        deadline = time.monotonic() + STARTUP_TIMEOUT
+        while time.monotonic() < deadline:
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as sock:
+                try:
+                    sock.bind((HOST, self.port))
+                except OSError:
+                    return
+            time.sleep(0.05)
+        self.fail("El servidor no arrancó")
+
+    def _stop(self):
+        self.server.communicate(b"q\n", timeout=30)
+
+    def test_uploads(self):
+        contents = []
+        for index in range(UPLOADS):
+            content = random.Random(index).randbytes(FILE_SIZE)
+            source = os.path.join(self.work, f"{index}.bin")
+            with open(source, "wb") as file:
+                file.write(content)
+            contents.append(content)
+            argv = ["upload", "-q", "-H", HOST, "-p", str(self.port), "-s", source, "-n", f"{index}.bin",
+                    "-r", "selective-repeat"]
+            with mock.patch.object(sys, "argv", argv):
+                client = UploadProtocol(get_parser("upload"))
+            try:
+                self.assertTrue(client.upload_file())
+            finally:
+                client.close()
+        for index, content in enumerate(contents):
+            with open(os.path.join(self.storage, f"{index}.bin"), "rb") as file:
+                self.assertEqual(file.read(), content)
+
+
+if __name__ == "__main__":
+    unittest.main()